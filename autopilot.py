@@ -0,0 +1,243 @@
+"""Pacman autopilot: steers a player with a lookahead search that never overruns its time budget.
+
+The search runs on maze cells rather than game ticks. Pacman covers a
+cell every 1 / PACMAN_SPEED ticks and a ghost every 1 / GHOST_SPEED, so
+each ghost's distance field tells when it could reach any cell. A cell is
+deadly if a dangerous ghost could be there by the time Pacman is, and a
+scared ghost is worth chasing if it will still be scared when Pacman gets
+there. Ghosts are assumed to take the shortest path to any cell without
+turning back, which makes the autopilot a little more careful than it
+needs to be; only ghosts within THREAT_RADIUS cells are tracked, so the
+cost of a decision does not grow with the maze.
+
+Paths are scored by the dots, power pellets and scared ghosts along them,
+discounted by distance. The search deepens one cell at a time and stops
+when its budget runs out, keeping the best move from the deepest finished
+pass, so the first pass always completes and later ones are a bonus.
+"""
+import time
+from typing import Optional, Tuple
+
+from pacman import (DIRECTIONS, EXIT_BITS, GHOST_POINTS, GHOST_SPEED, OPPOSITE_CODES, PACMAN_SPEED,
+                    VULNERABLE_DURATION, GameState)
+
+AUTOPILOT_BUDGET = 0.003  # Seconds of search per decision; a frame is 1 / FPS = 22 ms
+MAX_DEPTH = 40  # Cells of lookahead
+DISCOUNT = 0.95  # Value of a reward one cell further away
+DEATH_PENALTY = 10000
+DANGER_DEPTH = 10  # Cells ahead in which ghosts count; given long enough they could corner Pacman anywhere
+PELLET_VALUES = {2: 10, 3: 50}
+POWER_PELLET_BAIT = 100  # Extra value of a power pellet while a ghost is in range to be eaten after
+BAIT_RANGE = 8
+THREAT_RADIUS = 12  # Cells around each ghost it is tracked in; further ones are too far to matter
+FIELD_CACHE_SIZE = 1024  # Ghost distance fields kept between decisions
+NEAREST_PELLET_BONUS = 1.0  # Tie-breaks towards the closest pellet when none are in sight
+KEEP_DIRECTION_BONUS = 0.5  # Tie-breaks towards carrying on, so Pacman does not dither
+TIME_CHECK_NODES = 16
+PACMAN_TICKS = 1 / PACMAN_SPEED
+GHOST_TICKS = 1 / GHOST_SPEED
+# Pacman and a ghost meet when each is within half a cell of a cell's center,
+# so a ghost is a danger until it is that much later there than Pacman
+SAFETY_TICKS = (PACMAN_TICKS + GHOST_TICKS) / 2 + 1
+
+class _OutOfTime(Exception):
+    pass
+
+class Autopilot:
+    """Chooses the next direction for one player; use it in place of the keyboard.
+
+    `choose(state)` returns a direction for the `player`-th entry of the
+    inputs passed to GameState.step (0 for Pacman, 1 for Ms. Pacman).
+    Decisions are reused until Pacman, a ghost or the pellets move on to
+    other cells, so most ticks cost a dictionary lookup. `deadline`, a
+    reading of `timer` (time.perf_counter unless given), cuts a search
+    shorter than `budget` when several autopilots share one frame.
+    """
+
+    def __init__(self, player=0, budget=AUTOPILOT_BUDGET, max_depth=MAX_DEPTH, timer=time.perf_counter):
+        self.player = player
+        self.budget = budget
+        self.max_depth = max_depth
+        self.timer = timer
+        self.key = None
+        self.direction = None
+        self.depth = 0  # Depth of the last finished search pass
+        self.nodes = 0
+        self.fields = {}  # Ghost distance fields by (cell, cell behind it)
+
+    def choose(self, state: GameState, deadline: Optional[float] = None) -> Optional[Tuple[int, int]]:
+        """The direction to queue this tick, or None to leave the queued one alone."""
+        if self.player >= len(state.players):
+            return None
+        pacman = state.players[self.player]
+        if not pacman.alive or state.game_over:
+            return None
+        index = state.index
+        root, arrival = self._root(state, pacman)
+        if root < 0:
+            return None
+
+        key = (root, state.pellets_left,
+               tuple((round(ghost.x), round(ghost.y), ghost.vulnerable, ghost.eaten) for ghost in state.ghosts))
+        if key == self.key:
+            return self.direction
+
+        start = self.timer()
+        self.deadline = start + self.budget if deadline is None else min(start + self.budget, deadline)
+        self.state, self.maze, self.index = state, state.maze, index
+        self.ghosts = self._ghost_threats(state, root)
+        self.on_path = bytearray(index.size)
+        self.on_path[root] = 1
+        self.nodes = 0
+
+        moves = []
+        for code in range(1, 5):
+            next_cell = index.exit_cells[root * 5 + code]
+            if index.pacman_exits[root] & EXIT_BITS[code] and next_cell >= 0:
+                moves.append((code, next_cell))
+        if not moves:
+            self.key, self.direction = key, None
+            return None
+
+        # Tie-breakers so Pacman keeps moving when nothing is in sight
+        bonus = {code: 0.0 for code, _ in moves}
+        toward = self._toward_nearest_pellet(root)
+        for code, next_cell in moves:
+            if next_cell == toward:
+                bonus[code] += NEAREST_PELLET_BONUS
+            if code == pacman.direction_code:
+                bonus[code] += KEEP_DIRECTION_BONUS
+
+        best_code = max(moves, key=lambda move: bonus[move[0]])[0]
+        self.depth = 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                values = {code: self._step(next_cell, root, arrival + PACMAN_TICKS, depth - 1, 0, 0, 0) + bonus[code]
+                          for code, next_cell in moves}
+                best_code = max(values, key=values.get)
+                self.depth = depth
+        except _OutOfTime:
+            pass
+        self.key, self.direction = key, DIRECTIONS[best_code]
+        return self.direction
+
+    def _root(self, state, pacman):
+        """The cell whose center Pacman reaches next, where a new direction can take effect, and when."""
+        index = state.index
+        x, y = round(pacman.x), round(pacman.y)
+        dx, dy = pacman.direction
+        ahead = (pacman.x - x) * dx + (pacman.y - y) * dy
+        if ahead > 0.1:
+            # Already past this cell's center; the next chance to turn is the next cell
+            x, y, ahead = x + dx, y + dy, ahead - 1
+        return index.cell(x % index.cols, y), max(0.0, -ahead) * PACMAN_TICKS
+
+    def _ghost_threats(self, state, root):
+        """(distance field, distance to the root, ticks until it moves, scared until, can be scared) per ghost."""
+        index = self.index
+        threats = []
+        for ghost in state.ghosts:
+            if ghost.eaten:
+                cell, behind = index.cell(*ghost.home), -1
+                delay, scared = max(ghost.respawn_timer, 0) + 1, 0
+            else:
+                cell = index.cell(round(ghost.x) % index.cols, round(ghost.y))
+                behind = index.exit_cells[cell * 5 + OPPOSITE_CODES[ghost.direction_code]] if cell >= 0 else -1
+                delay, scared = 0, ghost.vulnerable_timer if ghost.vulnerable else 0
+            if cell < 0:
+                continue
+            field = self._ghost_field(cell, behind)
+            threats.append((field, field.get(root, THREAT_RADIUS + 1), delay, scared, not ghost.eaten))
+        return threats
+
+    def _ghost_field(self, start, behind):
+        """Steps from `start` to the cells within THREAT_RADIUS, for a ghost that cannot turn back to `behind`."""
+        key = (start, behind)
+        field = self.fields.get(key)
+        if field is not None:
+            return field
+        neighbors = self.index.neighbors
+        field = {start: 0}
+        first = [cell for cell in neighbors[start] if cell != behind] or list(neighbors[start])
+        for cell in first:
+            field[cell] = 1
+        frontier = first
+        for distance in range(2, THREAT_RADIUS + 1):
+            next_frontier = []
+            for cell in frontier:
+                for next_cell in neighbors[cell]:
+                    if next_cell not in field:
+                        field[next_cell] = distance
+                        next_frontier.append(next_cell)
+            frontier = next_frontier
+        if len(self.fields) >= FIELD_CACHE_SIZE:
+            self.fields.clear()
+        self.fields[key] = field
+        return field
+
+    def _step(self, cell, prev, arrival, depth, steps, power_until, eaten_mask):
+        """Discounted value of moving into `cell`, `steps` cells from the root, and the best path beyond it."""
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_NODES == 0 and self.depth and self.timer() > self.deadline:
+            raise _OutOfTime
+
+        # Ghosts that could be here by the time Pacman is
+        reward = 0.0
+        for number, (field, _, delay, scared, can_scare) in enumerate(self.ghosts if steps < DANGER_DEPTH else ()):
+            if can_scare and power_until > scared:
+                scared = power_until
+            distance = field.get(cell, THREAT_RADIUS + 1)
+            if scared > arrival + PACMAN_TICKS:
+                if distance <= 1 and not eaten_mask & (1 << number):
+                    reward += GHOST_POINTS
+                    eaten_mask |= 1 << number
+            else:
+                margin = delay + distance * GHOST_TICKS - arrival
+                if margin <= SAFETY_TICKS:
+                    return -DEATH_PENALTY
+
+        on_path = self.on_path
+        if not on_path[cell]:
+            x, y = self.index.coords[cell]
+            content = self.maze[y][x]
+            if content in PELLET_VALUES:
+                reward += PELLET_VALUES[content]
+                if content == 3:
+                    power_until = arrival + VULNERABLE_DURATION
+                    if any(distance <= BAIT_RANGE for _, distance, _, _, _ in self.ghosts):
+                        reward += POWER_PELLET_BAIT
+        if depth == 0:
+            return reward
+
+        on_path[cell] += 1
+        best = None
+        neighbors = self.index.neighbors[cell]
+        for next_cell in neighbors:
+            if next_cell == prev and len(neighbors) > 1:
+                continue  # Pacman can only turn back at a dead end
+            value = self._step(next_cell, cell, arrival + PACMAN_TICKS, depth - 1, steps + 1, power_until, eaten_mask)
+            if best is None or value > best:
+                best = value
+        on_path[cell] -= 1
+        return reward + DISCOUNT * (best or 0.0)
+
+    def _toward_nearest_pellet(self, root):
+        """The neighbor of `root` that starts a shortest path to the nearest pellet, or -1."""
+        index, maze = self.index, self.maze
+        first = {root: -1}
+        frontier = [root]
+        while frontier:
+            next_frontier = []
+            for cell in frontier:
+                for next_cell in index.neighbors[cell]:
+                    if next_cell in first:
+                        continue
+                    first[next_cell] = next_cell if cell == root else first[cell]
+                    x, y = index.coords[next_cell]
+                    if maze[y][x] in PELLET_VALUES:
+                        return first[next_cell]
+                    next_frontier.append(next_cell)
+            if self.timer() > self.deadline:
+                break
+            frontier = next_frontier
+        return -1
@@ -0,0 +1,361 @@
+import random
+
+import numpy as np
+
+from pacman import (MAZE, COLS, ROWS, PACMAN_SPEED, GHOST_SPEED, POWER_PELLET_DURATION, VULNERABLE_DURATION,
+                    GHOST_POINTS, SINGLE_PLAYER, MULTI_PLAYER, DIRECTIONS, DIRECTION_CODES, OPPOSITE_CODES,
+                    EXIT_BITS, EXIT_MOVES, GHOST_NAMES, GHOST_POSITIONS, GHOST_HOUSE, PACMAN_SPAWN, COLLISION_RADIUS,
+                    count_pellets, ghost_moves, get_maze_index)
+
+# Direction code lookups; codes 1-4 map to bits 0-3 of an exit mask
+DX = np.array([dx for dx, dy in DIRECTIONS], dtype=np.float64)
+DY = np.array([dy for dx, dy in DIRECTIONS], dtype=np.float64)
+MOVE_BITS = np.array(EXIT_BITS, dtype=np.uint8)
+REVERSE_BITS = MOVE_BITS[OPPOSITE_CODES]
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(16)], dtype=np.uint8)
+FIRST_MOVE = np.array([moves[0] if moves else 0 for moves in EXIT_MOVES], dtype=np.int8)
+KEEP_DIRECTION = -1
+
+class BatchGame:
+    """N independent games advanced in lockstep with NumPy.
+
+    State is struct-of-arrays: one array per attribute with a row per game
+    and a column per player or ghost, plus a uint8[N, ROWS, COLS] maze.
+    `step` applies the rules of Pacman.move, Ghost.move and GameState.step
+    to every running game at once, in the same order and with the same
+    floating point operations, so each game matches a scalar GameState tick
+    for tick. Ghosts still move one after another because collisions are
+    checked between ghost moves and Inky aims off Blinky's new position.
+
+    Directions are codes into DIRECTIONS. Vulnerable ghosts pick their
+    random turns with a random.Random per game, seeded from `seeds`, so
+    game i makes the same choices as `GameState(mode, seed=seeds[i])`.
+    """
+
+    def __init__(self, count, mode=SINGLE_PLAYER, seeds=None):
+        self.count = count
+        self.mode = mode
+        self.num_players = 2 if mode == MULTI_PLAYER else 1
+        self.games = np.arange(count)
+        if seeds is None:
+            seeds = range(count)
+        self.rngs = [random.Random(seed) for seed in seeds]
+
+        index = get_maze_index(MAZE)
+        self.base_maze = np.array(MAZE, dtype=np.uint8)
+        self.cols, self.rows = COLS, ROWS
+        # Rows that wrap around, as is_tunnel_row tells them apart
+        self.tunnel_rows = self.base_maze[:, 0] == 4
+        # Row t holds the flow field towards target cell t; unreachable is worse than any path
+        distances = np.frombuffer(index.distances, dtype=np.int16).reshape(index.size, index.size)
+        self.distances = np.where(distances < 0, index.size, distances).astype(np.int32)
+        self.nearest_open = np.frombuffer(index.nearest_open, dtype=np.int16).astype(np.int64)
+        # The scalar game's decision table, so chasing ghosts turn with one lookup per game
+        self.decisions = np.frombuffer(index.decisions, dtype=np.uint8)
+        self.decision_offsets = np.asarray(index.decision_offsets).astype(np.int64)
+        self.target_slots = np.asarray(index.target_slots).astype(np.int64)
+
+        # Ghost exit masks for every cell, plus the column just past the tunnel exit
+        self.valid_moves = np.zeros((ROWS, COLS + 1), dtype=np.uint8)
+        self.valid_moves[:, :COLS] = np.frombuffer(index.exits, dtype=np.uint8).reshape(ROWS, COLS)
+        for y in range(ROWS):
+            for move in ghost_moves(MAZE, (COLS, y)):
+                self.valid_moves[y, COLS] |= EXIT_BITS[DIRECTION_CODES[move]]
+        self._allocate()
+        self.reset()
+
+    def _allocate(self):
+        count, players, ghosts = self.count, self.num_players, len(GHOST_NAMES)
+        self.maze = np.empty((count, ROWS, COLS), dtype=np.uint8)
+        self.pellets_left = np.empty(count, dtype=np.int32)
+        self.tick = np.empty(count, dtype=np.int64)
+        self.game_over = np.empty(count, dtype=bool)
+        self.won = np.empty(count, dtype=bool)
+
+        self.player_x = np.empty((count, players))
+        self.player_y = np.empty((count, players))
+        self.player_direction = np.empty((count, players), dtype=np.int8)
+        self.next_direction = np.empty((count, players), dtype=np.int8)
+        self.score = np.empty((count, players), dtype=np.int64)
+        self.power_pellet_timer = np.empty((count, players), dtype=np.int32)
+        self.alive = np.empty((count, players), dtype=bool)
+
+        self.ghost_x = np.empty((count, ghosts))
+        self.ghost_y = np.empty((count, ghosts))
+        self.ghost_direction = np.empty((count, ghosts), dtype=np.int8)
+        self.vulnerable = np.empty((count, ghosts), dtype=bool)
+        self.vulnerable_timer = np.empty((count, ghosts), dtype=np.int32)
+        self.eaten = np.empty((count, ghosts), dtype=bool)
+        self.respawn_timer = np.empty((count, ghosts), dtype=np.int32)
+
+    def reset(self, games=None, seeds=None):
+        """Start every game over, or only `games` (indices or a bool mask), in place.
+
+        With `seeds`, one per game restarted, each game's random turns are
+        reseeded to match `GameState.reset(seed=...)`.
+        """
+        if games is None:
+            games = slice(None)
+        self.maze[games] = self.base_maze
+        self.pellets_left[games] = count_pellets(MAZE)
+        self.tick[games] = 0
+        self.game_over[games] = False
+        self.won[games] = False
+
+        self.player_x[games] = PACMAN_SPAWN[0]
+        self.player_y[games] = PACMAN_SPAWN[1]
+        self.player_direction[games] = 0
+        self.next_direction[games] = 0
+        self.score[games] = 0
+        self.power_pellet_timer[games] = 0
+        self.alive[games] = True
+
+        self.ghost_x[games] = [x for x, y in GHOST_POSITIONS]
+        self.ghost_y[games] = [y for x, y in GHOST_POSITIONS]
+        self.ghost_direction[games] = 0
+        self.vulnerable[games] = False
+        self.vulnerable_timer[games] = 0
+        self.eaten[games] = False
+        self.respawn_timer[games] = 0
+        if seeds is not None:
+            for game, seed in zip(self.games[games], seeds):
+                self.rngs[game].seed(seed)
+
+    @property
+    def total_score(self):
+        return self.score.sum(axis=1)
+
+    def step(self, inputs=None):
+        """Advance every running game by one tick and return which are still running.
+
+        `inputs` is an int array of shape (N, players) holding a direction
+        code per player, or KEEP_DIRECTION to leave the queued one alone.
+        """
+        running = ~self.game_over
+        if not running.any():
+            return running
+
+        if inputs is not None:
+            inputs = np.asarray(inputs).reshape(self.count, -1)[:, :self.num_players]
+            change = running[:, None] & (inputs != KEEP_DIRECTION)
+            self.next_direction[change] = inputs[change]
+
+        for player in range(self.num_players):
+            self._move_player(player, running & self.alive[:, player])
+
+        for ghost in range(len(GHOST_NAMES)):
+            self._move_ghost(ghost, running)
+            self._collide(ghost, running)
+
+        self.tick[running] += 1
+        self.won[running] = self.pellets_left[running] == 0
+        self.game_over |= running & (self.won | ~self.alive.any(axis=1))
+        return ~self.game_over
+
+    def _walls(self, x, y):
+        """Whether the cells nearest (x, y) in each game are walls, treating off-maze as open."""
+        cell_x = np.round(x).astype(np.int64)
+        cell_y = np.round(y).astype(np.int64)
+        inside = (cell_x >= 0) & (cell_x < self.cols) & (cell_y >= 0) & (cell_y < self.rows)
+        cells = self.maze[self.games, np.clip(cell_y, 0, self.rows - 1), np.clip(cell_x, 0, self.cols - 1)]
+        return inside & (cells == 1)
+
+    def _blocked(self, x, y, dx, dy, radius=0.35):
+        """Vectorized Pacman.can_move_in_direction, negated."""
+        test_x = x + dx * PACMAN_SPEED
+        test_y = y + dy * PACMAN_SPEED
+        return (self._walls(test_x, test_y) | self._walls(test_x - radius, test_y) |
+                self._walls(test_x + radius, test_y) | self._walls(test_x, test_y - radius) |
+                self._walls(test_x, test_y + radius))
+
+    def _move_player(self, player, moving):
+        """Pacman.move for one player slot in every game where `moving` is set."""
+        x = self.player_x[:, player]
+        y = self.player_y[:, player]
+        direction = self.player_direction[:, player]
+        timer = self.power_pellet_timer[:, player]
+        timer[moving & (timer > 0)] -= 1
+
+        # Apply the queued direction when close to a grid center and the way is open
+        next_direction = self.next_direction[:, player]
+        grid_x, grid_y = np.round(x), np.round(y)
+        turn = (moving & (next_direction != 0) &
+                (np.abs(x - grid_x) < 0.1) & (np.abs(y - grid_y) < 0.1))
+        if turn.any():
+            turn &= ~self._blocked(grid_x, grid_y, DX[next_direction], DY[next_direction])
+            x[turn] = grid_x[turn]
+            y[turn] = grid_y[turn]
+            direction[turn] = next_direction[turn]
+
+        dx, dy = DX[direction], DY[direction]
+        new_x = x + dx * PACMAN_SPEED
+        new_y = y + dy * PACMAN_SPEED
+
+        # Tunnel cells wrap horizontally without a wall check
+        column = np.clip(np.trunc(x).astype(np.int64), 0, self.cols - 1)
+        row = np.clip(np.trunc(y).astype(np.int64), 0, self.rows - 1)
+        tunnel = moving & (dx != 0) & (self.maze[self.games, row, column] == 4)
+        free = (moving & ~tunnel & ~self._blocked(x, y, dx, dy) &
+                (new_x >= 0) & (new_x < self.cols) & (new_y >= 0) & (new_y < self.rows))
+        x[tunnel] = np.mod(new_x[tunnel] + self.cols, self.cols)
+        y[tunnel] = new_y[tunnel]
+        x[free] = new_x[free]
+        y[free] = new_y[free]
+
+        # Collect dots and power pellets
+        cell_x = np.round(x).astype(np.int64)
+        cell_y = np.round(y).astype(np.int64)
+        inside = moving & (cell_x >= 0) & (cell_x < self.cols) & (cell_y >= 0) & (cell_y < self.rows)
+        cell_x = np.clip(cell_x, 0, self.cols - 1)
+        cell_y = np.clip(cell_y, 0, self.rows - 1)
+        cells = self.maze[self.games, cell_y, cell_x]
+        dot = inside & (cells == 2)
+        power = inside & (cells == 3)
+        eat = dot | power
+        if eat.any():
+            self.maze[self.games[eat], cell_y[eat], cell_x[eat]] = 0
+            self.score[:, player] += 10 * dot + 50 * power
+            self.pellets_left -= eat
+        if power.any():
+            timer[power] = POWER_PELLET_DURATION
+            scared = power[:, None] & ~self.eaten
+            self.vulnerable |= scared
+            self.vulnerable_timer[scared] = VULNERABLE_DURATION
+
+    def _move_ghost(self, ghost, running):
+        """Ghost.move for one ghost in every running game."""
+        x = self.ghost_x[:, ghost]
+        y = self.ghost_y[:, ghost]
+        direction = self.ghost_direction[:, ghost]
+        vulnerable = self.vulnerable[:, ghost]
+        eaten = self.eaten[:, ghost]
+
+        # Eaten ghosts wait out their respawn timer, then reappear in the house
+        waiting = running & eaten
+        respawn_timer = self.respawn_timer[:, ghost]
+        respawn_timer[waiting] -= 1
+        respawned = waiting & (respawn_timer <= 0)
+        eaten[respawned] = False
+        vulnerable[respawned] = False
+        x[respawned] = GHOST_HOUSE[0]
+        y[respawned] = GHOST_HOUSE[1]
+        active = running & ~waiting
+
+        timer = self.vulnerable_timer[:, ghost]
+        scared = active & vulnerable
+        timer[scared] -= 1
+        vulnerable[scared & (timer <= 0)] = False
+
+        # Only change direction when centered on a cell
+        grid_x, grid_y = np.round(x), np.round(y)
+        centered = active & (np.abs(x - grid_x) < 0.1) & (np.abs(y - grid_y) < 0.1)
+        x[centered] = grid_x[centered]
+        y[centered] = grid_y[centered]
+        cell_x = grid_x.astype(np.int64)
+        cell_y = grid_y.astype(np.int64)
+        moves = np.where(centered, self.valid_moves[np.clip(cell_y, 0, self.rows - 1),
+                                                    np.clip(cell_x, 0, self.cols)], 0)
+        stuck = centered & (moves == 0)
+
+        # Remove opposite direction unless it's the only option
+        reverse = REVERSE_BITS[direction]
+        drop = (POPCOUNT[moves] > 1) & ((moves & reverse) != 0)
+        moves = np.where(drop, moves & ~reverse, moves)
+
+        deciding = centered & ~stuck
+        for game in np.nonzero(deciding & vulnerable)[0]:
+            # Move randomly when vulnerable
+            options = [DIRECTIONS[code] for code in range(1, 5) if moves[game] & MOVE_BITS[code]]
+            direction[game] = DIRECTION_CODES[self.rngs[game].choice(options)]
+
+        # Along a corridor the way on is forced; only junctions need a target
+        chasing = deciding & ~vulnerable
+        forced = chasing & (POPCOUNT[moves] == 1)
+        direction[forced] = FIRST_MOVE[moves[forced]]
+        chasing &= ~forced
+        if chasing.any():
+            direction[chasing] = self._best_moves(ghost, cell_x, cell_y, moves)[chasing]
+
+        # Move in current direction
+        moving = active & ~stuck
+        dx, dy = DX[direction], DY[direction]
+        new_x = x + dx * GHOST_SPEED
+        new_y = y + dy * GHOST_SPEED
+
+        # Handle tunnel wrapping; horizontal moves along a tunnel row are always allowed
+        tunnel_row = self.tunnel_rows[np.clip(np.trunc(y).astype(np.int64), 0, self.rows - 1)]
+        wrapped_x = np.where(new_x < 0, self.cols - 1, np.where(new_x >= self.cols, 0, new_x))
+        target_y = np.clip(np.round(new_y).astype(np.int64), 0, self.rows - 1)
+        tunnel_x = np.clip(np.round(np.mod(wrapped_x, self.cols)).astype(np.int64), 0, self.cols - 1)
+        open_x = np.clip(np.round(new_x).astype(np.int64), 0, self.cols - 1)
+        in_rows = (new_y >= 0) & (new_y < self.rows)
+        along_tunnel = moving & tunnel_row & ((dx != 0) | (in_rows & (self.maze[self.games, target_y, tunnel_x] != 1)))
+        normal = (moving & ~tunnel_row & in_rows & (new_x >= 0) & (new_x < self.cols) &
+                  (self.maze[self.games, target_y, open_x] != 1))
+        x[along_tunnel] = wrapped_x[along_tunnel]
+        y[along_tunnel] = new_y[along_tunnel]
+        x[normal] = new_x[normal]
+        y[normal] = new_y[normal]
+
+    def _targets(self, ghost):
+        """Ghost.get_target for one ghost in every game, as (x, y) int arrays."""
+        name = GHOST_NAMES[ghost]
+        pacman_x, pacman_y = self.player_x[:, 0], self.player_y[:, 0]
+        facing = self.player_direction[:, 0]
+        if name == "blinky":
+            return np.round(pacman_x), np.round(pacman_y)
+        elif name == "pinky":
+            return np.round(pacman_x + 4 * DX[facing]), np.round(pacman_y + 4 * DY[facing])
+        elif name == "inky":
+            blinky = GHOST_NAMES.index("blinky")
+            ahead_x = np.round(pacman_x + 2 * DX[facing])
+            ahead_y = np.round(pacman_y + 2 * DY[facing])
+            return (ahead_x + (ahead_x - np.round(self.ghost_x[:, blinky])),
+                    ahead_y + (ahead_y - np.round(self.ghost_y[:, blinky])))
+        else:  # clyde
+            distance = np.sqrt((self.ghost_x[:, ghost] - pacman_x) ** 2 + (self.ghost_y[:, ghost] - pacman_y) ** 2)
+            far = distance > 8
+            return np.where(far, np.round(pacman_x), 0), np.where(far, np.round(pacman_y), self.rows - 1)
+
+    def _best_moves(self, ghost, cell_x, cell_y, moves):
+        """Direction code each game's ghost takes to get closest to its target, as MazeIndex.decision gives it."""
+        target_x, target_y = self._targets(ghost)
+        target_x = np.clip(target_x.astype(np.int64), 0, self.cols - 1)
+        target_y = np.clip(target_y.astype(np.int64), 0, self.rows - 1)
+        targets = self.nearest_open[target_y * self.cols + target_x]
+
+        # Just past the tunnel exit, or on a cell without a row, the exits are scored on the flow field
+        inside = cell_x < self.cols
+        cells = np.clip(cell_y, 0, self.rows - 1) * self.cols + np.where(inside, cell_x, 0)
+        offsets = np.where(inside, self.decision_offsets[cells * 16 + moves], -1)
+        best = self.decisions[np.maximum(offsets, 0) + self.target_slots[targets]].astype(np.int8)
+        missing = (offsets < 0) & (POPCOUNT[moves] > 1)
+        if missing.any():
+            best[missing] = self._flow_moves(targets, cell_x, cell_y, moves)[missing]
+        return best
+
+    def _flow_moves(self, targets, cell_x, cell_y, moves):
+        """Direction code each game's ghost takes to get closest to its target along the flow field."""
+        fields = self.distances[targets]
+
+        scores = np.empty((self.count, 4), dtype=np.int32)
+        for code in range(1, 5):
+            next_x = np.mod(cell_x + int(DX[code]), self.cols)
+            next_y = np.clip(cell_y + int(DY[code]), 0, self.rows - 1)
+            distance = fields[self.games, next_y * self.cols + next_x]
+            scores[:, code - 1] = np.where(moves & MOVE_BITS[code], distance, np.iinfo(np.int32).max)
+        # argmin keeps the first of equally good moves, like the scalar loop
+        return (np.argmin(scores, axis=1) + 1).astype(np.int8)
+
+    def _collide(self, ghost, running):
+        """Check one ghost against every player, as GameState.step does after each ghost move."""
+        x, y = self.ghost_x[:, ghost], self.ghost_y[:, ghost]
+        vulnerable = self.vulnerable[:, ghost]
+        for player in range(self.num_players):
+            alive = self.alive[:, player]
+            hit = (running & alive & (np.abs(x - self.player_x[:, player]) < COLLISION_RADIUS) &
+                   (np.abs(y - self.player_y[:, player]) < COLLISION_RADIUS))
+            if hit.any():
+                self.eaten[:, ghost] |= hit & vulnerable
+                self.score[:, player] += GHOST_POINTS * (hit & vulnerable)
+                alive &= ~(hit & ~vulnerable)
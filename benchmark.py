@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Frames are drawn to offscreen surfaces; no window is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from pacman import (GameState, Ghost, Pacman, SpatialHash, MAZE, COLS, ROWS, WINDOW_WIDTH, WINDOW_HEIGHT,
+                    MULTI_PLAYER, GHOST_SPEED, BLACK, RED, check_win, find_path, get_maze_index, draw_maze,
+                    draw_scores, init_display, pygame)
+
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_MIN_TIME = 0.2
+REPEATS = 5
+SWARM_SIZES = [256, 1024, 4096]
+ROUND_TICKS = 100
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+# Each benchmark is a setup function returning the callable to time
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Register a benchmark setup function under `name`."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def random_inputs(count=1000, seed=0):
+    """A repeatable stream of queued directions, with some ticks left unchanged."""
+    rng = random.Random(seed)
+    return [rng.choice(DIRECTIONS) if rng.random() < 0.2 else None for _ in range(count)]
+
+@benchmark('pacman_move')
+def bench_pacman_move():
+    state = GameState()
+    pacman, maze, ghosts = state.pacman, state.maze, state.ghosts
+    inputs = [direction or (0, 0) for direction in random_inputs()]
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(inputs)
+        if inputs[counter[0]] != (0, 0):
+            pacman.next_direction = inputs[counter[0]]
+        pacman.move(maze, ghosts, state)
+    return run
+
+@benchmark('pacman_can_move_in_direction')
+def bench_can_move_in_direction():
+    maze = [row[:] for row in MAZE]
+    pacman = Pacman()
+    probes = [(x + offset, y, direction) for y in range(ROWS) for x in range(COLS)
+              for offset in (0, 0.4) for direction in DIRECTIONS]
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(probes)
+        x, y, direction = probes[counter[0]]
+        pacman.can_move_in_direction(maze, x, y, direction)
+    return run
+
+@benchmark('ghost_move')
+def bench_ghost_move():
+    state = GameState()
+    pacman, maze, ghosts, index = state.pacman, state.maze, state.ghosts, state.index
+    # Move Pacman around now and then so the ghosts keep chasing new targets
+    spots = random.Random(0).sample(open_cells(maze), 50)
+    counter = [0]
+    def run():
+        counter[0] += 1
+        ghosts[counter[0] & 3].move(maze, pacman, ghosts, index)
+        if counter[0] % 400 == 0:
+            pacman.x, pacman.y = spots[counter[0] // 400 % len(spots)]
+    return run
+
+@benchmark('ghost_decision')
+def bench_ghost_decision():
+    state = GameState()
+    pacman, maze, ghosts, index = state.pacman, state.maze, state.ghosts, state.index
+    # Every call is a chasing ghost choosing its way at a four-way junction
+    spots = random.Random(0).sample(open_cells(maze), 50)
+    counter = [0]
+    def run():
+        counter[0] += 1
+        ghost = ghosts[counter[0] & 3]
+        ghost.x, ghost.y, ghost.direction_code = 4, 3, 3
+        ghost.move(maze, pacman, ghosts, index)
+        if counter[0] % 400 == 0:
+            pacman.x, pacman.y = spots[counter[0] // 400 % len(spots)]
+    return run
+
+@benchmark('ghost_get_valid_moves')
+def bench_get_valid_moves():
+    maze = [row[:] for row in MAZE]
+    ghost = Ghost(9, 8, (255, 0, 0), "blinky")
+    cells = open_cells(maze)
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(cells)
+        ghost.get_valid_moves(maze, cells[counter[0]])
+    return run
+
+@benchmark('ghost_get_target')
+def bench_get_target():
+    state = GameState()
+    state.pacman.direction = (1, 0)
+    ghosts, pacman = state.ghosts, state.pacman
+    counter = [0]
+    def run():
+        counter[0] += 1
+        ghosts[counter[0] & 3].get_target(pacman, ghosts)
+    return run
+
+@benchmark('find_path_worst_case')
+def bench_find_path():
+    maze = [row[:] for row in MAZE]
+    index = get_maze_index(maze)
+    pairs = longest_pairs(maze)
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(pairs)
+        start, target = pairs[counter[0]]
+        find_path(maze, start, target, index)
+    return run
+
+@benchmark('find_path_large_maze')
+def bench_find_path_large_maze():
+    # Too big for all-pairs tables, so every query searches the junction graph
+    from mazes import corridor_maze
+    layout = corridor_maze(301, 301, tunnel_rows=(101, 201))
+    rng = random.Random(0)
+    cells = open_cells(layout.grid)
+    index = get_maze_index(layout.grid)
+    pairs = [(rng.choice(cells), rng.choice(cells)) for _ in range(64)]
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(pairs)
+        start, target = pairs[counter[0]]
+        find_path(layout.grid, start, target, index)
+    return run
+
+@benchmark('check_win')
+def bench_check_win():
+    # Worst case: no pellets left, so the whole maze is scanned
+    maze = [[0 if cell in [2, 3] else cell for cell in row] for row in MAZE]
+    def run():
+        check_win(maze)
+    return run
+
+@benchmark('game_tick')
+def bench_game_tick():
+    state = GameState(MULTI_PLAYER)
+    inputs = random_inputs()
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(inputs)
+        if not state.step((inputs[counter[0]], inputs[-counter[0]])):
+            state.reset()
+    return run
+
+@benchmark('game_round_large_maze')
+def bench_game_round_large_maze():
+    from mazes import corridor_maze
+    layout = corridor_maze(301, 301, tunnel_rows=(101, 201))
+    state = GameState(layout=layout, seed=0)
+    # Left in the ghost house the ghosts catch Pacman within a few hundred ticks, and
+    # single ticks vary too much to time one by one as ghosts reach junctions or not.
+    # So each call scatters the ghosts across the maze and plays ROUND_TICKS ticks,
+    # most of the turns in which are searches over a long way
+    rng = random.Random(0)
+    spots = [(x, y) for x, y in open_cells(layout.grid) if x % 2 and y % 2]
+    inputs = random_inputs()
+    counter = [0]
+    def run():
+        for ghost in state.ghosts:
+            ghost.x, ghost.y = rng.choice(spots)
+        for _ in range(ROUND_TICKS):
+            counter[0] = (counter[0] + 1) % len(inputs)
+            if not state.step([inputs[counter[0]]]):
+                state.reset()
+    return run
+
+def bench_snapshot_restore(layout=None):
+    """Snapshot, play a few ticks and restore, as a lookahead search would per branch."""
+    state = GameState(MULTI_PLAYER) if layout is None else GameState(MULTI_PLAYER, layout=layout)
+    for direction in DIRECTIONS * 5:
+        state.step((direction, direction))
+    inputs = random_inputs()
+    counter = [0]
+    def run():
+        snapshot = state.snapshot()
+        for _ in range(4):
+            counter[0] = (counter[0] + 1) % len(inputs)
+            state.step((inputs[counter[0]], inputs[-counter[0]]))
+        state.restore(snapshot)
+    return run
+
+@benchmark('snapshot_restore')
+def bench_snapshot_restore_classic():
+    return bench_snapshot_restore()
+
+@benchmark('snapshot_restore_large_maze')
+def bench_snapshot_restore_large_maze():
+    from mazes import corridor_maze
+    return bench_snapshot_restore(corridor_maze(301, 301, tunnel_rows=(101, 201)))
+
+@benchmark('batch_tick_1024')
+def bench_batch_tick():
+    from batch import BatchGame
+    games = BatchGame(1024)
+    rng = random.Random(0)
+    inputs = [[[rng.choice([-1, -1, -1, 1, 2, 3, 4])] for _ in range(1024)] for _ in range(64)]
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(inputs)
+        if not games.step(inputs[counter[0]]).any():
+            games.reset()
+    return run
+
+def bench_swarm_collisions(ghost_count, player_count=32, side=101):
+    """Ghosts wandering a side x side area, each checked against the players near it.
+
+    The area is fixed, so per-call time should grow in step with
+    `ghost_count`; a quadratic check would grow with its square.
+    """
+    rng = random.Random(0)
+    ghosts = [Ghost(rng.uniform(0, side), rng.uniform(0, side), RED, 'blinky') for _ in range(ghost_count)]
+    players = [Pacman(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(player_count)]
+    steps = [rng.choice(DIRECTIONS) for _ in ghosts]
+    ghost_cells, player_cells = SpatialHash(ghosts), SpatialHash(players)
+    def run():
+        hits = 0
+        for ghost, (dx, dy) in zip(ghosts, steps):
+            ghost.x = (ghost.x + dx * GHOST_SPEED) % side
+            ghost.y = (ghost.y + dy * GHOST_SPEED) % side
+            ghost_cells.move(ghost)
+            hits += len(player_cells.near(ghost.x, ghost.y))
+        for player in players:
+            hits += len(ghost_cells.near(player.x, player.y, 3))
+        return hits
+    return run
+
+for count in SWARM_SIZES:
+    benchmark(f'swarm_collisions_{count}')(lambda count=count: bench_swarm_collisions(count))
+
+@benchmark('draw_maze')
+def bench_draw_maze():
+    init_display()
+    surface = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    maze = [row[:] for row in MAZE]
+    def run():
+        draw_maze(surface, maze)
+    return run
+
+@benchmark('frame_offscreen')
+def bench_frame():
+    init_display()
+    surface = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    state = GameState(MULTI_PLAYER)
+    inputs = random_inputs()
+    counter = [0]
+    def run():
+        counter[0] = (counter[0] + 1) % len(inputs)
+        if not state.step((inputs[counter[0]], inputs[-counter[0]])):
+            state.reset()
+        surface.fill(BLACK)
+        draw_maze(surface, state.maze)
+        for player in state.players:
+            if player.alive:
+                player.draw(surface)
+        for ghost in state.ghosts:
+            ghost.draw(surface)
+        draw_scores(surface, state)
+    return run
+
+def open_cells(maze):
+    return [(x, y) for y in range(len(maze)) for x in range(len(maze[0])) if maze[y][x] != 1]
+
+def longest_pairs(maze, count=10):
+    """The start/target pairs with the longest shortest paths in the maze."""
+    index = get_maze_index(maze)
+    cells = open_cells(maze)
+    pairs = [(index.distance(start, target), start, target) for start in cells for target in cells]
+    pairs.sort(reverse=True)
+    return [(start, target) for _, start, target in pairs[:count]]
+
+def time_callable(run, min_time=DEFAULT_MIN_TIME, repeats=REPEATS):
+    """Best and median seconds per call, calibrating the loop count to `min_time`."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeats or loops >= 1 << 24:
+            break
+        loops *= 2
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - start) / loops)
+    timings.sort()
+    return timings[0], timings[len(timings) // 2]
+
+def run_benchmarks(names=None, min_time=DEFAULT_MIN_TIME):
+    """Run the named benchmarks (all by default) and return their results."""
+    results = {}
+    for name in names or BENCHMARKS:
+        run = BENCHMARKS[name]()
+        best, median = time_callable(run, min_time)
+        results[name] = {
+            'per_call_us': best * 1e6,
+            'median_us': median * 1e6,
+            'calls_per_sec': 1.0 / best,
+        }
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'machine': platform.machine(),
+        'system': platform.system(),
+    }
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """Return (name, baseline us, current us, change) rows and the names that regressed."""
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['per_call_us']
+        after = result['per_call_us']
+        change = after / before - 1.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def print_results(results):
+    print(f"{'benchmark':<30} {'per call (us)':>14} {'median (us)':>12} {'calls/sec':>12}")
+    for name, result in results.items():
+        print(f"{name:<30} {result['per_call_us']:>14.2f} {result['median_us']:>12.2f} "
+              f"{result['calls_per_sec']:>12.0f}")
+
+def print_comparison(rows, regressions, threshold):
+    print(f"{'benchmark':<30} {'baseline (us)':>14} {'current (us)':>13} {'change':>8}")
+    for name, before, after, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<30} {before:>14.2f} {after:>13.2f} {change:>+8.1%}{flag}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {threshold:.0%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Pacman hot paths.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run (default: all of %s)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='slowdown that counts as a regression (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                        help='seconds to spend timing each benchmark (default: %(default)s)')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(args.names, args.min_time)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        rows, regressions = compare(baseline, results, args.threshold)
+        print_comparison(rows, regressions, args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Thin pygame client for server.py: sends the keys held and draws the game the server sends back.
+
+The window works like pacman.py's own: pick one or two players from the
+menu, steer with the arrow keys or WASD, and press R to play again after
+a game. No game logic runs here; the client keeps a GameState only as
+somewhere to apply the server's STATE messages for the Renderer to draw.
+"""
+import socket
+import time
+from typing import List
+
+from pacman import (DEFAULT_LAYOUT, DIRECTION_CODES, FPS, MULTI_PLAYER, SINGLE_PLAYER, GameState, MazeLayout,
+                    Renderer, draw_game_over, draw_menu, init_display, pygame, read_direction)
+from replay import layout_id
+from server import (ERROR, INPUT, JOIN, RESTART, STATE, WELCOME, WELCOME_BODY, ProtocolError, StateDecoder, frame,
+                    split_frames)
+
+CONNECT_TIMEOUT = 5.0
+READ_SIZE = 65536
+
+def join(host, port, mode, room='', layout: MazeLayout = DEFAULT_LAYOUT):
+    """Connect and join a room.
+
+    Returns the socket, set non-blocking, the WELCOME fields (player slot,
+    mode and tick rate), and any messages and bytes that came after it.
+    """
+    sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(frame(JOIN, bytes([mode]) + room.encode()))
+        buffer = bytearray()
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError('server closed the connection')
+            buffer += data
+            messages = split_frames(buffer)
+            if messages:
+                break
+        message_type, body = messages[0]
+        if message_type == ERROR:
+            raise ProtocolError(body.decode('utf-8', 'replace'))
+        if message_type != WELCOME:
+            raise ProtocolError(f'expected WELCOME, got message type {message_type:#x}')
+        slot, mode, tick_rate, maze_id = WELCOME_BODY.unpack(body)
+        if maze_id != layout_id(layout):
+            raise ProtocolError(f'server is playing a different maze than {layout.name!r}')
+        sock.setblocking(False)
+    except BaseException:
+        sock.close()
+        raise
+    # Anything after the WELCOME is the start of the game
+    return sock, slot, mode, tick_rate, messages[1:], buffer
+
+class Connection:
+    """The client's end of a game on the server, over the non-blocking socket `join` returns.
+
+    `send` only queues a frame; `pump` writes what the socket will take of
+    the queue and reads whatever has arrived, so the window never waits on
+    the network. Once the server closes or resets the connection the
+    socket is closed and `open` is False.
+    """
+
+    def __init__(self, sock: socket.socket, buffer=b''):
+        self.sock = sock
+        self.incoming = bytearray(buffer)
+        self.outgoing = bytearray()
+        self.open = True
+
+    def send(self, data: bytes):
+        self.outgoing += data
+
+    def pump(self) -> List[tuple]:
+        """Flush queued frames as far as the socket allows and return the messages received since the last call."""
+        try:
+            while self.open and self.outgoing:
+                del self.outgoing[:self.sock.send(self.outgoing)]
+            while self.open:
+                data = self.sock.recv(READ_SIZE)
+                if not data:
+                    self.close()
+                self.incoming += data
+        except BlockingIOError:
+            pass
+        except ConnectionError:
+            self.close()
+        # Messages that arrived before the connection went away still count
+        return split_frames(self.incoming)
+
+    def close(self):
+        self.sock.close()
+        self.open = False
+
+def run_client(host, port, room='', layout: MazeLayout = DEFAULT_LAYOUT):
+    """Play on a server in a pygame window until it is closed or the server goes away."""
+    screen, clock = init_display(layout)
+    renderer = Renderer(screen)
+    connection = None
+    running = True
+    while running:
+        if connection is None:
+            # Menu: choose how many players, then join
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key in (pygame.K_1, pygame.K_2):
+                    mode = SINGLE_PLAYER if event.key == pygame.K_1 else MULTI_PLAYER
+                    try:
+                        sock, slot, mode, tick_rate, pending, buffer = join(host, port, mode, room, layout)
+                    except (OSError, ProtocolError) as error:
+                        print(f'Could not join: {error}')
+                        continue
+                    connection = Connection(sock, buffer)
+                    state = GameState(mode, layout=layout)
+                    decoder = StateDecoder(state)
+                    sent_code = 0
+                    last_state = time.perf_counter()
+                    renderer.invalidate()
+            draw_menu(screen)
+            pygame.display.flip()
+            clock.tick(FPS)
+            continue
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r and state.game_over:
+                connection.send(frame(RESTART))
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_m and state.game_over:
+                connection.close()
+                connection = None
+        if connection is None:
+            continue
+
+        # Either set of keys steers this client's player
+        keys = pygame.key.get_pressed()
+        direction = (read_direction(keys, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN) or
+                     read_direction(keys, pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s))
+        code = DIRECTION_CODES[direction] if direction else 0
+        if code != sent_code:
+            connection.send(frame(INPUT, bytes([code])))
+            sent_code = code
+
+        for message_type, body in pending + connection.pump():
+            if message_type == STATE:
+                was_over = state.game_over
+                decoder.apply(body)
+                last_state = time.perf_counter()
+                if was_over and not state.game_over:
+                    renderer.invalidate()
+            elif message_type == ERROR:
+                print(f'Server: {body.decode("utf-8", "replace")}')
+                running = False
+        pending = []
+        if not connection.open:
+            print('Lost the connection to the server')
+            running = False
+
+        if state.game_over:
+            draw_game_over(screen, state.won, state.total_score, mode)
+            pygame.display.flip()
+            renderer.invalidate()
+        elif decoder.synced:
+            renderer.draw(state, min((time.perf_counter() - last_state) * tick_rate, 1.0))
+        clock.tick(FPS)
+
+    if connection is not None and connection.open:
+        connection.close()
+    pygame.quit()
@@ -0,0 +1,84 @@
+from array import array
+
+from pacman import Ghost, Pacman
+
+# (attribute, array typecode) for each entity class. Bools are stored as
+# bytes; attributes with typecode None (colors, names, home cells) take few
+# distinct values, so the store keeps a palette and a 2-byte index per entity.
+PACMAN_FIELDS = [
+    ('x', 'd'), ('y', 'd'), ('prev_x', 'd'), ('prev_y', 'd'),
+    ('direction_code', 'b'), ('next_direction_code', 'b'), ('score', 'q'), ('power_pellet_timer', 'i'),
+    ('mouth_open', 'B'), ('animation_count', 'b'), ('color', None), ('is_ms_pacman', 'B'), ('alive', 'B'),
+]
+GHOST_FIELDS = [
+    ('x', 'd'), ('y', 'd'), ('prev_x', 'd'), ('prev_y', 'd'),
+    ('color', None), ('name', None), ('direction_code', 'b'),
+    ('vulnerable', 'B'), ('vulnerable_timer', 'i'), ('eaten', 'B'), ('respawn_timer', 'i'),
+    ('home', None), ('corner', None),
+]
+BOOL_FIELDS = {'mouth_open', 'is_ms_pacman', 'alive', 'vulnerable', 'eaten'}
+
+class EntityStore:
+    """Array-backed storage for the state of many Pacmen or many ghosts.
+
+    Each attribute lives in its own typed `array`, so an entity takes a few
+    dozen bytes instead of a Python object with a boxed float per coordinate.
+    Use it to hold large populations or many saved game states: `append`
+    and `write` copy an entity in, `get` builds a new one and `read` fills
+    an existing one. `columns` exposes the arrays for whole-population work.
+    """
+
+    def __init__(self, cls=Ghost):
+        self.cls = cls
+        self.fields = PACMAN_FIELDS if issubclass(cls, Pacman) else GHOST_FIELDS
+        self.columns = {name: array(typecode or 'H') for name, typecode in self.fields}
+        self.palettes = {name: [] for name, typecode in self.fields if typecode is None}
+
+    def __len__(self) -> int:
+        return len(self.columns['x'])
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns."""
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def _encode(self, name, value):
+        palette = self.palettes.get(name)
+        if palette is None:
+            return value
+        if value not in palette:
+            palette.append(value)
+        return palette.index(value)
+
+    def _decode(self, name, value):
+        palette = self.palettes.get(name)
+        if palette is not None:
+            return palette[value]
+        if name in BOOL_FIELDS:
+            return bool(value)
+        return value
+
+    def append(self, entity) -> int:
+        """Copy an entity into a new slot and return its index."""
+        for name, column in self.columns.items():
+            column.append(self._encode(name, getattr(entity, name)))
+        return len(self) - 1
+
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+
+    def write(self, index, entity):
+        """Overwrite slot `index` with an entity's current state."""
+        for name, column in self.columns.items():
+            column[index] = self._encode(name, getattr(entity, name))
+
+    def read(self, index, entity):
+        """Load slot `index` into an existing entity and return it."""
+        for name, column in self.columns.items():
+            setattr(entity, name, self._decode(name, column[index]))
+        return entity
+
+    def get(self, index):
+        """A new entity holding the state in slot `index`."""
+        return self.read(index, self.cls.__new__(self.cls))
@@ -0,0 +1,198 @@
+"""Reset/step environments for training agents, with observations as preallocated NumPy planes.
+
+An observation is one float32 array of shape (PLANES, rows, cols), one
+plane per feature:
+
+    WALLS       1 on walls
+    DOTS        1 on dots not yet eaten
+    POWER       1 on power pellets not yet eaten
+    PACMAN      1 on Pacman's cell while he is alive
+    MS_PACMAN   1 on Ms. Pacman's cell while she is alive (always 0 in single player)
+    GHOSTS      number of ghosts on each cell
+    VULNERABLE  on a vulnerable ghost's cell, the fraction of its vulnerable time left
+
+Entities sit on the cell nearest their position. Every call returns the
+same array, updated in place: walls are written once, eaten pellets are
+cleared as `GameState.eaten_cells` reports them, and entity planes only
+rewrite the cells entities left and entered. Copy the observation to keep
+it past the next step.
+
+`PacmanEnv` wraps one GameState on any maze; `VectorPacmanEnv` steps many
+games per call through BatchGame, on the classic maze. Both follow the
+Gymnasium API: `reset` returns (observation, info), `step` returns
+(observation, reward, terminated, truncated, info). An action is a
+direction code into DIRECTIONS per player, 0 leaving the queued direction
+alone as None does for `GameState.step`; the reward is the score gained.
+"""
+import random
+
+import numpy as np
+
+from batch import KEEP_DIRECTION, BatchGame
+from pacman import DEFAULT_LAYOUT, DIRECTIONS, MAZE, SINGLE_PLAYER, VULNERABLE_DURATION, GameState, MazeLayout
+
+PLANES = 7
+WALLS, DOTS, POWER, PACMAN, MS_PACMAN, GHOSTS, VULNERABLE = range(PLANES)
+MAX_TICKS = 20000  # Episodes still running after this many ticks are truncated
+
+class PacmanEnv:
+    """One game behind a reset/step API; see the module docstring for observations and actions."""
+
+    def __init__(self, mode=SINGLE_PLAYER, layout: MazeLayout = DEFAULT_LAYOUT, seed=None, max_ticks=MAX_TICKS):
+        self.state = GameState(mode, layout=layout)
+        self.max_ticks = max_ticks
+        self.seeder = random.Random(seed)
+        self.cols, self.rows = layout.cols, layout.rows
+        self.observation = np.zeros((PLANES, self.rows, self.cols), dtype=np.float32)
+        self.observation[WALLS] = np.array(layout.grid) == 1
+        self.eaten_cells = None
+        self.entity_cells = []
+
+    def reset(self, seed=None):
+        """Start a new game, seeded with `seed` or the next seed of the env's own RNG."""
+        self.state.reset(seed=self.seeder.getrandbits(32) if seed is None else seed)
+        self._update()
+        return self.observation, self._info()
+
+    def step(self, action):
+        """Advance one tick; `action` is a direction code, or one per player in two player games."""
+        state = self.state
+        codes = [action] if np.ndim(action) == 0 else action
+        score = state.total_score
+        state.step([DIRECTIONS[code] if code else None for code in codes])
+        self._update()
+        truncated = not state.game_over and state.tick >= self.max_ticks
+        return self.observation, state.total_score - score, state.game_over, truncated, self._info()
+
+    def _info(self):
+        state = self.state
+        return {'tick': state.tick, 'score': state.total_score, 'pellets_left': state.pellets_left,
+                'won': state.won}
+
+    def _cell(self, entity):
+        return int(round(entity.x)) % self.cols, min(max(int(round(entity.y)), 0), self.rows - 1)
+
+    def _update(self):
+        """Bring the planes up to date with the game, touching only cells that changed."""
+        state, observation = self.state, self.observation
+        if state.eaten_cells is not self.eaten_cells:
+            # A new game: every pellet is back
+            maze = np.array(state.maze)
+            observation[DOTS] = maze == 2
+            observation[POWER] = maze == 3
+            self.eaten_cells, self.eaten_seen = state.eaten_cells, 0
+        for x, y in self.eaten_cells[self.eaten_seen:]:
+            observation[DOTS, y, x] = 0
+            observation[POWER, y, x] = 0
+        self.eaten_seen = len(self.eaten_cells)
+
+        for plane, x, y in self.entity_cells:
+            observation[plane, y, x] = 0
+        cells = []
+        for plane, player in zip((PACMAN, MS_PACMAN), state.players):
+            if player.alive:
+                x, y = self._cell(player)
+                observation[plane, y, x] = 1
+                cells.append((plane, x, y))
+        for ghost in state.ghosts:
+            x, y = self._cell(ghost)
+            observation[GHOSTS, y, x] += 1
+            cells.append((GHOSTS, x, y))
+            if ghost.vulnerable:
+                observation[VULNERABLE, y, x] = max(observation[VULNERABLE, y, x],
+                                                    ghost.vulnerable_timer / VULNERABLE_DURATION)
+                cells.append((VULNERABLE, x, y))
+        self.entity_cells = cells
+
+class VectorPacmanEnv:
+    """`count` classic maze games stepped together, with one (count, PLANES, rows, cols) observation array.
+
+    Games that end are started over within the same `step`, so the
+    observations returned for them are already their next game's first;
+    `info['final_score']` keeps the scores they finished with.
+    """
+
+    def __init__(self, count, mode=SINGLE_PLAYER, seed=None, max_ticks=MAX_TICKS):
+        self.count = count
+        self.max_ticks = max_ticks
+        self.seeder = random.Random(seed)
+        self.batch = BatchGame(count, mode, self._seeds(count))
+        self.num_players = self.batch.num_players
+        self.games = self.batch.games
+        self.cols, self.rows = self.batch.cols, self.batch.rows
+        self.observation = np.zeros((count, PLANES, self.rows, self.cols), dtype=np.float32)
+        self.observation[:, WALLS] = np.array(MAZE) == 1
+        self.player_cells = np.zeros((2, count, self.num_players), dtype=np.int64)
+        self.ghost_cells = np.zeros((2,) + self.batch.ghost_x.shape, dtype=np.int64)
+
+    def _seeds(self, count):
+        return [self.seeder.getrandbits(32) for _ in range(count)]
+
+    def reset(self, seeds=None):
+        """Start every game over, with `seeds` (one per game) or seeds from the env's own RNG."""
+        self.batch.reset(seeds=self._seeds(self.count) if seeds is None else seeds)
+        self._refill(self.games)
+        self._update_entities(first=True)
+        return self.observation, self._info()
+
+    def step(self, actions):
+        """Advance every game one tick; `actions` holds a direction code per game (and player)."""
+        batch = self.batch
+        actions = np.asarray(actions).reshape(self.count, self.num_players)
+        score = batch.total_score
+        batch.step(np.where(actions == 0, KEEP_DIRECTION, actions))
+        reward = batch.total_score - score
+        terminated = batch.game_over.copy()
+        truncated = ~terminated & (batch.tick >= self.max_ticks)
+
+        # Pellets are only ever eaten where a player now stands
+        x, y = self._cells(batch.player_x, batch.player_y)
+        games = self.games[:, None]
+        self.observation[games, DOTS, y, x] = batch.maze[games, y, x] == 2
+        self.observation[games, POWER, y, x] = batch.maze[games, y, x] == 3
+
+        info = self._info()
+        done = terminated | truncated
+        if done.any():
+            info['final_score'] = np.where(done, batch.total_score, 0)
+            finished = self.games[done]
+            batch.reset(finished, self._seeds(len(finished)))
+            self._refill(finished)
+        self._update_entities()
+        return self.observation, reward, terminated, truncated, info
+
+    def _info(self):
+        batch = self.batch
+        return {'tick': batch.tick.copy(), 'score': batch.total_score, 'pellets_left': batch.pellets_left.copy(),
+                'won': batch.won.copy()}
+
+    def _cells(self, x, y):
+        return (np.round(x).astype(np.int64) % self.cols,
+                np.clip(np.round(y).astype(np.int64), 0, self.rows - 1))
+
+    def _refill(self, games):
+        """Rebuild the pellet planes of `games` from their mazes."""
+        maze = self.batch.maze[games]
+        self.observation[games, DOTS] = maze == 2
+        self.observation[games, POWER] = maze == 3
+
+    def _update_entities(self, first=False):
+        """Clear the cells entities were drawn on last time and draw them where they are now."""
+        batch, observation = self.batch, self.observation
+        games = self.games[:, None]
+        if not first:
+            (player_x, player_y), (ghost_x, ghost_y) = self.player_cells, self.ghost_cells
+            observation[games, PACMAN + np.arange(self.num_players), player_y, player_x] = 0
+            observation[games, GHOSTS, ghost_y, ghost_x] = 0
+            observation[games, VULNERABLE, ghost_y, ghost_x] = 0
+        else:
+            observation[:, PACMAN:] = 0
+
+        player_x, player_y = self.player_cells = np.stack(self._cells(batch.player_x, batch.player_y))
+        observation[games, PACMAN + np.arange(self.num_players), player_y, player_x] = batch.alive
+        ghost_x, ghost_y = self.ghost_cells = np.stack(self._cells(batch.ghost_x, batch.ghost_y))
+        games = np.broadcast_to(games, ghost_x.shape)
+        np.add.at(observation, (games, GHOSTS, ghost_y, ghost_x), 1)
+        vulnerable = batch.vulnerable
+        timers = (batch.vulnerable_timer[vulnerable] / VULNERABLE_DURATION).astype(np.float32)
+        np.maximum.at(observation, (games[vulnerable], VULNERABLE, ghost_y[vulnerable], ghost_x[vulnerable]), timers)
@@ -0,0 +1,541 @@
+"""Event-driven fast-forward for headless games.
+
+Most ticks of a game only slide Pacman and the ghosts along corridors and
+count timers down, yet `GameState.step` runs every move and the collision
+pass for each of them. `fast_forward(state, ticks, inputs)` plays the same
+ticks as calling `state.step(inputs)` that many times and leaves the game
+in the same state, bit for bit, but only does work where something can
+happen:
+
+- With inputs held, where an entity goes depends only on where it is and
+  which way it faces. Those paths are worked out by the real
+  `Pacman.move` and `Ghost.move` on a copy of the maze with no pellets,
+  and cached per layout as segments of positions, one per tick.
+- The real move runs only on the ticks where a path can change: a player
+  entering a cell with a pellet, a ghost at a junction (or at any cell
+  center while scared, as that draws from the RNG), a timer running out
+  or a ghost respawning.
+- Collisions are only checked tick by tick where the bounding boxes of a
+  ghost's and a player's segments come within the collision radius.
+
+Events run in the order `step` would run them, players first and then
+each ghost's move followed by its collision check, so scared ghosts draw
+from the RNG in the same order and every target sees the same positions.
+
+Games being recorded, profiled or debug checked want to see every tick,
+and entities whose class overrides `move` would not follow the cached
+paths, so those games fall back to stepping tick by tick.
+"""
+import heapq
+import itertools
+from bisect import bisect_left, bisect_right
+
+from pacman import GHOST_POINTS, GameState, Ghost, Pacman
+
+SEGMENT_LENGTH = 32  # Most ticks one cached segment covers
+SEGMENT_CACHE_SIZE = 1 << 16  # Segments kept per layout before the cache starts over
+MIN_TICKS = 16  # Shorter stretches are quicker to step through than to plan
+FOREVER = float('inf')
+
+# Event kinds, in the order they run within a phase
+MOVE, CONTACT = 0, 1
+END_PHASE = 1 << 16  # Game over checks run after every player and ghost phase of a tick
+
+class _Decision(Exception):
+    """Raised by the probes where a ghost would choose its way on."""
+
+class _ProbeGhost(Ghost):
+    """A ghost that stops the path being traced where it would need a target."""
+    __slots__ = ()
+
+    def get_target(self, pacman, ghosts):
+        raise _Decision
+
+class _ProbeRandom:
+    """Stands in for the game RNG, stopping the path where a scared ghost would draw from it."""
+
+    def choice(self, options):
+        raise _Decision
+
+_PROBE_RANDOM = _ProbeRandom()
+
+class _Segment:
+    """Positions an entity passes through, one per tick, from a cached start state.
+
+    `end` says what follows the last position: 'more' (trace on from
+    there), 'static' (the entity stays put for good) or 'decision' (the
+    next tick needs the real move). `box` bounds the positions and
+    `entries` lists (offset, cell x, cell y) for each tick Pacman enters a
+    new cell, where he may find a pellet.
+    """
+    __slots__ = ('xs', 'ys', 'codes', 'end', 'box', 'entries')
+
+    def __init__(self, xs, ys, codes, end, entries=()):
+        self.xs, self.ys, self.codes = xs, ys, codes
+        self.end = end
+        self.box = (min(xs), max(xs), min(ys), max(ys)) if xs else None
+        self.entries = entries
+
+class _Paths:
+    """Movement segments for one maze layout, traced on demand and cached."""
+
+    def __init__(self, index, maze):
+        self.index = index  # Pacman.move reads the index off the state it is given
+        self.cols, self.rows = index.cols, index.rows
+        self.walls = [[cell if cell in (1, 4) else 0 for cell in row] for row in maze]
+        self.pacman = Pacman()
+        self.ghost = _ProbeGhost(0, 0, None, 'probe')
+        self.segments = {}
+
+    def segment(self, key) -> _Segment:
+        segment = self.segments.get(key)
+        if segment is None:
+            if len(self.segments) >= SEGMENT_CACHE_SIZE:
+                self.segments.clear()
+            segment = self.segments[key] = (self._pacman_segment(*key[1:]) if key[0] == 'pacman'
+                                            else self._ghost_segment(*key[1:]))
+        return segment
+
+    def _cell(self, x, y):
+        cell_x, cell_y = int(round(x)), int(round(y))
+        return (cell_x, cell_y) if 0 <= cell_x < self.cols and 0 <= cell_y < self.rows else None
+
+    def _pacman_segment(self, x, y, code, next_code):
+        """Trace Pacman from a state until he snaps to a cell center, stops for good or SEGMENT_LENGTH runs out."""
+        pacman = self.pacman
+        pacman.x, pacman.y, pacman.direction_code, pacman.next_direction_code = x, y, code, next_code
+        xs, ys, codes, entries = [], [], [], []
+        cell = self._cell(x, y)
+        end = 'more'
+        for offset in range(1, SEGMENT_LENGTH + 1):
+            pacman.move(self.walls, (), self)
+            if pacman.x == x and pacman.y == y and pacman.direction_code == code:
+                end = 'static'
+                break
+            x, y, code = pacman.x, pacman.y, pacman.direction_code
+            xs.append(x)
+            ys.append(y)
+            codes.append(code)
+            new_cell = self._cell(x, y)
+            if new_cell != cell:
+                cell = new_cell
+                if cell is not None:
+                    entries.append((offset,) + cell)
+            if x == round(x) and y == round(y):
+                break  # On a cell center, where other paths through this cell join
+        return _Segment(xs, ys, codes, end, entries)
+
+    def _ghost_segment(self, x, y, code, scared):
+        """Trace a ghost from a state until it must choose a way on, stops for good or SEGMENT_LENGTH runs out."""
+        ghost = self.ghost
+        ghost.x, ghost.y, ghost.direction_code = x, y, code
+        ghost.vulnerable, ghost.vulnerable_timer, ghost.eaten = scared, 1 << 30, False
+        xs, ys, codes = [], [], []
+        end = 'more'
+        for _ in range(SEGMENT_LENGTH):
+            try:
+                ghost.move(self.walls, None, None, self.index, _PROBE_RANDOM)
+            except _Decision:
+                end = 'decision'
+                break
+            if ghost.x == x and ghost.y == y and ghost.direction_code == code:
+                end = 'static'
+                break
+            x, y, code = ghost.x, ghost.y, ghost.direction_code
+            xs.append(x)
+            ys.append(y)
+            codes.append(code)
+        return _Segment(xs, ys, codes, end)
+
+_paths = {}
+
+def _paths_for(state: GameState) -> _Paths:
+    paths = _paths.get(state.index)
+    if paths is None:
+        paths = _paths[state.index] = _Paths(state.index, state.maze)
+    return paths
+
+class _Track:
+    """Where an entity is on every tick from `tick` on, as a chain of cached segments."""
+    __slots__ = ('paths', 'kind', 'extra', 'tick', 'state', 'xs', 'ys', 'codes', 'ends', 'boxes', 'entry_ticks',
+                 'entry_cells', 'covered', 'end')
+
+    def __init__(self, paths, kind, tick, state, extra=None, static=False):
+        self.paths = paths
+        self.kind = kind  # 'pacman' or 'ghost'
+        self.extra = extra  # Pacman's queued direction code, or whether the ghost is scared
+        self.tick = tick
+        self.state = state  # (x, y, direction code) on `tick`
+        self.xs, self.ys, self.codes = [], [], []  # Positions on tick + 1 onwards
+        self.ends, self.boxes = [], []  # Last tick and bounding box of each segment
+        self.entry_ticks, self.entry_cells = [], []  # Ticks Pacman enters a cell, and the cells
+        self.covered = tick  # Last tick with a known position
+        self.end = 'static' if static else None
+
+    def extend(self, limit):
+        """Add segments until positions are known up to `limit` or the path stops."""
+        while self.end is None and self.covered < limit:
+            state = (self.xs[-1], self.ys[-1], self.codes[-1]) if self.xs else self.state
+            segment = self.paths.segment((self.kind,) + state + (self.extra,))
+            start = self.covered
+            if segment.xs:
+                self.xs += segment.xs
+                self.ys += segment.ys
+                self.codes += segment.codes
+                self.covered += len(segment.xs)
+                self.ends.append(self.covered)
+                self.boxes.append(segment.box)
+                for offset, cell_x, cell_y in segment.entries:
+                    self.entry_ticks.append(start + offset)
+                    self.entry_cells.append((cell_x, cell_y))
+            if segment.end != 'more':
+                self.end = segment.end
+
+    def position(self, t):
+        """(x, y, direction code) on tick t; past a static end, the last of them."""
+        offset = t - self.tick - 1
+        if offset >= len(self.xs):
+            self.extend(t)
+            offset = min(offset, len(self.xs) - 1)
+        if offset < 0:
+            return self.state
+        return self.xs[offset], self.ys[offset], self.codes[offset]
+
+    def span(self, t):
+        """(last tick, min x, max x, min y, max y) of a box around every position from tick t to that tick."""
+        if t > self.tick:
+            self.extend(t)
+            if t <= self.covered:
+                i = bisect_left(self.ends, t)
+                return (self.ends[i],) + self.boxes[i]
+        x, y, _ = self.position(t)
+        if t < self.covered:
+            return t, x, x, y, y
+        return (FOREVER if self.end == 'static' else t), x, x, y, y
+
+    def entries(self, after, limit):
+        """Yield (tick, cell x, cell y) for each cell entered after tick `after`, up to `limit`."""
+        i = bisect_right(self.entry_ticks, after)
+        while True:
+            while i >= len(self.entry_ticks):
+                if self.end is not None or self.covered >= limit:
+                    return
+                self.extend(self.covered + 1)
+            tick = self.entry_ticks[i]
+            if tick > limit:
+                return
+            yield (tick,) + self.entry_cells[i]
+            i += 1
+
+class _Player:
+    __slots__ = ('entity', 'phase', 'track', 'before', 'timer', 'timer_tick', 'version', 'shown')
+
+class _Ghost:
+    __slots__ = ('entity', 'phase', 'track', 'before', 'vulnerable', 'timer', 'eaten', 'respawn', 'stuck', 'version',
+                 'shown')
+
+    def timers(self, t):
+        """(vulnerable timer, respawn timer) on tick t; Ghost.move counts down one or the other."""
+        elapsed = t - self.track.tick
+        if self.eaten:
+            return self.timer, self.respawn - elapsed
+        if self.vulnerable:
+            return self.timer - elapsed, self.respawn
+        return self.timer, self.respawn
+
+def _first_overlap(a: _Track, b: _Track, t, stop, radius):
+    """First tick from t to `stop` on which two tracks come closer than `radius` on both axes, or None."""
+    while t <= stop:
+        a_end, a_x0, a_x1, a_y0, a_y1 = a.span(t)
+        b_end, b_x0, b_x1, b_y0, b_y1 = b.span(t)
+        window = min(a_end, b_end, stop)
+        if a_x0 - b_x1 < radius and b_x0 - a_x1 < radius and a_y0 - b_y1 < radius and b_y0 - a_y1 < radius:
+            if a_end == b_end == FOREVER:
+                window = t  # Neither moves again, so the first tick decides
+            for tick in range(t, int(window) + 1):
+                a_x, a_y, _ = a.position(tick)
+                b_x, b_y, _ = b.position(tick)
+                if abs(a_x - b_x) < radius and abs(a_y - b_y) < radius:
+                    return tick
+            if window == t and a_end == b_end == FOREVER:
+                return None
+        t = window + 1
+    return None
+
+class _Simulation:
+    """Runs a game from its current tick to `end`, one event at a time."""
+
+    def __init__(self, state: GameState, end):
+        self.state = state
+        self.end = end
+        self.paths = paths = _paths_for(state)
+        self.radius = state.collision_radius
+        self.heap = []
+        self.order = itertools.count()
+        tick = state.tick
+
+        self.players = []
+        for phase, entity in enumerate(state.players):
+            player = _Player()
+            player.entity, player.phase, player.version = entity, phase, 0
+            player.track = _Track(paths, 'pacman', tick, (entity.x, entity.y, entity.direction_code),
+                                  entity.next_direction_code, static=not entity.alive)
+            player.before = (entity.prev_x, entity.prev_y)
+            player.timer, player.timer_tick = entity.power_pellet_timer, tick
+            player.shown = tick  # The tick the entity's own fields are up to date with
+            self.players.append(player)
+        self.ghosts = []
+        for phase, entity in enumerate(state.ghosts, len(self.players)):
+            ghost = _Ghost()
+            ghost.entity, ghost.phase, ghost.version = entity, phase, 0
+            ghost.before = (entity.prev_x, entity.prev_y)
+            self._anchor_ghost(ghost, tick, (entity.x, entity.y, entity.direction_code), entity.vulnerable,
+                               entity.vulnerable_timer, entity.eaten, entity.respawn_timer)
+            ghost.shown = tick
+            self.ghosts.append(ghost)
+
+    def run(self):
+        """Play every event up to `end`, or until the game is over, and write the result back to the state."""
+        start = self.state.tick + 1
+        for player in self.players:
+            if player.entity.alive:
+                # Whatever the player stands on is checked on the first tick, as in step
+                self._push(start, player.phase, MOVE, player)
+        for ghost in self.ghosts:
+            self._schedule_ghost(ghost, start, start - 1)
+
+        heap = self.heap
+        while heap:
+            tick, phase, kind, _, sim, version = heapq.heappop(heap)
+            if phase == END_PHASE:
+                if self.state.pellets_left == 0 or not any(player.entity.alive for player in self.players):
+                    self._finish(tick)
+                    return
+            elif version != sim.version:
+                continue
+            elif kind == CONTACT:
+                self._contact(sim, tick)
+            elif isinstance(sim, _Player):
+                self._player_moves(sim, tick)
+            else:
+                self._ghost_moves(sim, tick)
+        self._finish(self.end)
+
+    def _push(self, tick, phase, kind, sim):
+        if tick <= self.end:
+            heapq.heappush(self.heap, (tick, phase, kind, next(self.order), sim, sim.version if sim else 0))
+
+    def _end_of_tick(self, tick):
+        self._push(tick, END_PHASE, MOVE, None)
+
+    # Players
+
+    def _player_timer(self, player, t):
+        if not player.entity.alive:
+            return player.timer
+        return max(0, player.timer - (t - player.timer_tick))
+
+    def _materialize_player(self, player, t):
+        if player.shown == t:
+            return
+        player.shown = t
+        entity = player.entity
+        entity.x, entity.y, entity.direction_code = player.track.position(t)
+        entity.power_pellet_timer = self._player_timer(player, t)
+
+    def _player_moves(self, player, tick):
+        """Run Pacman.move for a tick on which the player may eat a pellet."""
+        state, entity = self.state, player.entity
+        self._materialize_player(player, tick - 1)
+        cell = self.paths._cell(*player.track.position(tick)[:2])
+        power = cell is not None and state.maze[cell[1]][cell[0]] == 3
+        if power:
+            for ghost in self.ghosts:
+                self._materialize_ghost(ghost, tick - 1)
+        entity.move(state.maze, state.ghosts, state)
+        player.timer, player.timer_tick = entity.power_pellet_timer, tick
+        player.shown = tick
+        if power:
+            # Scared ghosts take other paths from the tick before this one
+            for ghost in self.ghosts:
+                if not ghost.eaten:
+                    before = self._position_before(ghost, tick - 1)
+                    self._anchor_ghost(ghost, tick - 1, ghost.track.position(tick - 1), True,
+                                       ghost.entity.vulnerable_timer, False, ghost.respawn, before)
+                    self._schedule_ghost(ghost, tick, tick - 1)
+        if state.pellets_left == 0:
+            self._end_of_tick(tick)
+        self._schedule_player(player, tick)
+
+    def _schedule_player(self, player, tick):
+        """Queue the player's next entry into a cell that still holds a pellet."""
+        maze = self.state.maze
+        for entry_tick, cell_x, cell_y in player.track.entries(tick, self.end):
+            if maze[cell_y][cell_x] in (2, 3):
+                self._push(entry_tick, player.phase, MOVE, player)
+                return
+
+    # Ghosts
+
+    def _anchor_ghost(self, ghost, tick, position, vulnerable, timer, eaten, respawn, before=None, stuck=False):
+        """Start the ghost on a new track from its state on `tick`."""
+        ghost.vulnerable, ghost.timer, ghost.eaten, ghost.respawn = vulnerable, timer, eaten, respawn
+        ghost.track = _Track(self.paths, 'ghost', tick, position, vulnerable, static=eaten or stuck)
+        ghost.stuck = stuck
+        ghost.shown = None
+        if before is not None:
+            ghost.before = before
+
+    def _position_before(self, sim, tick):
+        """Position on tick - 1 of an entity about to be re-anchored on `tick`."""
+        if sim.track.tick <= tick - 1:
+            return sim.track.position(tick - 1)[:2]
+        return sim.before
+
+    def _materialize_ghost(self, ghost, t):
+        if ghost.shown == t:
+            return
+        ghost.shown = t
+        entity = ghost.entity
+        entity.x, entity.y, entity.direction_code = ghost.track.position(t)
+        entity.vulnerable, entity.eaten = ghost.vulnerable, ghost.eaten
+        entity.vulnerable_timer, entity.respawn_timer = ghost.timers(t)
+
+    def _next_ghost_move(self, ghost, moved):
+        """The next tick after `moved` that needs the real Ghost.move, or None if there is none before `end`."""
+        track, start = ghost.track, ghost.track.tick
+        if ghost.eaten:
+            move = start + max(ghost.respawn, 1)
+        elif ghost.stuck:
+            move = moved + 1
+        else:
+            move = start + max(ghost.timer, 1) if ghost.vulnerable else FOREVER
+            track.extend(min(move - 1, self.end))
+            if track.end == 'decision':
+                move = min(move, track.covered + 1)
+        return move if move <= self.end else None
+
+    def _schedule_ghost(self, ghost, contacts_from, moved):
+        """Queue the ghost's next real move after tick `moved` and its next collision from tick `contacts_from` on."""
+        ghost.version += 1
+        move = self._next_ghost_move(ghost, moved)
+        if move is not None:
+            self._push(move, ghost.phase, MOVE, ghost)
+        stop = min(self.end, move - 1) if move is not None else self.end
+        contact = None
+        for player in self.players:
+            if player.entity.alive:
+                hit = _first_overlap(ghost.track, player.track, contacts_from, stop, self.radius)
+                if hit is not None:
+                    contact = stop = hit
+        if contact is not None:
+            self._push(contact, ghost.phase, CONTACT, ghost)
+
+    def _ghost_moves(self, ghost, tick):
+        """Run Ghost.move for a tick on which the ghost decides, respawns or stops being scared."""
+        state = self.state
+        for player in self.players:
+            self._materialize_player(player, tick)
+        for other in self.ghosts:
+            self._materialize_ghost(other, tick if other.phase < ghost.phase else tick - 1)
+        entity = ghost.entity
+        before = (entity.x, entity.y)
+        entity.move(state.maze, state.pacman, state.ghosts, state.index, state.rng)
+        # A ghost that turned into a wall decides again next tick, so there is
+        # nothing to predict: check this tick's collision straight away
+        stuck = entity.x == before[0] and entity.y == before[1]
+        if stuck and ghost.stuck and not entity.eaten:
+            # Still stuck, as the ghosts spawned inside walls are all game: update it in place
+            track = ghost.track
+            track.tick, track.state = tick, (entity.x, entity.y, entity.direction_code)
+            ghost.vulnerable, ghost.timer, ghost.respawn = entity.vulnerable, entity.vulnerable_timer, entity.respawn_timer
+            ghost.before = before
+            ghost.shown = tick
+            radius = self.radius
+            for player in self.players:
+                if player.entity.alive:
+                    player_x, player_y, _ = player.track.position(tick)
+                    if abs(player_x - entity.x) < radius and abs(player_y - entity.y) < radius:
+                        self._contact(ghost, tick)
+                        return
+            self._push(tick + 1, ghost.phase, MOVE, ghost)
+            return
+        self._anchor_ghost(ghost, tick, (entity.x, entity.y, entity.direction_code), entity.vulnerable,
+                           entity.vulnerable_timer, entity.eaten, entity.respawn_timer, before, stuck)
+        ghost.shown = tick
+        if stuck:
+            self._contact(ghost, tick)
+        else:
+            self._schedule_ghost(ghost, tick, tick)
+
+    def _contact(self, ghost, tick):
+        """The collision check step runs after this ghost's move on `tick`."""
+        x, y, code = ghost.track.position(tick)
+        timer, respawn = ghost.timers(tick)
+        radius = self.radius
+        hit = False
+        for player in self.players:
+            entity = player.entity
+            if not entity.alive:
+                continue
+            player_x, player_y, _ = player.track.position(tick)
+            if abs(player_x - x) < radius and abs(player_y - y) < radius:
+                hit = True
+                if ghost.vulnerable:
+                    ghost.eaten = True
+                    entity.score += GHOST_POINTS
+                else:
+                    player.timer = self._player_timer(player, tick)
+                    entity.alive = False
+                    player.before = self._position_before(player, tick)
+                    player.track = _Track(self.paths, 'pacman', tick, player.track.position(tick), static=True)
+                    player.version += 1
+                    player.shown = None
+                    self._end_of_tick(tick)
+        if hit:
+            self._anchor_ghost(ghost, tick, (x, y, code), ghost.vulnerable, timer, ghost.eaten, respawn,
+                               self._position_before(ghost, tick))
+        self._schedule_ghost(ghost, tick + 1, tick)
+
+    def _finish(self, tick):
+        """Write every entity's state on `tick` back to the game."""
+        state = self.state
+        for player in self.players:
+            self._materialize_player(player, tick)
+            player.entity.prev_x, player.entity.prev_y = self._position_before(player, tick)
+        for ghost in self.ghosts:
+            self._materialize_ghost(ghost, tick)
+            ghost.entity.prev_x, ghost.entity.prev_y = self._position_before(ghost, tick)
+        state.tick = tick
+        state.won = state.pellets_left == 0
+        if state.won or not any(player.alive for player in state.players):
+            state.game_over = True
+        for player in state.players:
+            state.player_cells.move(player)
+        state.ghost_cells_tick = -1  # Refile the ghosts when next asked
+
+def can_fast_forward(state: GameState) -> bool:
+    """Whether `fast_forward` can skip ticks of this game rather than step through them."""
+    return (state.recorder is None and state.profiler is None and not state.debug and
+            all(type(player).move is Pacman.move for player in state.players) and
+            all(type(ghost).move is Ghost.move for ghost in state.ghosts))
+
+def fast_forward(state: GameState, ticks, inputs=()) -> bool:
+    """Play up to `ticks` ticks holding `inputs`, exactly as that many `state.step(inputs)` calls would.
+
+    Returns True while the game is still running, like `step`.
+    """
+    if state.game_over:
+        return False
+    if ticks <= 0:
+        return True
+    if ticks < MIN_TICKS or not can_fast_forward(state):
+        for _ in range(ticks):
+            if not state.step(inputs):
+                return False
+        return True
+    for player, direction in zip(state.players, inputs):
+        if direction is not None:
+            player.next_direction = direction
+    _Simulation(state, state.tick + ticks).run()
+    return not state.game_over
@@ -0,0 +1,197 @@
+"""Load test for server.py: fills a server with rooms of bot players and measures what they receive.
+
+Each bot joins a room, turns a random way every so often, restarts its
+room's game when it ends, and applies every STATE message to its own copy
+of the game as a real client would. A server that keeps up delivers
+`tick_rate` states a second to every bot with gaps close to one tick;
+one that falls behind shows it as a lower rate and long gaps.
+
+    python loadtest.py --rooms 300 --duration 20
+
+starts a server in a child process and runs 300 two player rooms against
+it, with the bots spread over the other cores; pass --connect HOST:PORT
+to load an already running server instead.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+from typing import List
+
+from pacman import DEFAULT_LAYOUT, DIRECTIONS, MULTI_PLAYER, SIM_RATE, SINGLE_PLAYER, GameState
+from profiling import percentile
+from server import (DEFAULT_PORT, ERROR, INPUT, JOIN, RESTART, STATE, WELCOME, WELCOME_BODY, StateDecoder, frame,
+                    read_frame)
+from server import main as server_main
+
+TURN_INTERVAL = 0.5  # Mean seconds between a bot's direction changes
+
+class Bot:
+    """One simulated player and what it received."""
+
+    def __init__(self, room, mode, seed):
+        self.room = room
+        self.mode = mode
+        self.rng = random.Random(seed)
+        self.states = 0
+        self.bytes = 0
+        self.gaps = []
+        self.error = None
+        self.state = None
+        self.tick_rate = 0
+
+    async def run(self, host, port, start, end):
+        """Play from `start` until `end` (loop times); only states after `start` count."""
+        loop = asyncio.get_running_loop()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(frame(JOIN, bytes([self.mode]) + self.room.encode()))
+            message_type, body = await read_frame(reader)
+            if message_type != WELCOME:
+                raise ConnectionError(body.decode('utf-8', 'replace') if message_type == ERROR else 'no WELCOME')
+            slot, mode, self.tick_rate, maze_id = WELCOME_BODY.unpack(body)
+            self.state = GameState(mode, layout=DEFAULT_LAYOUT)
+            decoder = StateDecoder(self.state)
+            next_turn = loop.time() + self.rng.expovariate(1 / TURN_INTERVAL)
+            last = None
+            while True:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    message_type, body = await asyncio.wait_for(read_frame(reader), remaining)
+                except asyncio.TimeoutError:
+                    break
+                now = loop.time()
+                if message_type == ERROR:
+                    raise ConnectionError(body.decode('utf-8', 'replace'))
+                if message_type != STATE:
+                    continue
+                decoder.apply(body)
+                if now >= start:
+                    self.states += 1
+                    self.bytes += len(body) + 5
+                    if last is not None:
+                        self.gaps.append(now - last)
+                    last = now
+                if self.state.game_over:
+                    writer.write(frame(RESTART))
+                elif now >= next_turn:
+                    writer.write(frame(INPUT, bytes([self.rng.randrange(1, len(DIRECTIONS))])))
+                    next_turn = now + self.rng.expovariate(1 / TURN_INTERVAL)
+        except (ConnectionError, asyncio.IncompleteReadError) as error:
+            self.error = str(error) or type(error).__name__
+        finally:
+            if writer is not None:
+                writer.close()
+
+async def run_bots(host, port, rooms, duration, mode=MULTI_PLAYER, warmup=2.0, first_room=0) -> List[Bot]:
+    """Fill rooms `first_room` onwards with bots and play for `warmup` + `duration` seconds."""
+    loop = asyncio.get_running_loop()
+    players = 2 if mode == MULTI_PLAYER else 1
+    bots = [Bot(f'load-{room}', mode, room * players + player)
+            for room in range(first_room, first_room + rooms) for player in range(players)]
+    start = loop.time() + warmup
+    await asyncio.gather(*(bot.run(host, port, start, start + duration) for bot in bots))
+    return bots
+
+def _bot_process(task):
+    bots = asyncio.run(run_bots(*task))
+    return [(bot.states, bot.bytes, bot.gaps, bot.error, bot.tick_rate) for bot in bots]
+
+def load_test(host, port, rooms, duration, mode=MULTI_PLAYER, processes=1, warmup=2.0) -> dict:
+    """Run `rooms` rooms of bots, split over `processes` processes, and summarize what they received.
+
+    One process can decode only so many states a second; spread the bots
+    out so that the server, not the bots, is what the test measures.
+    """
+    shares = [rooms // processes + (number < rooms % processes) for number in range(processes)]
+    tasks = [(host, port, share, duration, mode, warmup, sum(shares[:number]))
+             for number, share in enumerate(shares) if share]
+    if len(tasks) == 1:
+        bots = _bot_process(tasks[0])
+    else:
+        with multiprocessing.Pool(len(tasks)) as pool:
+            bots = [bot for chunk in pool.map(_bot_process, tasks) for bot in chunk]
+
+    gaps = sorted(gap for _, _, bot_gaps, _, _ in bots for gap in bot_gaps)
+    rates = [states / duration for states, _, _, _, _ in bots]
+    return {
+        'rooms': rooms,
+        'clients': len(bots),
+        'errors': [error for _, _, _, error, _ in bots if error],
+        'expected_rate': max(tick_rate for _, _, _, _, tick_rate in bots),
+        'mean_rate': sum(rates) / len(rates),
+        'min_rate': min(rates),
+        'gap_p50_ms': 1000 * percentile(gaps, 0.5),
+        'gap_p99_ms': 1000 * percentile(gaps, 0.99),
+        'gap_max_ms': 1000 * (gaps[-1] if gaps else 0.0),
+        'bytes_per_client_per_sec': sum(received for _, received, _, _, _ in bots) / len(bots) / duration,
+    }
+
+def format_report(report) -> str:
+    lines = [f'{report["rooms"]} rooms, {report["clients"]} clients, {len(report["errors"])} errors',
+             f'states/s per client: mean {report["mean_rate"]:.1f}, min {report["min_rate"]:.1f} '
+             f'(tick rate {report["expected_rate"]})',
+             f'gap between states: p50 {report["gap_p50_ms"]:.1f} ms, p99 {report["gap_p99_ms"]:.1f} ms, '
+             f'max {report["gap_max_ms"]:.1f} ms',
+             f'{report["bytes_per_client_per_sec"] / 1024:.1f} KiB/s per client']
+    if report['errors']:
+        lines.append(f'first error: {report["errors"][0]}')
+    return '\n'.join(lines)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1.0).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Load test a Pacman game server with bot players.')
+    parser.add_argument('--rooms', type=int, default=100, help='rooms to fill with bots (default: 100)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to measure for (default: 10)')
+    parser.add_argument('--single', action='store_true', help='one player rooms instead of two player ones')
+    parser.add_argument('--tick-rate', type=int, default=SIM_RATE,
+                        help=f'tick rate of the server started for the test (default: {SIM_RATE})')
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help='load this running server instead of starting one')
+    parser.add_argument('--processes', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help='processes to run the bots in (default: one per core but one, for the server)')
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.connect:
+        host, _, port = args.connect.partition(':')
+        port = int(port or DEFAULT_PORT)
+    else:
+        host, port = '127.0.0.1', free_port()
+        process = multiprocessing.Process(target=server_main, args=(['--port', str(port), '--tick-rate',
+                                                                      str(args.tick_rate), '--stats', '5'],))
+        process.start()
+        wait_for_server(host, port)
+    try:
+        report = load_test(host, port, args.rooms, args.duration, SINGLE_PLAYER if args.single else MULTI_PLAYER,
+                           args.processes)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+    print(format_report(report))
+    return 1 if report['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
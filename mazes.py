@@ -0,0 +1,184 @@
+"""Maze files: loading, validating and writing custom layouts.
+
+A maze file is a few `key: value` header lines followed by the grid:
+
+    # Comments start with '#' in the header
+    name: Classic
+    size: 19 19                    columns, rows
+    pacman: 9 11                   Pacman's spawn cell
+    ms_pacman: 9 11                optional, defaults to Pacman's
+    ghosts: 9 8, 8 8, 10 8, 9 9    Blinky, Pinky, Inky and Clyde
+    house: 9 8                     where eaten ghosts respawn
+    grid:
+    %%%%%%%%%%%%%%%%%%%
+    %........%........%
+    ...
+
+Grid characters are '%' wall, '.' dot, 'o' power pellet, ' ' empty and
+'=' tunnel. Tunnels go in pairs at the two ends of a row and wrap Pacman
+and the ghosts around to the other side; any number of rows may have one.
+Lines shorter than the declared width are padded with empty cells.
+"""
+from pacman import GHOST_NAMES, MazeLayout, count_pellets, get_maze_index, ghost_moves
+
+MAX_MAZE_SIDE = 512
+CELL_CHARS = {'%': 1, '.': 2, 'o': 3, ' ': 0, '=': 4}
+CHAR_CELLS = {cell: char for char, cell in CELL_CHARS.items()}
+HEADER_KEYS = ['name', 'size', 'pacman', 'ms_pacman', 'ghosts', 'house']
+
+class MazeFormatError(ValueError):
+    """A maze file that cannot be parsed or describes an unplayable layout."""
+
+def _parse_cells(value, line_number):
+    """Parse 'x y, x y, ...' into a list of (x, y) tuples."""
+    cells = []
+    for part in value.split(','):
+        numbers = part.split()
+        if len(numbers) != 2 or not all(number.lstrip('-').isdigit() for number in numbers):
+            raise MazeFormatError(f'line {line_number}: expected "x y" coordinates, got {part.strip()!r}')
+        cells.append((int(numbers[0]), int(numbers[1])))
+    return cells
+
+def parse_maze(text: str) -> MazeLayout:
+    """Build a validated MazeLayout from the text of a maze file."""
+    lines = text.splitlines()
+    header = {}
+    grid_start = None
+    for line_number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        key, separator, value = stripped.partition(':')
+        key = key.strip()
+        if not separator:
+            raise MazeFormatError(f'line {line_number}: expected "key: value", got {stripped!r}')
+        if key == 'grid':
+            grid_start = line_number
+            break
+        if key not in HEADER_KEYS:
+            raise MazeFormatError(f'line {line_number}: unknown key {key!r}')
+        header[key] = (value.strip(), line_number)
+    if grid_start is None:
+        raise MazeFormatError('missing "grid:" section')
+    for key in ['size', 'pacman', 'ghosts', 'house']:
+        if key not in header:
+            raise MazeFormatError(f'missing "{key}:" line')
+
+    size = _parse_cells(*header['size'])
+    if len(size) != 1:
+        raise MazeFormatError(f'line {header["size"][1]}: size takes one "columns rows" pair')
+    cols, rows = size[0]
+    if not (3 <= cols <= MAX_MAZE_SIDE and 3 <= rows <= MAX_MAZE_SIDE):
+        raise MazeFormatError(f'size {cols}x{rows} is outside 3x3 to {MAX_MAZE_SIDE}x{MAX_MAZE_SIDE}')
+
+    grid_lines = lines[grid_start:]
+    while grid_lines and not grid_lines[-1].strip():
+        grid_lines.pop()
+    if len(grid_lines) != rows:
+        raise MazeFormatError(f'grid has {len(grid_lines)} rows, size declares {rows}')
+    grid = []
+    for y, line in enumerate(grid_lines):
+        line_number = grid_start + 1 + y
+        if len(line) > cols:
+            raise MazeFormatError(f'line {line_number}: row is {len(line)} cells wide, size declares {cols}')
+        row = []
+        for x, char in enumerate(line.ljust(cols)):
+            if char not in CELL_CHARS:
+                raise MazeFormatError(f'line {line_number}: unknown cell {char!r} at column {x}')
+            row.append(CELL_CHARS[char])
+        grid.append(row)
+
+    pacman = _parse_cells(*header['pacman'])[0]
+    ms_pacman = _parse_cells(*header['ms_pacman'])[0] if 'ms_pacman' in header else None
+    layout = MazeLayout(grid, pacman, ms_pacman, _parse_cells(*header['ghosts']),
+                        _parse_cells(*header['house'])[0], header.get('name', ('Custom', 0))[0])
+    validate_layout(layout)
+    return layout
+
+def validate_layout(layout: MazeLayout):
+    """Raise MazeFormatError unless the layout is a well-formed, fully connected maze."""
+    grid, cols, rows = layout.grid, layout.cols, layout.rows
+    if any(len(row) != cols for row in grid):
+        raise MazeFormatError('grid rows differ in width')
+    if len(layout.ghost_spawns) != len(GHOST_NAMES):
+        raise MazeFormatError(f'expected {len(GHOST_NAMES)} ghost spawns, got {len(layout.ghost_spawns)}')
+
+    spawns = [('pacman', layout.pacman_spawn), ('ms_pacman', layout.ms_pacman_spawn),
+              ('house', layout.ghost_house)] + list(zip(GHOST_NAMES, layout.ghost_spawns))
+    for name, (x, y) in spawns:
+        if not (0 <= x < cols and 0 <= y < rows):
+            raise MazeFormatError(f'{name} spawn ({x}, {y}) is outside the {cols}x{rows} grid')
+        if grid[y][x] == 4 or (grid[y][x] == 1 and name not in GHOST_NAMES):
+            raise MazeFormatError(f'{name} spawn ({x}, {y}) is on a wall or tunnel cell')
+        # Ghosts may start inside the house walls, as in the classic maze, if they can step out
+        if grid[y][x] == 1 and not ghost_moves(grid, (x, y)):
+            raise MazeFormatError(f'{name} spawn ({x}, {y}) is walled in')
+
+    for y, row in enumerate(grid):
+        tunnels = [x for x, cell in enumerate(row) if cell == 4]
+        if tunnels and tunnels != [0, cols - 1]:
+            raise MazeFormatError(f'row {y}: tunnels must come in pairs at both ends of the row')
+        if tunnels and (row[1] == 1 or row[cols - 2] == 1):
+            raise MazeFormatError(f'row {y}: tunnel mouths must open into the maze')
+
+    if count_pellets(grid) == 0:
+        raise MazeFormatError('maze has no dots or power pellets')
+
+    # Everything must be reachable from Pacman's spawn, tunnels included
+    index = get_maze_index(grid)
+    start = index.cell(*layout.pacman_spawn)
+    reached = bytearray(index.size)
+    reached[start] = 1
+    frontier = [start]
+    while frontier:
+        cell = frontier.pop()
+        for next_cell in index.neighbors[cell]:
+            if not reached[next_cell]:
+                reached[next_cell] = 1
+                frontier.append(next_cell)
+    for name, (x, y) in spawns:
+        if grid[y][x] != 1 and not reached[index.cell(x, y)]:
+            raise MazeFormatError(f'{name} spawn ({x}, {y}) cannot be reached from Pacman')
+    unreachable = [(x, y) for (x, y) in index.coords if grid[y][x] in (2, 3) and not reached[index.cell(x, y)]]
+    if unreachable:
+        raise MazeFormatError(f'{len(unreachable)} pellet(s) cannot be reached from Pacman, '
+                              f'e.g. {unreachable[0]}')
+
+def load_maze(path) -> MazeLayout:
+    """Read and validate a maze file."""
+    with open(path) as f:
+        return parse_maze(f.read())
+
+def format_maze(layout: MazeLayout) -> str:
+    """The maze file text for a layout; parse_maze reads it back."""
+    def cells(*points):
+        return ', '.join(f'{x} {y}' for x, y in points)
+    lines = [f'name: {layout.name}',
+             f'size: {layout.cols} {layout.rows}',
+             f'pacman: {cells(layout.pacman_spawn)}',
+             f'ms_pacman: {cells(layout.ms_pacman_spawn)}',
+             f'ghosts: {cells(*layout.ghost_spawns)}',
+             f'house: {cells(layout.ghost_house)}',
+             'grid:']
+    lines.extend(''.join(CHAR_CELLS[cell] for cell in row) for row in layout.grid)
+    return '\n'.join(lines) + '\n'
+
+def corridor_maze(cols, rows, tunnel_rows=(), name='Corridors') -> MazeLayout:
+    """A generated cols x rows layout of dotted corridors around square wall blocks.
+
+    Both sides must be odd. Pacman starts in the middle, the ghosts just
+    above, and each of `tunnel_rows` (odd rows) wraps around.
+    """
+    grid = [[1 if x in (0, cols - 1) or y in (0, rows - 1) or (x % 2 == 0 and y % 2 == 0) else 2
+             for x in range(cols)] for y in range(rows)]
+    for y in tunnel_rows:
+        grid[y][0] = grid[y][cols - 1] = 4
+    for x, y in [(1, 1), (cols - 2, 1), (1, rows - 2), (cols - 2, rows - 2)]:
+        grid[y][x] = 3
+    center_x, center_y = cols // 2 | 1, rows // 2 | 1
+    pacman = (center_x, center_y)
+    ghosts = [(center_x, center_y - 4), (center_x - 1, center_y - 4), (center_x + 1, center_y - 4),
+              (center_x, center_y - 3)]
+    for x, y in [pacman] + ghosts:
+        grid[y][x] = 0
+    return MazeLayout(grid, pacman, None, ghosts, ghosts[0], name)
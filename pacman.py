@@ -1,22 +1,53 @@
-import pygame
+import argparse
+import hashlib
+import heapq
+import importlib.util
 import random
+import struct
+import sys
+import time
+from array import array
+from operator import attrgetter
 from typing import List, Tuple
 from collections import deque
 
-# Initialize Pygame
-pygame.init()
+def lazy_import(name):
+    """Import a module whose body only runs on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# Pygame is only loaded when something draws, so headless users of the
+# maze, pathfinding and GameState never pay for SDL startup
+pygame = lazy_import('pygame')
 
 # Constants
 CELL_SIZE = 40
 COLS = 19
 ROWS = 19
 WINDOW_WIDTH = CELL_SIZE * COLS
-WINDOW_HEIGHT = CELL_SIZE * ROWS + 60
+HUD_HEIGHT = 60
+WINDOW_HEIGHT = CELL_SIZE * ROWS + HUD_HEIGHT
 FPS = 45
+SIM_RATE = FPS  # Simulation ticks per second; speeds and timers are per tick
+MAX_CATCH_UP_TICKS = 5
 PACMAN_SPEED = 0.2
 GHOST_SPEED = 0.18
 POWER_PELLET_DURATION = 10 * FPS
+VULNERABLE_DURATION = 7 * FPS
 GHOST_POINTS = 200
+COLLISION_RADIUS = 0.5  # Pacman and a ghost meet when this close on both axes
+SPATIAL_HASH_SCAN_SIZE = 8
+FLOW_FIELD_CACHE_SIZE = 64
+MAZE_INDEX_CACHE_SIZE = 16
+ALL_PAIRS_MAX_CELLS = 1024
+TEXT_CACHE_SIZE = 256
 
 # Colors
 BLACK = (0, 0, 0)
@@ -27,6 +58,25 @@ PINK = (255, 192, 203)
 RED = (255, 0, 0)
 VULNERABLE_GHOST_COLOR = (0, 0, 255)
 BLINKING_GHOST_COLOR = (255, 255, 255)
+GHOST_COLORS = [(255, 0, 0), (255, 192, 203), (0, 255, 255), (255, 165, 0)]
+
+# Movement directions; an entity's index in this table is its direction code.
+# After standing still they follow the order ghosts try their moves in.
+DIRECTIONS = [(0, 0), (0, 1), (0, -1), (1, 0), (-1, 0)]
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+OPPOSITE_CODES = [DIRECTION_CODES[(-dx, -dy)] for dx, dy in DIRECTIONS]
+
+# Exit masks hold one bit per direction code 1-4; EXIT_MOVES lists the
+# directions set in each mask, in the order ghosts try them
+EXIT_BITS = [0, 1, 2, 4, 8]
+EXIT_MOVES = [tuple(code for code in range(1, 5) if mask & EXIT_BITS[code]) for mask in range(16)]
+GHOST_MOVE_CODES = EXIT_MOVES[15]
+
+# Ghost starting cells, in the order ghosts move each tick
+GHOST_NAMES = ["blinky", "pinky", "inky", "clyde"]
+GHOST_POSITIONS = [(9, 8), (8, 8), (10, 8), (9, 9)]
+GHOST_HOUSE = (9, 8)
+PACMAN_SPAWN = (9, 11)
 
 # Game States
 MENU = 0
@@ -34,11 +84,6 @@ SINGLE_PLAYER = 1
 MULTI_PLAYER = 2
 GAME_OVER = 3
 
-# Create the game window
-screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-pygame.display.set_caption('Pacman')
-clock = pygame.time.Clock()
-
 # Game maze (0: empty path, 1: wall, 2: dot, 3: power pellet, 4: tunnel)
 MAZE = [
     [1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1],
@@ -62,49 +107,647 @@ MAZE = [
     [1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1,1]
 ]
 
-def find_path(maze: List[List[int]], start: Tuple[int, int], target: Tuple[int, int]) -> List[Tuple[int, int]]:
-    """Find path using BFS algorithm."""
-    queue = deque([(start, [start])])
-    visited = {start}
-    
-    while queue:
-        (x, y), path = queue.popleft()
+def nearest(x, _round=float.__round__, _float=float) -> int:
+    """round(x) for the int and float coordinates entities have.
+
+    Calling float.__round__ directly skips the bound method that round()
+    creates on every call, which movement code would otherwise pay several times a tick.
+    """
+    if x.__class__ is _float:
+        return _round(x)
+    return x if x.__class__ is int else round(x)
+
+def probe_move(maze, x, y, direction, radius=0.35) -> bool:
+    """Whether a Pacman at (x, y) has room to step in `direction` without touching a wall."""
+    test_x = x + direction[0] * PACMAN_SPEED
+    test_y = y + direction[1] * PACMAN_SPEED
+    cols, rows = len(maze[0]), len(maze)
+
+    # The center and the four points `radius` out from it, tested one by one
+    # rather than gathered into a list, since this runs every tick Pacman is between cells
+    return not (_wall_at(maze, test_x, test_y, cols, rows) or
+                _wall_at(maze, test_x - radius, test_y, cols, rows) or  # Left
+                _wall_at(maze, test_x + radius, test_y, cols, rows) or  # Right
+                _wall_at(maze, test_x, test_y - radius, cols, rows) or  # Top
+                _wall_at(maze, test_x, test_y + radius, cols, rows))    # Bottom
+
+def _wall_at(maze, x, y, cols, rows) -> bool:
+    """Whether the point (x, y) rounds to a wall cell; points off the maze are open."""
+    cell_x = nearest(x)
+    cell_y = nearest(y)
+    return 0 <= cell_x < cols and 0 <= cell_y < rows and maze[cell_y][cell_x] == 1
+
+def is_tunnel_row(maze, y) -> bool:
+    """Whether row y wraps around, which it does when both its ends are tunnel cells."""
+    return maze[y][0] == 4
+
+def ghost_moves(maze, current_pos) -> List[Tuple[int, int]]:
+    """Directions a ghost standing on current_pos could turn into."""
+    x, y = current_pos
+    cols, rows = len(maze[0]), len(maze)
+    tunnel = is_tunnel_row(maze, int(y))
+    valid_moves = []
+    for code in GHOST_MOVE_CODES:
+        direction = DIRECTIONS[code]
+        new_x = x + direction[0]
+        new_y = y + direction[1]
         
-        if (x, y) == target:
-            return path
-            
+        # Handle tunnel wrapping
+        if tunnel:
+            if new_x < 0:
+                new_x = cols - 1
+            elif new_x >= cols:
+                new_x = 0
+        
+        # Check if move is valid
+        if (0 <= new_x < cols or tunnel) and 0 <= new_y < rows:
+            if maze[new_y][int(new_x % cols)] != 1:  # Use modulo for x position
+                valid_moves.append(direction)
+    return valid_moves
+
+class MazeIndex:
+    """Tunnel-aware distance and next-hop tables for one maze layout.
+
+    Cells are numbered `y * cols + x`. Walls never change during a game, so
+    the tables are built once per layout (see `get_maze_index`) and path,
+    distance and first-step queries afterwards are plain table lookups.
+    Layouts over ALL_PAIRS_MAX_CELLS cells would need tables too big to
+    build up front, so their queries search the maze's JunctionGraph instead.
+
+    The same goes for movement rules: `exits` holds each cell's ghost exit
+    mask, `pacman_exits` the directions Pacman has room to leave the cell
+    center in, and `exit_cells` the cell each exit leads to, tunnel wrap
+    included, at `cell * 5 + direction code`.
+
+    With all-pairs tables, the turn a chasing ghost takes is precomputed
+    too: `decisions` holds a row for each cell and exit mask a ghost can
+    choose between, with a byte per open target cell giving the direction
+    code that brings it closest, so `decision` is two table reads. Rows
+    cover open cells and the walls of tunnel rows, which ghosts can pass
+    through; anywhere else ghosts score their exits on a flow field, and on
+    larger mazes by searching the JunctionGraph from their target.
+    """
+
+    def __init__(self, maze: List[List[int]]):
+        self.rows = len(maze)
+        self.cols = len(maze[0])
+        self.size = self.rows * self.cols
+        self.typecode = 'h' if self.size <= 0x7fff else 'i'
+        self.coords = [(x, y) for y in range(self.rows) for x in range(self.cols)]
+        self.neighbors = [self._neighbors(maze, x, y) for x, y in self.coords]
+        self.nearest_open = self._nearest_open(maze)
+        self._flow_fields = {}
+        self._graph = None
+
+        self.walls = walls = bytearray(maze[y][x] == 1 for x, y in self.coords)
+        self.exits = bytearray(self.size)
+        self.pacman_exits = bytearray(self.size)
+        self.exit_cells = array(self.typecode, [-1]) * (self.size * 5)
+        cols, rows = self.cols, self.rows
+        for cell, (x, y) in enumerate(self.coords):
+            tunnel = is_tunnel_row(maze, y)
+            for code in range(1, 5):
+                dx, dy = DIRECTIONS[code]
+                next_x, next_y = x + dx, y + dy
+                # From a cell center, probe_move only ever touches this cell and the next
+                inside = 0 <= next_x < cols and 0 <= next_y < rows
+                if not walls[cell] and not (inside and walls[next_y * cols + next_x]):
+                    self.pacman_exits[cell] |= EXIT_BITS[code]
+                # Ghosts follow ghost_moves, wrapping along tunnel rows
+                if tunnel:
+                    next_x %= cols
+                if 0 <= next_x < cols and 0 <= next_y < rows and not walls[next_y * cols + next_x]:
+                    self.exits[cell] |= EXIT_BITS[code]
+                    self.exit_cells[cell * 5 + code] = next_y * cols + next_x
+
+        # Row `start` of each table holds the BFS results from that cell
+        self.distances = self.parents = self.next_hops = None
+        if self.size <= ALL_PAIRS_MAX_CELLS:
+            table_size = self.size * self.size
+            self.distances = array(self.typecode, [-1]) * table_size
+            self.parents = array(self.typecode, [-1]) * table_size
+            self.next_hops = array(self.typecode, [-1]) * table_size
+            for start in range(self.size):
+                self._search(start, self.distances, self.parents, self.next_hops, start * self.size)
+            rows = memoryview(self.distances)
+            self._distance_rows = [rows[start * self.size:(start + 1) * self.size] for start in range(self.size)]
+
+        self.decisions = self.decision_offsets = self.target_slots = None
+        if self.distances is not None:
+            self._build_decisions(maze)
+
+    def _build_decisions(self, maze):
+        """Fill `decisions`, a row per (cell, exit mask) of the moves Ghost.move picks towards each target."""
+        size = self.size
+        targets = [cell for cell in range(size) if not self.walls[cell]]
+        self.target_slots = array(self.typecode, [-1]) * size
+        for slot, cell in enumerate(targets):
+            self.target_slots[cell] = slot
+
+        # Steps from each cell a ghost could move into to every target, read from the target's
+        # row as flow_field would, with unreachable cells worse than any path
+        steps = {}
+        def steps_from(cell):
+            if cell not in steps:
+                distances = self.distances
+                steps[cell] = [distances[target * size + cell] if distances[target * size + cell] >= 0 else size
+                               for target in targets]
+            return steps[cell]
+
+        self.decision_offsets = array('i', [-1]) * (size * 16)
+        rows = []
+        for cell in range(size):
+            exits = self.exits[cell]
+            if self.walls[cell] and not is_tunnel_row(maze, cell // self.cols):
+                continue
+            # Every exit mask left once the reverse of the ghost's heading is dropped
+            masks = {exits}
+            for code in EXIT_MOVES[exits]:
+                if exits != EXIT_BITS[code]:
+                    masks.add(exits ^ EXIT_BITS[code])
+            for mask in masks:
+                moves = EXIT_MOVES[mask]
+                if len(moves) < 2:
+                    continue
+                # The first of equally close moves wins, as in Ghost.move
+                best = steps_from(self.exit_cells[cell * 5 + moves[0]])
+                row = bytes([moves[0]]) * len(targets)
+                for code in moves[1:]:
+                    other = steps_from(self.exit_cells[cell * 5 + code])
+                    row = bytes([code if step < closest else move for move, closest, step in zip(row, best, other)])
+                    if code != moves[-1]:
+                        best = [step if step < closest else closest for closest, step in zip(best, other)]
+                self.decision_offsets[cell * 16 + mask] = len(rows) * len(targets)
+                rows.append(row)
+        self.decisions = b''.join(rows)
+
+    def _neighbors(self, maze, x, y):
+        """Cells one step away from (x, y), in the order the BFS visits them."""
+        cells = []
         for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
             next_x, next_y = x + dx, y + dy
             
             # Handle tunnel wrapping
-            if y == 8 and maze[y][x] == 4:  
-                if next_x < 0:
-                    next_x = COLS - 1
-                elif next_x >= COLS:
-                    next_x = 0
+            if maze[y][x] == 4:
+                next_x %= self.cols
             
-            if (0 <= next_x < COLS and 0 <= next_y < ROWS and 
-                maze[next_y][next_x] != 1 and 
-                (next_x, next_y) not in visited):
-                queue.append(((next_x, next_y), path + [(next_x, next_y)]))
-                visited.add((next_x, next_y))
-    
-    return []  
+            if (0 <= next_x < self.cols and 0 <= next_y < self.rows and
+                maze[next_y][next_x] != 1):
+                cells.append(next_y * self.cols + next_x)
+        return tuple(cells)
+
+    def _nearest_open(self, maze):
+        """For each cell, the closest non-wall cell (itself if it is open)."""
+        nearest = array(self.typecode, [-1]) * self.size
+        queue = deque()
+        for cell, (x, y) in enumerate(self.coords):
+            if maze[y][x] != 1:
+                nearest[cell] = cell
+                queue.append(cell)
+        # Spread outwards through the walls, ignoring tunnels
+        while queue:
+            cell = queue.popleft()
+            x, y = self.coords[cell]
+            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+                next_cell = self.cell(x + dx, y + dy)
+                if next_cell >= 0 and nearest[next_cell] < 0:
+                    nearest[next_cell] = nearest[cell]
+                    queue.append(next_cell)
+        return nearest
+
+    def _search(self, start, distances, parents, next_hops, base):
+        """Fill the distance, parent and next-hop rows for one start cell, starting at `base`."""
+        distances[base + start] = 0
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            distance = distances[base + cell] + 1
+            hop = next_hops[base + cell]
+            for next_cell in self.neighbors[cell]:
+                if distances[base + next_cell] < 0:
+                    distances[base + next_cell] = distance
+                    parents[base + next_cell] = cell
+                    next_hops[base + next_cell] = next_cell if cell == start else hop
+                    queue.append(next_cell)
+
+    @property
+    def graph(self) -> 'JunctionGraph':
+        """The maze compiled into junctions and corridors, built on first use."""
+        if self._graph is None:
+            self._graph = JunctionGraph(self)
+        return self._graph
+
+    def cell(self, x, y) -> int:
+        """Cell number of (x, y), or -1 if it lies outside the maze."""
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            return y * self.cols + x
+        return -1
+
+    def can_move(self, maze, x, y, code) -> bool:
+        """probe_move in direction `code`, read from the exit tables when (x, y) is a cell center."""
+        cell_x, cell_y = int(x), int(y)
+        if cell_x == x and cell_y == y and 0 <= cell_x < self.cols and 0 <= cell_y < self.rows:
+            cell = cell_y * self.cols + cell_x
+            if not code:
+                return not self.walls[cell]
+            return self.pacman_exits[cell] & EXIT_BITS[code] != 0
+        return probe_move(maze, x, y, DIRECTIONS[code])
+
+    def decision(self, cell: int, moves: int, target: Tuple[int, int]) -> int:
+        """Direction code a chasing ghost on `cell`, free to leave by exit mask `moves`, takes towards target.
+
+        0 when the decision table has no row for them.
+        """
+        if self.decisions is None:
+            return 0
+        offset = self.decision_offsets[cell * 16 + moves]
+        if offset < 0:
+            return 0
+        return self.decisions[offset + self.target_slots[self.target_cell(target)]]
+
+    def distance(self, start: Tuple[int, int], target: Tuple[int, int]) -> int:
+        """Number of steps from start to target, or -1 if it is unreachable."""
+        start_cell, target_cell = self.cell(*start), self.cell(*target)
+        if start_cell < 0 or target_cell < 0:
+            return -1
+        if self.distances is None:
+            return self.graph.distance(start_cell, target_cell)
+        return self.distances[start_cell * self.size + target_cell]
+
+    def next_step(self, start: Tuple[int, int], target: Tuple[int, int]):
+        """First cell to move to from start towards target, or None if there is none."""
+        start_cell, target_cell = self.cell(*start), self.cell(*target)
+        if start_cell < 0 or target_cell < 0:
+            return None
+        if self.distances is None:
+            route = self.graph.route(start_cell, target_cell)
+            return self.coords[route[1]] if route and len(route) > 1 else None
+        hop = self.next_hops[start_cell * self.size + target_cell]
+        return self.coords[hop] if hop >= 0 else None
+
+    def path(self, start: Tuple[int, int], target: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Shortest path from start to target inclusive, or [] if it is unreachable."""
+        if start == target:
+            return [start]
+        start_cell, target_cell = self.cell(*start), self.cell(*target)
+        if start_cell < 0 or target_cell < 0:
+            return []
+        if self.distances is None:
+            route = self.graph.route(start_cell, target_cell)
+            return [self.coords[cell] for cell in route] if route else []
+        base = start_cell * self.size
+        if self.distances[base + target_cell] < 0:
+            return []
+        path = [target]
+        cell = self.parents[base + target_cell]
+        while cell != start_cell:
+            path.append(self.coords[cell])
+            cell = self.parents[base + cell]
+        path.append(start)
+        path.reverse()
+        return path
+
+    def target_cell(self, target: Tuple[int, int]) -> int:
+        """Open cell to aim for when heading to target, which may be off the grid or in a wall."""
+        # Clamped with comparisons, as min and max allocate an iterator over their arguments
+        x, y = target
+        x = 0 if x < 0 else self.cols - 1 if x >= self.cols else x
+        y = 0 if y < 0 else self.rows - 1 if y >= self.rows else y
+        return self.nearest_open[y * self.cols + x]
+
+    def flow_field(self, targets, reach=()) -> array:
+        """Steps from every open cell to the nearest of the given targets.
+
+        Built with one BFS outwards from the targets and cached per target
+        set, so all ghosts chasing the same cells share it until Pacman
+        enters a new cell. Unreachable cells hold -1. With `reach` given the
+        BFS stops as soon as those cells have their distances, and picks up
+        where it left off when a later call needs cells further out, so only
+        the area between the targets and those cells is searched.
+        A single target on a maze with all-pairs tables needs no BFS at all.
+        """
+        if len(targets) == 1 and self.distances is not None:
+            # Paths run both ways, so the target's all-pairs row is its field. This also keeps
+            # many games on one maze, as the server runs them, from thrashing the cache below,
+            # and ghosts from building a cache key every time they turn
+            return self._distance_rows[self.target_cell(targets[0])]
+        key = tuple(sorted(set(map(self.target_cell, targets))))
+        entry = self._flow_fields.pop(key, None)
+        if entry is None:
+            field = array(self.typecode, [-1]) * self.size
+            for cell in key:
+                field[cell] = 0
+            entry = (field, deque(key))
+            if len(self._flow_fields) >= FLOW_FIELD_CACHE_SIZE:
+                # Drop the least recently used field
+                del self._flow_fields[next(iter(self._flow_fields))]
+        self._flow_fields[key] = entry
+        field, queue = entry
+        if not queue:
+            return field
+
+        pending = {cell for cell in reach if field[cell] < 0}
+        if reach and not pending:
+            return field
+        while queue:
+            cell = queue.popleft()
+            distance = field[cell] + 1
+            for next_cell in self.neighbors[cell]:
+                if field[next_cell] < 0:
+                    field[next_cell] = distance
+                    queue.append(next_cell)
+                    pending.discard(next_cell)
+            if reach and not pending:
+                break
+        return field
+
+class JunctionGraph:
+    """A maze compiled into junctions joined by weighted corridor edges.
+
+    Junctions are the open cells where a path can branch or end: dead ends,
+    cells with three or four ways on, and the ends of one-way tunnel wraps.
+    Every other open cell has exactly two ways on and lies on a corridor,
+    stored once in each direction as the cells between its end junctions.
+    Most of a maze is corridor, so a shortest path search over junctions
+    settles a fraction of the cells a BFS over the grid would, and A*
+    steers it towards the target on top of that. Start and target cells
+    inside a corridor join the search at the corridor's ends.
+    """
+
+    def __init__(self, index: MazeIndex):
+        neighbors = index.neighbors
+        self.neighbors = neighbors
+        self.coords = index.coords
+        self.cols = index.cols
+        self.junction = bytearray(index.size)
+        open_cells = [cell for cell in range(index.size) if not index.walls[cell]]
+        for cell in open_cells:
+            cells = neighbors[cell]
+            if len(set(cells)) != 2:
+                self.junction[cell] = 1
+            for next_cell in cells:
+                if cell not in neighbors[next_cell]:
+                    # A one-way wrap: neither end is a plain corridor cell
+                    self.junction[cell] = self.junction[next_cell] = 1
+
+        # Corridor k runs from junction starts[k] through cells[k] to junction ends[k]
+        self.starts, self.cells, self.ends, self.reverse = [], [], [], []
+        self.edges = {}  # junction -> numbers of the corridors leaving it
+        self.corridor_of = array('i', [-1]) * index.size  # Corridor cells: a corridor they are on
+        self.offset = array('i', [-1]) * index.size  # ... and their position along it
+        for cell in open_cells:
+            if self.junction[cell]:
+                self._add_junction(cell)
+        for cell in open_cells:
+            if not self.junction[cell] and self.corridor_of[cell] < 0:
+                # A loop with no junctions on it; any of its cells will do as one
+                self.junction[cell] = 1
+                self._add_junction(cell)
+        # Pair each corridor with the same cells walked the other way
+        first_steps = {(self.starts[k], cells[0] if cells else self.ends[k]): k for k, cells in enumerate(self.cells)}
+        for k, cells in enumerate(self.cells):
+            self.reverse.append(first_steps.get((self.ends[k], cells[-1] if cells else self.starts[k]), -1))
+
+    def _add_junction(self, junction):
+        neighbors = self.neighbors
+        self.edges[junction] = corridors = []
+        for first in neighbors[junction]:
+            cells = []
+            previous, cell = junction, first
+            while not self.junction[cell]:
+                cells.append(cell)
+                a, b = neighbors[cell]
+                previous, cell = cell, b if a == previous else a
+            k = len(self.cells)
+            corridors.append(k)
+            self.starts.append(junction)
+            self.cells.append(cells)
+            self.ends.append(cell)
+            for position, corridor_cell in enumerate(cells):
+                if self.corridor_of[corridor_cell] < 0:
+                    self.corridor_of[corridor_cell] = k
+                    self.offset[corridor_cell] = position
+
+    def _along(self, k, first, target):
+        """Walking corridor k from its cell `first` on: (steps, cell reached, k, first, last) to its end or `target`."""
+        cells = self.cells[k]
+        owner = self.corridor_of[target]
+        if owner == k:
+            position = self.offset[target]
+        elif owner >= 0 and owner == self.reverse[k]:
+            position = len(cells) - 1 - self.offset[target]
+        else:
+            position = -1
+        if position >= first:
+            return position - first + 1, target, k, first, position
+        return len(cells) - first + 1, self.ends[k], k, first, len(cells)
+
+    def _moves(self, cell, target):
+        """The ways on from `cell` to the next junctions, or to `target` if it comes first."""
+        if self.junction[cell]:
+            return [self._along(k, 0, target) for k in self.edges[cell]]
+        k = self.corridor_of[cell]
+        if k >= 0:
+            # Inside a corridor: head for both of its ends
+            position = self.offset[cell]
+            return [self._along(k, position + 1, target),
+                    self._along(self.reverse[k], len(self.cells[k]) - position, target)]
+        # A wall cell, which paths may start from but not cross
+        return [(1, next_cell, -1, 0, 0) for next_cell in self.neighbors[cell]]
+
+    def _search(self, start, target, limit=sys.maxsize):
+        """A* from `start` until `target` is settled; returns the distances and how each cell was reached.
+
+        Paths that must be longer than `limit` steps are not followed.
+        """
+        coords, cols = self.coords, self.cols
+        target_x, target_y = coords[target]
+        distances = {start: 0}
+        came_from = {start: None}
+        heap = [(0, 0, start)]
+        while heap:
+            _, distance, cell = heapq.heappop(heap)
+            distance = -distance
+            if cell == target:
+                break
+            if distance > distances[cell]:
+                continue
+            for steps, next_cell, k, first, last in self._moves(cell, target):
+                steps += distance
+                if steps < distances.get(next_cell, steps + 1):
+                    # Steps on the grid, or around it through a tunnel, never overestimate
+                    x, y = coords[next_cell]
+                    dx = abs(x - target_x)
+                    estimate = steps + min(dx, cols - dx) + abs(y - target_y)
+                    if estimate > limit:
+                        continue
+                    distances[next_cell] = steps
+                    came_from[next_cell] = (cell, k, first, last)
+                    # Among equal estimates the deepest cell goes first
+                    heapq.heappush(heap, (estimate, -steps, next_cell))
+        return distances, came_from
+
+    def distance(self, start: int, target: int, limit: int = sys.maxsize) -> int:
+        """Steps from cell `start` to cell `target`, or -1 if it is unreachable in `limit` steps."""
+        return self._search(start, target, limit)[0].get(target, -1)
+
+    def route(self, start: int, target: int) -> List[int]:
+        """Cells of a shortest path from `start` to `target` inclusive, or [] if it is unreachable."""
+        _, came_from = self._search(start, target)
+        if target not in came_from:
+            return []
+        route = []
+        cell = target
+        while cell != start:
+            previous, k, first, last = came_from[cell]
+            route.append(cell)
+            if k >= 0:
+                route.extend(reversed(self.cells[k][first:last]))
+            cell = previous
+        route.append(start)
+        route.reverse()
+        return route
+
+# Indexes shared by every maze with the same walls and tunnels, least recently used first
+_maze_indexes = {}
+
+def get_maze_index(maze: List[List[int]]) -> MazeIndex:
+    """Return the MazeIndex for this maze's layout, building it on first use.
+
+    The layout key covers the whole grid, so this costs a pass over the maze: hold on
+    to the index (as `GameState.index` does) rather than looking it up per query.
+    """
+    layout = (len(maze[0]), bytes(cell if cell in (1, 4) else 0 for row in maze for cell in row))
+    index = _maze_indexes.pop(layout, None)
+    if index is None:
+        index = MazeIndex(maze)
+        if len(_maze_indexes) >= MAZE_INDEX_CACHE_SIZE:
+            # Drop the least recently used layout
+            del _maze_indexes[next(iter(_maze_indexes))]
+    _maze_indexes[layout] = index
+    return index
+
+def find_path(maze: List[List[int]], start: Tuple[int, int], target: Tuple[int, int],
+              index: MazeIndex = None) -> List[Tuple[int, int]]:
+    """Find the shortest path using the maze's precomputed BFS tables.
+
+    Pass the maze's `index` (such as `state.index`) to skip looking it up by layout.
+    """
+    if index is None:
+        index = get_maze_index(maze)
+    return index.path(start, target)
+
+def count_pellets(maze: List[List[int]]) -> int:
+    """Count the dots and power pellets left in the maze."""
+    return sum(row.count(2) + row.count(3) for row in maze)
 
 def check_win(maze: List[List[int]]) -> bool:
-    """Check if all dots and power pellets have been eaten."""
+    """Check if all dots and power pellets have been eaten by scanning the maze."""
     for row in maze:
         for cell in row:
             if cell in [2, 3]:  
                 return False
     return True
 
-class Pacman:
+class SpatialHash:
+    """Entities bucketed by the grid square they are in, for proximity queries.
+
+    `move` refiles an entity only when it crosses into another square, and
+    `near` looks only at the squares around the query point, so with
+    entities spread over the maze each query costs the same whether there
+    are 4 of them or 4000.
+    """
+
+    def __init__(self, entities=(), cell_size=1.0):
+        self.cell_size = cell_size
+        self.buckets = {}  # (column, row) -> {entity: None}, kept in insertion order
+        self.keys = {}  # entity -> the bucket it is in
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, entity) -> bool:
+        return entity in self.keys
+
+    def key(self, x, y) -> Tuple[int, int]:
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def add(self, entity):
+        key = self.keys[entity] = self.key(entity.x, entity.y)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+        bucket[entity] = None
+
+    def remove(self, entity):
+        key = self.keys.pop(entity)
+        bucket = self.buckets[key]
+        del bucket[entity]
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, entity):
+        """Refile an entity after it moves; adds it if it is not in the hash yet."""
+        size = self.cell_size
+        old_key = self.keys.get(entity)
+        if old_key is None:
+            self.add(entity)
+        elif old_key[0] != int(entity.x // size) or old_key[1] != int(entity.y // size):
+            # Compared a coordinate at a time so staying in a square builds no key
+            self.remove(entity)
+            self.add(entity)
+
+    def near(self, x, y, radius=COLLISION_RADIUS) -> list:
+        """Entities closer than `radius` to (x, y) on both axes, the test collisions use."""
+        if len(self.keys) <= SPATIAL_HASH_SCAN_SIZE:
+            # Checking a handful of entities beats visiting their buckets
+            return [entity for entity in self.keys if abs(entity.x - x) < radius and abs(entity.y - y) < radius]
+        found = []
+        buckets = self.buckets
+        size = self.cell_size
+        left, right = int((x - radius) // size), int((x + radius) // size)
+        top, bottom = int((y - radius) // size), int((y + radius) // size)
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                bucket = buckets.get((column, row))
+                if bucket:
+                    for entity in bucket:
+                        if abs(entity.x - x) < radius and abs(entity.y - y) < radius:
+                            found.append(entity)
+        return found
+
+class Entity:
+    """Base for slotted entities, which store their heading as a code into DIRECTIONS."""
+    __slots__ = ()
+
+    @property
+    def direction(self) -> Tuple[int, int]:
+        return DIRECTIONS[self.direction_code]
+
+    @direction.setter
+    def direction(self, direction):
+        self.direction_code = DIRECTION_CODES[direction]
+
+    def copy(self):
+        """A new entity with the same attributes."""
+        other = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+class Pacman(Entity):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'direction_code', 'next_direction_code', 'score',
+                 'power_pellet_timer', 'mouth_open', 'animation_count', 'color', 'is_ms_pacman', 'alive')
+
     def __init__(self, x=9, y=11, color=YELLOW, is_ms_pacman=False):
         self.x = x
         self.y = y
-        self.direction = (0, 0)
-        self.next_direction = (0, 0)
+        self.prev_x = x
+        self.prev_y = y
+        self.direction_code = 0
+        self.next_direction_code = 0
         self.score = 0
         self.power_pellet_timer = 0
         self.mouth_open = True
@@ -113,126 +756,106 @@ class Pacman:
         self.is_ms_pacman = is_ms_pacman
         self.alive = True
 
+    @property
+    def next_direction(self) -> Tuple[int, int]:
+        return DIRECTIONS[self.next_direction_code]
+
+    @next_direction.setter
+    def next_direction(self, direction):
+        self.next_direction_code = DIRECTION_CODES[direction]
+
     def can_move_in_direction(self, maze, x, y, direction, radius=0.35):
         # Check if Pacman can move in a given direction from a position
-        test_x = x + direction[0] * PACMAN_SPEED
-        test_y = y + direction[1] * PACMAN_SPEED
-        
-        test_points = [
-            (test_x, test_y),  # Center
-            (test_x - radius, test_y),  # Left
-            (test_x + radius, test_y),  # Right
-            (test_x, test_y - radius),  # Top
-            (test_x, test_y + radius)   # Bottom
-        ]
-        
-        for px, py in test_points:
-            cell_x = int(round(px))
-            cell_y = int(round(py))
-            if 0 <= cell_x < COLS and 0 <= cell_y < ROWS:
-                if maze[cell_y][cell_x] == 1:  # Wall
-                    return False
-        return True
-
-    def move(self, maze: List[List[int]], ghosts: List['Ghost']):
+        return probe_move(maze, x, y, direction, radius)
+
+    def move(self, maze: List[List[int]], ghosts: List['Ghost'], state: 'GameState' = None):
+        index = state.index if state is not None else get_maze_index(maze)
+        cols, rows = index.cols, index.rows
+
         # Update power pellet timer
         if self.power_pellet_timer > 0:
             self.power_pellet_timer -= 1
 
         # First try to apply queued direction change
-        if self.next_direction != (0, 0):
+        if self.next_direction_code:
             # Check if we're close to a grid center (within 0.1 units)
-            grid_aligned = (abs(self.x - round(self.x)) < 0.1 and 
-                          abs(self.y - round(self.y)) < 0.1)
+            grid_aligned = (abs(self.x - nearest(self.x)) < 0.1 and 
+                          abs(self.y - nearest(self.y)) < 0.1)
             
-            if grid_aligned and self.can_move_in_direction(maze, round(self.x), round(self.y), self.next_direction):
-                self.x = round(self.x)  # Snap to grid
-                self.y = round(self.y)
-                self.direction = self.next_direction
+            if grid_aligned and index.can_move(maze, nearest(self.x), nearest(self.y), self.next_direction_code):
+                self.x = nearest(self.x)  # Snap to grid
+                self.y = nearest(self.y)
+                self.direction_code = self.next_direction_code
         
         # Move in current direction
-        new_x = self.x + self.direction[0] * PACMAN_SPEED
-        new_y = self.y + self.direction[1] * PACMAN_SPEED
+        direction = DIRECTIONS[self.direction_code]
+        new_x = self.x + direction[0] * PACMAN_SPEED
+        new_y = self.y + direction[1] * PACMAN_SPEED
         
-        # Handle tunnel wrapping
-        if self.direction[0] != 0 and int(self.y) == 8 and maze[8][int(self.x)] == 4:
-            new_x = (new_x + COLS) % COLS
+        # Handle tunnel wrapping; a turn can snap Pacman onto x == cols, past the last tunnel cell
+        if direction[0] != 0 and maze[int(self.y)][min(int(self.x), cols - 1)] == 4:
+            new_x = (new_x + cols) % cols
             self.x = new_x
             self.y = new_y
         else:
             # Check if we can move in current direction
-            if self.can_move_in_direction(maze, self.x, self.y, self.direction):
-                if 0 <= new_x < COLS and 0 <= new_y < ROWS:
+            if index.can_move(maze, self.x, self.y, self.direction_code):
+                if 0 <= new_x < cols and 0 <= new_y < rows:
                     self.x = new_x
                     self.y = new_y
 
         # Collect dots and power pellets
-        cell_x, cell_y = int(round(self.x)), int(round(self.y))
-        if 0 <= cell_x < COLS and 0 <= cell_y < ROWS:
+        cell_x, cell_y = nearest(self.x), nearest(self.y)
+        if 0 <= cell_x < cols and 0 <= cell_y < rows:
             if maze[cell_y][cell_x] == 2:  # Regular dot
                 maze[cell_y][cell_x] = 0
                 self.score += 10
+                if state is not None:
+                    state.pellet_eaten(cell_x, cell_y)
             elif maze[cell_y][cell_x] == 3:  # Power pellet
                 maze[cell_y][cell_x] = 0
                 self.score += 50
                 self.power_pellet_timer = POWER_PELLET_DURATION
+                if state is not None:
+                    state.pellet_eaten(cell_x, cell_y)
                 # Make all ghosts vulnerable
                 for ghost in ghosts:
                     ghost.make_vulnerable()
 
-    def draw(self, screen):
+    def draw(self, screen, alpha=1.0):
+        """Draw Pacman `alpha` of the way through the last tick and return the area it covers."""
         # Update mouth animation
         self.animation_count = (self.animation_count + 1) % 10
         self.mouth_open = self.animation_count < 5
 
-        # Calculate position
-        center = (int(self.x * CELL_SIZE + CELL_SIZE // 2), 
-                 int(self.y * CELL_SIZE + CELL_SIZE // 2))
-        
-        if self.mouth_open:
-            # Calculate start and end angles based on direction
-            if self.direction == (1, 0):  # Right
-                start_angle = 20
-                end_angle = 340
-            elif self.direction == (-1, 0):  # Left
-                start_angle = 200
-                end_angle = 160
-            elif self.direction == (0, -1):  # Up
-                start_angle = 110
-                end_angle = 70
-            elif self.direction == (0, 1):  # Down
-                start_angle = 290
-                end_angle = 250
-            else:  # Default (facing right)
-                start_angle = 20
-                end_angle = 340
-
-            # Draw pacman with mouth
-            pygame.draw.arc(screen, self.color, 
-                          (center[0] - CELL_SIZE//2, center[1] - CELL_SIZE//2,
-                           CELL_SIZE, CELL_SIZE),
-                          start_angle * (3.14/180), end_angle * (3.14/180),
-                          CELL_SIZE//2)
-        else:
-            # Draw full circle when mouth is closed
-            pygame.draw.circle(screen, self.color, center, CELL_SIZE//2 - 2)
-
-        # Add bow for Ms. Pacman
-        if self.is_ms_pacman:
-            bow_color = RED
-            bow_x = center[0]
-            bow_y = center[1] - CELL_SIZE//2 + 2
-            pygame.draw.circle(screen, bow_color, (bow_x, bow_y), 4)
-            pygame.draw.circle(screen, bow_color, (bow_x - 4, bow_y - 2), 4)
-            pygame.draw.circle(screen, bow_color, (bow_x + 4, bow_y - 2), 4)
-
-class Ghost:
-    def __init__(self, x, y, color, name):
+        # Blit the pre-rendered frame for this direction and mouth state
+        x, y = interpolate_position(self, alpha)
+        sprite, (offset_x, offset_y) = get_sprite_atlas().pacman(
+            self.color, self.is_ms_pacman, self.direction, self.mouth_open)
+        return screen.blit(sprite, (int(x * CELL_SIZE + CELL_SIZE // 2) - CELL_SIZE // 2 + offset_x,
+                                    int(y * CELL_SIZE + CELL_SIZE // 2) - CELL_SIZE // 2 + offset_y))
+
+def find_ghost(ghosts: List['Ghost'], name: str) -> 'Ghost':
+    """The ghost called `name`; a loop, as a generator would be allocated on every call."""
+    for ghost in ghosts:
+        if ghost.name == name:
+            return ghost
+    raise ValueError(f'no ghost named {name!r}')
+
+class Ghost(Entity):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'color', 'name', 'direction_code', 'vulnerable',
+                 'vulnerable_timer', 'eaten', 'respawn_timer', 'home', 'corner')
+
+    def __init__(self, x, y, color, name, home=GHOST_HOUSE, corner=(0, ROWS - 1)):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.color = color
         self.name = name
-        self.direction = (0, 0)
+        self.home = home  # Where the ghost respawns after being eaten
+        self.corner = corner  # Where Clyde retreats to when close to Pacman
+        self.direction_code = 0
         self.vulnerable = False
         self.vulnerable_timer = 0
         self.eaten = False
@@ -241,39 +864,22 @@ class Ghost:
     def make_vulnerable(self):
         if not self.eaten:
             self.vulnerable = True
-            self.vulnerable_timer = 7 * FPS  # 7 seconds of vulnerability
+            self.vulnerable_timer = VULNERABLE_DURATION  # 7 seconds of vulnerability
 
     def reset_vulnerability(self):
         self.vulnerable = False
 
     def get_valid_moves(self, maze, current_pos):
-        x, y = current_pos
-        valid_moves = []
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            new_x = x + dx
-            new_y = y + dy
-            
-            # Handle tunnel wrapping
-            if int(y) == 8:  # Tunnel row
-                if new_x < 0:
-                    new_x = COLS - 1
-                elif new_x >= COLS:
-                    new_x = 0
-            
-            # Check if move is valid
-            if (0 <= new_x < COLS or int(y) == 8) and 0 <= new_y < ROWS:
-                if maze[new_y][int(new_x % COLS)] != 1:  # Use modulo for x position
-                    valid_moves.append((dx, dy))
-        return valid_moves
+        return ghost_moves(maze, current_pos)
 
-    def move(self, maze: List[List[int]], pacman: 'Pacman', ghosts: List['Ghost']):
+    def move(self, maze: List[List[int]], pacman: 'Pacman', ghosts: List['Ghost'], index: MazeIndex = None,
+             rng: random.Random = None):
         if self.eaten:
             self.respawn_timer -= 1
             if self.respawn_timer <= 0:
                 self.eaten = False
                 self.vulnerable = False
-                self.x = 9  # Reset position
-                self.y = 8
+                self.x, self.y = self.home  # Reset position
             return
 
         if self.vulnerable:
@@ -281,252 +887,954 @@ class Ghost:
             if self.vulnerable_timer <= 0:
                 self.vulnerable = False
 
-        current_cell = (int(round(self.x)), int(round(self.y)))
-        
         # Only change direction when centered on a cell
-        if abs(self.x - round(self.x)) < 0.1 and abs(self.y - round(self.y)) < 0.1:
-            self.x = round(self.x)  # Snap to grid
-            self.y = round(self.y)
-            
-            valid_moves = self.get_valid_moves(maze, current_cell)
-            if not valid_moves:
+        if abs(self.x - nearest(self.x)) < 0.1 and abs(self.y - nearest(self.y)) < 0.1:
+            self.x = nearest(self.x)  # Snap to grid
+            self.y = nearest(self.y)
+
+            if index is None:
+                index = get_maze_index(maze)
+            cell = index.cell(self.x, self.y)
+            if cell >= 0:
+                exits = index.exits[cell]
+            else:
+                # Just past the tunnel mouth, outside the exit tables
+                exits = 0
+                for move in self.get_valid_moves(maze, (self.x, self.y)):
+                    exits |= EXIT_BITS[DIRECTION_CODES[move]]
+            if not exits:
                 return
 
             # Remove opposite direction unless it's the only option
-            if len(valid_moves) > 1 and (-self.direction[0], -self.direction[1]) in valid_moves:
-                valid_moves.remove((-self.direction[0], -self.direction[1]))
+            reverse = EXIT_BITS[OPPOSITE_CODES[self.direction_code]]
+            if exits & reverse and exits != reverse:
+                exits ^= reverse
+            valid_moves = EXIT_MOVES[exits]
 
             if self.vulnerable:
                 # Move randomly when vulnerable
-                self.direction = random.choice(valid_moves)
+                self.direction_code = (rng or random).choice(valid_moves)
+            elif len(valid_moves) == 1:
+                # Along a corridor the way on is forced; only junctions need a target
+                self.direction_code = valid_moves[0]
             else:
-                # Normal targeting behavior
+                # Normal targeting behavior, looked up in the maze's decision table
                 target = self.get_target(pacman, ghosts)
-                
-                # Choose the direction that gets closest to the target
-                best_move = None
-                min_distance = float('inf')
-                for dx, dy in valid_moves:
-                    new_x = current_cell[0] + dx
-                    new_y = current_cell[1] + dy
-                    
-                    # Handle wrapping for distance calculation
-                    if int(current_cell[1]) == 8:
-                        # Consider both direct and wrapped distances
-                        direct_dist = ((new_x - target[0]) ** 2 + (new_y - target[1]) ** 2) ** 0.5
-                        wrap_left = ((new_x + COLS - target[0]) ** 2 + (new_y - target[1]) ** 2) ** 0.5
-                        wrap_right = ((new_x - COLS - target[0]) ** 2 + (new_y - target[1]) ** 2) ** 0.5
-                        distance = min(direct_dist, wrap_left, wrap_right)
+                best_move = index.decision(cell, exits, target) if cell >= 0 else 0
+                if not best_move:
+                    # No row for this cell, so score each exit by how far it is from the target
+                    min_distance = index.size + 1
+                    if index.distances is not None:
+                        # With all-pairs tables the shared flow field is a table row, so
+                        # nothing is allocated to look it up
+                        field = index.flow_field((target,))
+                        for code in valid_moves:
+                            distance = field[self.next_cell(index, cell, code)]
+                            if distance < 0:
+                                distance = index.size
+
+                            if distance < min_distance:
+                                min_distance = distance
+                                best_move = code
                     else:
-                        distance = ((new_x - target[0]) ** 2 + (new_y - target[1]) ** 2) ** 0.5
-                    
-                    if distance < min_distance:
-                        min_distance = distance
-                        best_move = (dx, dy)
-                
-                self.direction = best_move
+                        # Too big for tables: measure from the target over the junction graph, as the
+                        # flow field would have, giving up on each exit once it cannot beat the best so
+                        # far, so a turn costs the distance to the target rather than the maze's area
+                        graph = index.graph
+                        target_cell = index.target_cell(target)
+                        for code in valid_moves:
+                            next_cell = self.next_cell(index, cell, code)
+                            distance = graph.distance(target_cell, next_cell, min_distance - 1) if next_cell >= 0 else -1
+                            if distance < 0:
+                                distance = index.size
+
+                            if distance < min_distance:
+                                min_distance = distance
+                                best_move = code
+
+                self.direction_code = best_move
 
         # Move in current direction
-        new_x = self.x + self.direction[0] * GHOST_SPEED
-        new_y = self.y + self.direction[1] * GHOST_SPEED
+        direction = DIRECTIONS[self.direction_code]
+        new_x = self.x + direction[0] * GHOST_SPEED
+        new_y = self.y + direction[1] * GHOST_SPEED
+        cols, rows = len(maze[0]), len(maze)
 
         # Handle tunnel wrapping
-        if int(self.y) == 8:  # In tunnel row
+        if is_tunnel_row(maze, int(self.y)):  # In tunnel row
             if new_x < 0:
-                new_x = COLS - 1
-            elif new_x >= COLS:
+                new_x = cols - 1
+            elif new_x >= cols:
                 new_x = 0
             
             # Always allow horizontal movement in tunnel
-            if self.direction[0] != 0:  # Moving horizontally
+            if direction[0] != 0:  # Moving horizontally
                 self.x = new_x
                 self.y = new_y
-            elif 0 <= new_y < ROWS and maze[int(round(new_y))][int(round(new_x % COLS))] != 1:
+            elif 0 <= new_y < rows and maze[nearest(new_y)][nearest(new_x % cols)] != 1:
                 # Allow vertical movement if not into a wall
                 self.x = new_x
                 self.y = new_y
         else:
             # Normal movement
-            if (0 <= new_x < COLS and 0 <= new_y < ROWS and 
-                maze[int(round(new_y))][int(round(new_x))] != 1):
+            if (0 <= new_x < cols and 0 <= new_y < rows and 
+                maze[nearest(new_y)][nearest(new_x)] != 1):
                 self.x = new_x
                 self.y = new_y
 
+    def next_cell(self, index: MazeIndex, cell: int, code: int) -> int:
+        """The cell one step from this ghost, standing on `cell`, in direction `code`."""
+        if cell >= 0:
+            # Exit cells already account for wrapping through the tunnel
+            return index.exit_cells[cell * 5 + code]
+        return index.cell((self.x + DIRECTIONS[code][0]) % index.cols, self.y + DIRECTIONS[code][1])
+
     def get_target(self, pacman: 'Pacman', ghosts: List['Ghost']) -> Tuple[int, int]:
         if self.name == "blinky":
             # Directly target Pacman
-            return (int(round(pacman.x)), int(round(pacman.y)))
+            return (nearest(pacman.x), nearest(pacman.y))
         elif self.name == "pinky":
             # Target 4 tiles ahead of Pacman
-            target_x = int(round(pacman.x + 4 * pacman.direction[0]))
-            target_y = int(round(pacman.y + 4 * pacman.direction[1]))
+            target_x = nearest(pacman.x + 4 * pacman.direction[0])
+            target_y = nearest(pacman.y + 4 * pacman.direction[1])
             return (target_x, target_y)
         elif self.name == "inky":
             # Complex targeting using Blinky's position
-            blinky = next(g for g in ghosts if g.name == "blinky")
+            blinky = find_ghost(ghosts, "blinky")
             # Get point 2 tiles ahead of Pacman
-            ahead_x = int(round(pacman.x + 2 * pacman.direction[0]))
-            ahead_y = int(round(pacman.y + 2 * pacman.direction[1]))
+            ahead_x = nearest(pacman.x + 2 * pacman.direction[0])
+            ahead_y = nearest(pacman.y + 2 * pacman.direction[1])
             # Double the vector from Blinky to this point
-            target_x = ahead_x + (ahead_x - int(round(blinky.x)))
-            target_y = ahead_y + (ahead_y - int(round(blinky.y)))
+            target_x = ahead_x + (ahead_x - nearest(blinky.x))
+            target_y = ahead_y + (ahead_y - nearest(blinky.y))
             return (target_x, target_y)
         else:  # clyde
             # If far from Pacman, target directly, if close, go to corner
             dist = ((self.x - pacman.x) ** 2 + (self.y - pacman.y) ** 2) ** 0.5
             if dist > 8:
-                return (int(round(pacman.x)), int(round(pacman.y)))
+                return (nearest(pacman.x), nearest(pacman.y))
             else:
-                return (0, ROWS-1)  # Bottom-left corner
+                return self.corner  # Bottom-left corner
 
-    def draw(self, screen):
+    def draw(self, screen, alpha=1.0):
+        """Draw the ghost `alpha` of the way through the last tick and return the area it covers."""
         if self.eaten:
-            return  # Don't draw if eaten
+            return None  # Don't draw if eaten
             
-        x = int(self.x * CELL_SIZE)
-        y = int(self.y * CELL_SIZE)
+        x, y = interpolate_position(self, alpha)
+        x = int(x * CELL_SIZE)
+        y = int(y * CELL_SIZE)
         
         # Determine ghost color
         if self.vulnerable:
             if self.vulnerable_timer < 2 * FPS:  # Flash when about to end
-                color = (0, 0, 255) if (self.vulnerable_timer // 15) % 2 == 0 else WHITE
+                color = VULNERABLE_GHOST_COLOR if (self.vulnerable_timer // 15) % 2 == 0 else BLINKING_GHOST_COLOR
             else:
-                color = (0, 0, 255)
+                color = VULNERABLE_GHOST_COLOR
         else:
             color = self.color
             
-        # Draw ghost body (semi-circle for head)
-        pygame.draw.circle(screen, color, (x + CELL_SIZE//2, y + CELL_SIZE//2), CELL_SIZE//2)
-        
-        # Draw ghost skirt (wavy bottom)
-        skirt_points = [
-            (x, y + CELL_SIZE//2),  # Left edge
-            (x + CELL_SIZE//4, y + CELL_SIZE//2 + 3),  # First wave down
-            (x + CELL_SIZE//2, y + CELL_SIZE//2),  # Middle wave up
-            (x + 3*CELL_SIZE//4, y + CELL_SIZE//2 + 3),  # Second wave down
-            (x + CELL_SIZE, y + CELL_SIZE//2),  # Right edge
-            (x + CELL_SIZE, y + CELL_SIZE),  # Bottom right
-            (x, y + CELL_SIZE),  # Bottom left
-        ]
-        pygame.draw.polygon(screen, color, skirt_points)
+        sprite, (offset_x, offset_y) = get_sprite_atlas().ghost(color)
+        return screen.blit(sprite, (x + offset_x, y + offset_y))
+
+def interpolate_position(entity, alpha):
+    """Position of an entity `alpha` of the way from its previous tick to the current one."""
+    if alpha >= 1.0:
+        return entity.x, entity.y
+    dx = entity.x - entity.prev_x
+    dy = entity.y - entity.prev_y
+    # Tunnel wraps, respawns and resets jump instead of sliding across the maze
+    if abs(dx) > 1 or abs(dy) > 1:
+        return entity.x, entity.y
+    return entity.prev_x + dx * alpha, entity.prev_y + dy * alpha
+
+def draw_pacman_shape(screen, center, color, direction, mouth_open, is_ms_pacman):
+    """Draw a Pacman frame centered on `center`."""
+    if mouth_open:
+        # Calculate start and end angles based on direction
+        if direction == (1, 0):  # Right
+            start_angle = 20
+            end_angle = 340
+        elif direction == (-1, 0):  # Left
+            start_angle = 200
+            end_angle = 160
+        elif direction == (0, -1):  # Up
+            start_angle = 110
+            end_angle = 70
+        elif direction == (0, 1):  # Down
+            start_angle = 290
+            end_angle = 250
+        else:  # Default (facing right)
+            start_angle = 20
+            end_angle = 340
+
+        # Draw pacman with mouth
+        pygame.draw.arc(screen, color, 
+                      (center[0] - CELL_SIZE//2, center[1] - CELL_SIZE//2,
+                       CELL_SIZE, CELL_SIZE),
+                      start_angle * (3.14/180), end_angle * (3.14/180),
+                      CELL_SIZE//2)
+    else:
+        # Draw full circle when mouth is closed
+        pygame.draw.circle(screen, color, center, CELL_SIZE//2 - 2)
+
+    # Add bow for Ms. Pacman
+    if is_ms_pacman:
+        bow_color = RED
+        bow_x = center[0]
+        bow_y = center[1] - CELL_SIZE//2 + 2
+        pygame.draw.circle(screen, bow_color, (bow_x, bow_y), 4)
+        pygame.draw.circle(screen, bow_color, (bow_x - 4, bow_y - 2), 4)
+        pygame.draw.circle(screen, bow_color, (bow_x + 4, bow_y - 2), 4)
+
+def draw_ghost_shape(screen, x, y, color):
+    """Draw a ghost body whose cell's top-left corner is (x, y)."""
+    # Draw ghost body (semi-circle for head)
+    pygame.draw.circle(screen, color, (x + CELL_SIZE//2, y + CELL_SIZE//2), CELL_SIZE//2)
+    
+    # Draw ghost skirt (wavy bottom)
+    skirt_points = [
+        (x, y + CELL_SIZE//2),  # Left edge
+        (x + CELL_SIZE//4, y + CELL_SIZE//2 + 3),  # First wave down
+        (x + CELL_SIZE//2, y + CELL_SIZE//2),  # Middle wave up
+        (x + 3*CELL_SIZE//4, y + CELL_SIZE//2 + 3),  # Second wave down
+        (x + CELL_SIZE, y + CELL_SIZE//2),  # Right edge
+        (x + CELL_SIZE, y + CELL_SIZE),  # Bottom right
+        (x, y + CELL_SIZE),  # Bottom left
+    ]
+    pygame.draw.polygon(screen, color, skirt_points)
+
+class SpriteAtlas:
+    """Pre-rendered Pacman and ghost frames, so drawing an entity is one blit.
+
+    Every frame is drawn once with the same calls the game used to make each
+    frame, cropped to its visible pixels and stored with its offset from the
+    top-left corner of the entity's cell. Frames for colors not seen at
+    startup are rendered the first time they are asked for.
+    """
+
+    # Room around the cell for the parts of a sprite that stick out of it
+    PAD = 8
+
+    def __init__(self):
+        self.sprites = {}
+        for color, is_ms_pacman in [(YELLOW, False), (PINK, True)]:
+            for direction in [(1, 0), (-1, 0), (0, -1), (0, 1), (0, 0)]:
+                self.pacman(color, is_ms_pacman, direction, True)
+            self.pacman(color, is_ms_pacman, (0, 0), False)
+        for color in GHOST_COLORS + [VULNERABLE_GHOST_COLOR, BLINKING_GHOST_COLOR]:
+            self.ghost(color)
+
+    def _render(self, draw, *args):
+        """Draw one frame onto a padded transparent surface and crop it."""
+        surface = pygame.Surface((CELL_SIZE + 2 * self.PAD, CELL_SIZE + 2 * self.PAD), pygame.SRCALPHA)
+        draw(surface, *args)
+        rect = surface.get_bounding_rect()
+        return surface.subsurface(rect).copy(), (rect.x - self.PAD, rect.y - self.PAD)
+
+    def pacman(self, color, is_ms_pacman, direction, mouth_open):
+        """Frame and offset for a Pacman facing `direction`."""
+        key = ('pacman', color, is_ms_pacman, direction if mouth_open else None)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            center = (self.PAD + CELL_SIZE // 2, self.PAD + CELL_SIZE // 2)
+            sprite = self.sprites[key] = self._render(
+                draw_pacman_shape, center, color, direction, mouth_open, is_ms_pacman)
+        return sprite
+
+    def ghost(self, color):
+        """Frame and offset for a ghost body of `color`."""
+        key = ('ghost', color)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self._render(draw_ghost_shape, self.PAD, self.PAD, color)
+        return sprite
+
+_sprite_atlas = None
+
+def get_sprite_atlas() -> SpriteAtlas:
+    """Return the shared sprite atlas, rendering it on first use."""
+    global _sprite_atlas
+    if _sprite_atlas is None:
+        _sprite_atlas = SpriteAtlas()
+    return _sprite_atlas
+
+# Fonts and rendered strings, so static and unchanged text is drawn once
+_fonts = {}
+_texts = {}
+
+def get_font(size):
+    """Return the default font at `size`, loading it on first use."""
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(None, size)
+    return font
+
+def render_text(text, size, color):
+    """Render a string once and reuse the surface for as long as it is cached."""
+    key = (text, size, color)
+    surface = _texts.get(key)
+    if surface is None:
+        if len(_texts) >= TEXT_CACHE_SIZE:
+            _texts.clear()
+        surface = _texts[key] = get_font(size).render(text, True, color)
+    return surface
+
+def draw_cell(screen, x, y, cell):
+    """Draw the wall, dot or power pellet in one maze cell."""
+    rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+    
+    if cell == 1:  
+        pygame.draw.rect(screen, BLUE, rect)
+    elif cell == 2:  
+        pygame.draw.circle(screen, WHITE, 
+                         (x * CELL_SIZE + CELL_SIZE // 2, 
+                          y * CELL_SIZE + CELL_SIZE // 2), 
+                         CELL_SIZE // 8)
+    elif cell == 3:  
+        pygame.draw.circle(screen, WHITE, 
+                         (x * CELL_SIZE + CELL_SIZE // 2, 
+                          y * CELL_SIZE + CELL_SIZE // 2), 
+                         CELL_SIZE // 4)
+    # Don't draw anything for tunnel (4) - keep it black
 
 def draw_maze(screen, maze):
-    for y in range(ROWS):
-        for x in range(COLS):
-            cell = maze[y][x]
-            rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-            
-            if cell == 1:  
-                pygame.draw.rect(screen, BLUE, rect)
-            elif cell == 2:  
-                pygame.draw.circle(screen, WHITE, 
-                                 (x * CELL_SIZE + CELL_SIZE // 2, 
-                                  y * CELL_SIZE + CELL_SIZE // 2), 
-                                 CELL_SIZE // 8)
-            elif cell == 3:  
-                pygame.draw.circle(screen, WHITE, 
-                                 (x * CELL_SIZE + CELL_SIZE // 2, 
-                                  y * CELL_SIZE + CELL_SIZE // 2), 
-                                 CELL_SIZE // 4)
-            # Don't draw anything for tunnel (4) - keep it black
+    for y, row in enumerate(maze):
+        for x, cell in enumerate(row):
+            draw_cell(screen, x, y, cell)
+
+def draw_scores(screen, state):
+    """Draw each player's score below the maze."""
+    width, height = screen.get_size()
+    score_text = render_text(f'P1: {state.pacman.score}', 36, YELLOW)
+    screen.blit(score_text, (10, height - 40))
+    if state.ms_pacman:
+        ms_score_text = render_text(f'P2: {state.ms_pacman.score}', 36, PINK)
+        screen.blit(ms_score_text, (width - 120, height - 40))
+
+class Renderer:
+    """Draws a running game, pushing only the parts of the window that changed.
+
+    Walls are drawn once per layout to a cached layer. Walls plus pellets
+    form a cached background that only changes when a pellet is eaten, and
+    each frame restores that background under last frame's sprites instead
+    of redrawing the maze, then updates just those rectangles and the HUD.
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.bounds = screen.get_rect()
+        self.hud_rect = pygame.Rect(0, self.bounds.height - HUD_HEIGHT, self.bounds.width, HUD_HEIGHT)
+        self.walls = None
+        self.walls_index = None
+        self.background = None
+        self.profiler = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Redraw and push the whole window on the next frame."""
+        self.full_redraw = True
+        self.sprite_rects = []
+        self.eaten_log = None
+        self.eaten_drawn = 0
+        self.scores = None
+
+    def _build_background(self, state):
+        """Rebuild the pellet layer from the maze, drawing the walls if the layout changed."""
+        if self.walls_index is not state.index:
+            self.walls = pygame.Surface(self.bounds.size)
+            self.walls.fill(BLACK)
+            draw_maze(self.walls, [[1 if cell == 1 else 0 for cell in row] for row in state.maze])
+            self.walls_index = state.index
+        self.background = self.walls.copy()
+        for y, row in enumerate(state.maze):
+            for x, cell in enumerate(row):
+                if cell in [2, 3]:
+                    draw_cell(self.background, x, y, cell)
+        self.eaten_log = state.eaten_cells
+        self.eaten_drawn = len(state.eaten_cells)
+
+    def draw(self, state, alpha=1.0):
+        """Draw one frame of the game, `alpha` of the way into the next tick, and push it."""
+        screen = self.screen
+        profiler = self.profiler
+        updates = []
+
+        # A reset or restored game starts a new eaten list, possibly with pellets put back
+        if (self.full_redraw or state.eaten_cells is not self.eaten_log or
+                len(state.eaten_cells) < self.eaten_drawn):
+            self.full_redraw = True
+            self._build_background(state)
+            screen.fill(BLACK)
+            screen.blit(self.background, (0, 0))
+        else:
+            # Restore the background under last frame's sprites
+            for rect in self.sprite_rects:
+                screen.blit(self.background, rect, rect)
+            updates.extend(self.sprite_rects)
+
+            # Erase pellets eaten since the last frame
+            for x, y in state.eaten_cells[self.eaten_drawn:]:
+                rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+                self.background.blit(self.walls, rect, rect)
+                screen.blit(self.background, rect, rect)
+                updates.append(rect)
+            self.eaten_drawn = len(state.eaten_cells)
+        if profiler is not None:
+            profiler.lap('draw_maze')
+
+        sprite_rects = []
+        for player in state.players:
+            if player.alive:
+                sprite_rects.append(player.draw(screen, alpha).clip(self.bounds))
+        for ghost in state.ghosts:
+            rect = ghost.draw(screen, alpha)
+            if rect:
+                sprite_rects.append(rect.clip(self.bounds))
+        if profiler is not None:
+            profiler.lap('sprites')
+
+        scores = tuple(player.score for player in state.players)
+        if self.full_redraw or scores != self.scores:
+            screen.fill(BLACK, self.hud_rect)
+            draw_scores(screen, state)
+            updates.append(self.hud_rect)
+            self.scores = scores
+        if profiler is not None:
+            # The overlay is restored from the background next frame like a sprite
+            sprite_rects.append(profiler.draw_overlay(screen).clip(self.bounds))
+            profiler.lap('hud')
+
+        if self.full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(updates + sprite_rects)
+        if profiler is not None:
+            profiler.lap('display')
+        self.sprite_rects = sprite_rects
+        self.full_redraw = False
 
 def draw_menu(screen):
     """Draw the main menu screen."""
+    width, height = screen.get_size()
     screen.fill(BLACK)
-    font = pygame.font.Font(None, 74)
-    title = font.render('PACMAN', True, YELLOW)
-    screen.blit(title, (WINDOW_WIDTH//2 - title.get_width()//2, WINDOW_HEIGHT//4))
+    title = render_text('PACMAN', 74, YELLOW)
+    screen.blit(title, (width//2 - title.get_width()//2, height//4))
     
-    font = pygame.font.Font(None, 36)
-    single = font.render('Press 1 for Single Player', True, WHITE)
-    multi = font.render('Press 2 for Two Players', True, WHITE)
-    screen.blit(single, (WINDOW_WIDTH//2 - single.get_width()//2, WINDOW_HEIGHT//2))
-    screen.blit(multi, (WINDOW_WIDTH//2 - multi.get_width()//2, WINDOW_HEIGHT//2 + 50))
+    single = render_text('Press 1 for Single Player', 36, WHITE)
+    multi = render_text('Press 2 for Two Players', 36, WHITE)
+    screen.blit(single, (width//2 - single.get_width()//2, height//2))
+    screen.blit(multi, (width//2 - multi.get_width()//2, height//2 + 50))
 
 def draw_game_over(screen, won, score, mode):
     """Draw the game over screen."""
+    width, height = screen.get_size()
     screen.fill(BLACK)
-    font = pygame.font.Font(None, 74)
     if won:
-        title = font.render('YOU WIN!', True, YELLOW)
+        title = render_text('YOU WIN!', 74, YELLOW)
     else:
-        title = font.render('GAME OVER', True, RED)
-    screen.blit(title, (WINDOW_WIDTH//2 - title.get_width()//2, WINDOW_HEIGHT//4))
+        title = render_text('GAME OVER', 74, RED)
+    screen.blit(title, (width//2 - title.get_width()//2, height//4))
     
-    font = pygame.font.Font(None, 36)
     if mode == MULTI_PLAYER:
-        score_text = font.render(f'Total Score: {score}', True, WHITE)
+        score_text = render_text(f'Total Score: {score}', 36, WHITE)
     else:
-        score_text = font.render(f'Score: {score}', True, WHITE)
-    screen.blit(score_text, (WINDOW_WIDTH//2 - score_text.get_width()//2, WINDOW_HEIGHT//2))
+        score_text = render_text(f'Score: {score}', 36, WHITE)
+    screen.blit(score_text, (width//2 - score_text.get_width()//2, height//2))
     
-    restart = font.render('Press R to Restart', True, WHITE)
-    menu = font.render('Press M for Menu', True, WHITE)
-    screen.blit(restart, (WINDOW_WIDTH//2 - restart.get_width()//2, WINDOW_HEIGHT//2 + 50))
-    screen.blit(menu, (WINDOW_WIDTH//2 - menu.get_width()//2, WINDOW_HEIGHT//2 + 100))
+    restart = render_text('Press R to Restart', 36, WHITE)
+    menu = render_text('Press M for Menu', 36, WHITE)
+    screen.blit(restart, (width//2 - restart.get_width()//2, height//2 + 50))
+    screen.blit(menu, (width//2 - menu.get_width()//2, height//2 + 100))
+
+class MazeLayout:
+    """A maze grid plus where Pacman and the ghosts start, as read by `mazes.load_maze`."""
 
-def reset_game(pacman, ms_pacman, ghosts, maze):
-    """Reset the game state."""
+    def __init__(self, grid: List[List[int]], pacman=PACMAN_SPAWN, ms_pacman=None,
+                 ghosts=GHOST_POSITIONS, house=GHOST_HOUSE, name='Classic'):
+        self.grid = grid
+        self.rows = len(grid)
+        self.cols = len(grid[0])
+        self.pacman_spawn = pacman
+        self.ms_pacman_spawn = ms_pacman or pacman
+        self.ghost_spawns = list(ghosts)
+        self.ghost_house = house
+        self.name = name
+        self.pellets = count_pellets(grid)
+        # Bit y * cols + x is set for each dot or power pellet, as GameState.pellet_bits tracks them
+        self.pellet_bits = int(''.join('1' if cell in (2, 3) else '0' for row in reversed(grid)
+                                       for cell in reversed(row)), 2)
+
+    @property
+    def tunnel_rows(self) -> List[int]:
+        return [y for y in range(self.rows) if is_tunnel_row(self.grid, y)]
+
+DEFAULT_LAYOUT = MazeLayout(MAZE)
+
+def reset_game(pacman, ms_pacman, ghosts, maze, layout: MazeLayout = DEFAULT_LAYOUT) -> int:
+    """Reset the game state and return the number of pellets to eat."""
     # Reset Pacman
-    pacman.x = 9
-    pacman.y = 11
-    pacman.direction = (0, 0)
-    pacman.next_direction = (0, 0)
+    pacman.x, pacman.y = layout.pacman_spawn
+    pacman.direction_code = 0
+    pacman.next_direction_code = 0
     pacman.score = 0
     pacman.power_pellet_timer = 0
     pacman.alive = True
 
     # Reset Ms. Pacman if in multiplayer mode
     if ms_pacman:
-        ms_pacman.x = 9
-        ms_pacman.y = 11
-        ms_pacman.direction = (0, 0)
-        ms_pacman.next_direction = (0, 0)
+        ms_pacman.x, ms_pacman.y = layout.ms_pacman_spawn
+        ms_pacman.direction_code = 0
+        ms_pacman.next_direction_code = 0
         ms_pacman.score = 0
         ms_pacman.power_pellet_timer = 0
         ms_pacman.alive = True
 
     # Reset ghosts
-    ghost_positions = [(9, 8), (8, 8), (10, 8), (9, 9)]
-    ghost_colors = [(255, 0, 0), (255, 192, 203), (0, 255, 255), (255, 165, 0)]
-    ghost_names = ["blinky", "pinky", "inky", "clyde"]
-    
-    for ghost, (x, y), color, name in zip(ghosts, ghost_positions, ghost_colors, ghost_names):
+    for ghost, (x, y), color, name in zip(ghosts, layout.ghost_spawns, GHOST_COLORS, GHOST_NAMES):
         ghost.x = x
         ghost.y = y
         ghost.color = color
         ghost.name = name
-        ghost.direction = (0, 0)
+        ghost.home = layout.ghost_house
+        ghost.corner = (0, layout.rows - 1)
+        ghost.direction_code = 0
         ghost.vulnerable = False
         ghost.vulnerable_timer = 0
         ghost.eaten = False
         ghost.respawn_timer = 0
 
     # Reset maze
-    for y in range(len(maze)):
-        for x in range(len(maze[0])):
-            maze[y][x] = MAZE[y][x]
-
-def main():
-    """Main game loop."""
-    # Initialize game objects
-    pacman = Pacman()
-    ms_pacman = None
-    ghosts = [
-        Ghost(9, 8, (255, 0, 0), "blinky"),
-        Ghost(8, 8, (255, 192, 203), "pinky"),
-        Ghost(10, 8, (0, 255, 255), "inky"),
-        Ghost(9, 9, (255, 165, 0), "clyde")
-    ]
-    
-    # Create maze copy
-    maze = [row[:] for row in MAZE]
+    for row, source in zip(maze, layout.grid):
+        row[:] = source
+    return layout.pellets
+
+# The entity attributes that decide how a game plays on, as saved by GameState.snapshot
+PLAYER_STATE = ('x', 'y', 'direction_code', 'next_direction_code', 'score', 'power_pellet_timer', 'alive')
+GHOST_STATE = ('x', 'y', 'direction_code', 'vulnerable', 'vulnerable_timer', 'eaten', 'respawn_timer')
+_player_state = attrgetter(*PLAYER_STATE)
+_ghost_state = attrgetter(*GHOST_STATE)
+
+class GameRandom(random.Random):
+    """random.Random that keeps its saved state until it is next drawn from.
+
+    Saving a Mersenne Twister state copies 625 numbers, which would dominate
+    a snapshot. Ghosts only draw while scared, so most snapshots find the
+    state unchanged and reuse the last one, and restoring a state that is
+    still current costs nothing.
+    """
+    _saved = None
+
+    def seed(self, *args, **kwargs):
+        self._saved = None
+        super().seed(*args, **kwargs)
+
+    def random(self):
+        self._saved = None
+        return super().random()
+
+    def getrandbits(self, k):
+        self._saved = None
+        return super().getrandbits(k)
+
+    def getstate(self):
+        if self._saved is None:
+            self._saved = super().getstate()
+        return self._saved
+
+    def setstate(self, state):
+        if state is not self._saved:
+            super().setstate(state)
+            self._saved = state
+
+class Snapshot:
+    """A frozen game state from GameState.snapshot, for GameState.restore.
+
+    Snapshots compare and hash by the game position alone: mode, entities,
+    pellets left and the win/lose flags. Two snapshots reached by different
+    moves or at different ticks are equal if the game would play on the
+    same from both, so they can key a transposition table. The tick and
+    the RNG state ride along for `restore` but are not compared.
+    """
+    __slots__ = ('layout', 'key', 'tick', 'rng_state', '_hash')
+
+    def __init__(self, layout, key, tick, rng_state):
+        self.layout = layout
+        self.key = key
+        self.tick = tick
+        self.rng_state = rng_state
+        self._hash = None  # Computed on first use; snapshots that are only restored never need it
+
+    def __eq__(self, other):
+        return isinstance(other, Snapshot) and hash(self) == hash(other) and self.key == other.key
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.key)
+        return self._hash
+
+class GameState:
+    """Headless game simulation that owns the maze, both Pacmen and the ghosts.
+
+    `step` runs the same move, collision and win logic as the interactive
+    loop, but with no display, event pump or frame limiter, so bots, tests
+    and analytics can advance the game as fast as the CPU allows.
+
+    The number of pellets left is tracked as they are eaten, so the win
+    check is O(1). With `debug` set, every step also compares that count
+    against a full scan of the maze.
+
+    `layout` picks the maze and spawn points; see mazes.py for loading
+    custom ones. Nothing a tick does scans the maze: on layouts too big
+    for all-pairs tables a ghost's turn searches the junction graph
+    between its target and itself, so ticks there cost more the further
+    ghosts are from their targets, but not the bigger the maze is.
+
+    Scared ghosts turn at random using `rng`, which `reset` seeds from
+    `seed` (a fresh one each game unless given), so the seed and the
+    players' inputs replay a game exactly; see replay.py. Seeds are kept
+    to their low 32 bits, the size a replay stores, so any int can seed a
+    game that is then recorded.
+
+    `snapshot` and `restore` save and roll back the game in time that does
+    not grow with the maze: remaining pellets are mirrored in the
+    `pellet_bits` integer, so a snapshot keeps a reference to it and a
+    restore rewrites only the maze cells that differ. Search code can
+    snapshot once, try moves, and restore between tries; `clone` makes a
+    separate game to run alongside.
+
+    Players and ghosts are kept in spatial hashes, so collisions cost one
+    lookup per ghost however many players there are, and `ghosts_near`
+    answers proximity queries without scanning every ghost. Code that adds
+    or replaces ghosts or players should call `reindex` afterwards.
+    """
+
+    _players = [None]
+
+    def __init__(self, mode=SINGLE_PLAYER, debug=False, layout: MazeLayout = DEFAULT_LAYOUT, seed=None):
+        self.layout = layout
+        self.pacman = Pacman(*layout.pacman_spawn)
+        self.ms_pacman = None
+        self.ghosts = [Ghost(x, y, color, name, layout.ghost_house, (0, layout.rows - 1))
+                       for (x, y), color, name in zip(layout.ghost_spawns, GHOST_COLORS, GHOST_NAMES)]
+        self.maze = [row[:] for row in layout.grid]
+        self.index = get_maze_index(self.maze)
+        self.mode = mode
+        self.debug = debug
+        self.profiler = None
+        self.recorder = None
+        self.collision_radius = COLLISION_RADIUS
+        self.rng = GameRandom()
+        self.reset(mode, seed)
+
+    def reset(self, mode=None, seed=None):
+        """Restart the game, optionally switching between single and multi player."""
+        if mode is not None:
+            self.mode = mode
+        self.seed = random.getrandbits(32) if seed is None else seed & 0xFFFFFFFF
+        self.rng.seed(self.seed)
+        if self.mode == MULTI_PLAYER:
+            if self.ms_pacman is None:
+                self.ms_pacman = Pacman(*self.layout.ms_pacman_spawn, PINK, True)
+        else:
+            self.ms_pacman = None
+        self.pellets_left = reset_game(self.pacman, self.ms_pacman, self.ghosts, self.maze, self.layout)
+        self.pellet_bits = self.layout.pellet_bits
+        for entity in self.players + self.ghosts:
+            entity.prev_x, entity.prev_y = entity.x, entity.y
+        self.eaten_cells = []
+        self.tick = 0
+        self.game_over = False
+        self.won = False
+        self.reindex()
+
+    def reindex(self):
+        """Rebuild the spatial hashes from the current players and ghosts."""
+        self.player_cells = SpatialHash(self.players)
+        self.ghost_cells = SpatialHash(self.ghosts)
+        self.ghost_cells_tick = self.tick
+
+    def ghosts_near(self, x, y, radius) -> List['Ghost']:
+        """Ghosts closer than `radius` to (x, y) on both axes."""
+        # Ghosts are refiled at most once a tick, and only when something asks
+        if self.ghost_cells_tick != self.tick:
+            for ghost in self.ghosts:
+                self.ghost_cells.move(ghost)
+            self.ghost_cells_tick = self.tick
+        return self.ghost_cells.near(x, y, radius)
+
+    @property
+    def players(self) -> List['Pacman']:
+        """Pacman, followed by Ms. Pacman in multi player mode.
+
+        The same list is returned until a player is replaced, so it must not be changed.
+        """
+        players, pacman = self._players, self.pacman
+        if players[0] is not pacman or players[-1] is not (self.ms_pacman or pacman):
+            players = self._players = [pacman, self.ms_pacman] if self.ms_pacman else [pacman]
+        return players
+
+    @property
+    def total_score(self) -> int:
+        return sum(player.score for player in self.players)
+
+    def pellet_eaten(self, x, y):
+        """Record that a player just cleared the dot or power pellet at (x, y)."""
+        self.pellets_left -= 1
+        self.pellet_bits ^= 1 << (y * self.index.cols + x)
+        self.eaten_cells.append((x, y))
+
+    def snapshot(self) -> Snapshot:
+        """Save the game so `restore` can return to it; costs the same on any maze size."""
+        key = (self.mode, self.pellets_left, self.game_over, self.won, self.pellet_bits,
+               tuple(map(_player_state, self.players)), tuple(map(_ghost_state, self.ghosts)))
+        return Snapshot(self.layout, key, self.tick, self.rng.getstate())
+
+    def restore(self, snapshot: Snapshot):
+        """Return the game to a snapshot taken from it or from a clone of it."""
+        if snapshot.layout is not self.layout:
+            raise ValueError(f'snapshot is of a game on {snapshot.layout.name!r}, not {self.layout.name!r}')
+        mode, self.pellets_left, self.game_over, self.won, pellet_bits, players, ghosts = snapshot.key
+        if mode != self.mode:
+            self.reset(mode)
+
+        # Put back, or clear again, only the pellets that differ
+        maze, grid, cols = self.maze, self.layout.grid, self.index.cols
+        changed = self.pellet_bits ^ pellet_bits
+        while changed:
+            bit = changed & -changed
+            y, x = divmod(bit.bit_length() - 1, cols)
+            maze[y][x] = grid[y][x] if pellet_bits & bit else 0
+            changed ^= bit
+        self.pellet_bits = pellet_bits
+        self.eaten_cells = []  # A new list tells the renderer to redraw the pellets
+
+        for entities, names, values in ((self.players, PLAYER_STATE, players), (self.ghosts, GHOST_STATE, ghosts)):
+            for entity, state in zip(entities, values):
+                for name, value in zip(names, state):
+                    setattr(entity, name, value)
+                entity.prev_x, entity.prev_y = entity.x, entity.y
+        for player in self.players:
+            self.player_cells.move(player)
+        self.ghost_cells_tick = -1  # Refile the ghosts when next asked
+        self.tick = snapshot.tick
+        self.rng.setstate(snapshot.rng_state)
+
+    def clone(self) -> 'GameState':
+        """An independent copy of the game, sharing only the layout and its index."""
+        other = object.__new__(GameState)
+        other.__dict__.update(self.__dict__)
+        other.pacman = self.pacman.copy()
+        other.ms_pacman = self.ms_pacman.copy() if self.ms_pacman else None
+        other.ghosts = [ghost.copy() for ghost in self.ghosts]
+        other.maze = [row[:] for row in self.maze]
+        other.eaten_cells = []
+        other.profiler = other.recorder = None
+        other.rng = GameRandom()
+        other.rng.setstate(self.rng.getstate())
+        other.reindex()
+        return other
+
+    def step(self, inputs=()) -> bool:
+        """Advance the game by one tick and return True while it is still running.
+
+        `inputs` holds a queued direction per player (Pacman first, then
+        Ms. Pacman); None leaves that player's queued direction unchanged.
+        """
+        if self.game_over:
+            return False
+
+        # A tick allocates nothing in steady play (see test_pacman's TestAllocations), which keeps
+        # the garbage collector from pausing mid-game; the loops below avoid zip and list building
+        players, ghosts = self.players, self.ghosts
+        for index in range(min(len(players), len(inputs))):
+            if inputs[index] is not None:
+                players[index].next_direction = inputs[index]
+
+        # Remember where everything was so frames can be drawn between ticks
+        for player in players:
+            player.prev_x, player.prev_y = player.x, player.y
+        for ghost in ghosts:
+            ghost.prev_x, ghost.prev_y = ghost.x, ghost.y
+
+        # Update game objects
+        profiler = self.profiler
+        player_cells, radius = self.player_cells, self.collision_radius
+        for player in players:
+            if player.alive:
+                player.move(self.maze, ghosts, self)
+            player_cells.move(player)
+        if profiler is not None:
+            profiler.lap('pacman.move')
+
+        # A handful of players are checked directly, as `near` would, without it building a list
+        scan = len(players) <= SPATIAL_HASH_SCAN_SIZE
+        for ghost in ghosts:
+            ghost.move(self.maze, self.pacman, ghosts, self.index, self.rng)
+            if profiler is not None:
+                profiler.lap('ghost.move.' + ghost.name)
+
+            # Check collisions with the players near this ghost
+            for player in players if scan else player_cells.near(ghost.x, ghost.y, radius):
+                if player.alive and abs(player.x - ghost.x) < radius and abs(player.y - ghost.y) < radius:
+                    if ghost.vulnerable:
+                        ghost.eaten = True
+                        player.score += GHOST_POINTS
+                    else:
+                        player.alive = False
+            if profiler is not None:
+                profiler.lap('collisions')
+
+        self.tick += 1
+
+        if self.debug and self.pellets_left != count_pellets(self.maze):
+            raise RuntimeError(f'Pellet counter drifted: {self.pellets_left} counted, '
+                               f'{count_pellets(self.maze)} in the maze')
+
+        # Check win/lose conditions
+        self.won = self.pellets_left == 0
+        for player in players:
+            if player.alive:
+                break
+        else:
+            self.game_over = True
+        if self.won:
+            self.game_over = True
+        if self.recorder is not None:
+            self.recorder.record(self)
+        return not self.game_over
+
+    def state_hash(self) -> bytes:
+        """An 8-byte digest of everything that decides how the game plays on."""
+        digest = hashlib.blake2b(struct.pack('<IIBB', self.tick, self.pellets_left, self.game_over, self.won),
+                                 digest_size=8)
+        for player in self.players:
+            digest.update(struct.pack('<ddbbqiB', player.x, player.y, player.direction_code,
+                                      player.next_direction_code, player.score, player.power_pellet_timer,
+                                      player.alive))
+        for ghost in self.ghosts:
+            digest.update(struct.pack('<ddbBiBi', ghost.x, ghost.y, ghost.direction_code, ghost.vulnerable,
+                                      ghost.vulnerable_timer, ghost.eaten, ghost.respawn_timer))
+        for row in self.maze:
+            digest.update(bytes(row))
+        return digest.digest()
+
+class FixedTimestep:
+    """Turns elapsed wall-clock time into a whole number of simulation ticks.
+
+    Leftover time carries over to the next frame and gives the fraction of
+    a tick that frames should interpolate sprite positions by. If frames
+    fall far behind, at most `max_ticks` are run and the backlog is dropped
+    so a slow frame cannot snowball into ever longer ones.
+    """
+
+    def __init__(self, rate=SIM_RATE, max_ticks=MAX_CATCH_UP_TICKS):
+        self.tick_time = 1.0 / rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+
+    def reset(self):
+        self.accumulator = 0.0
+
+    def advance(self, elapsed) -> int:
+        """Add `elapsed` seconds and return the number of ticks now due."""
+        self.accumulator += elapsed
+        ticks = 0
+        while self.accumulator >= self.tick_time and ticks < self.max_ticks:
+            self.accumulator -= self.tick_time
+            ticks += 1
+        if ticks == self.max_ticks:
+            self.accumulator = min(self.accumulator, self.tick_time)
+        return ticks
+
+    @property
+    def alpha(self) -> float:
+        """How far the display is between the last tick and the next one."""
+        return min(self.accumulator / self.tick_time, 1.0)
+
+def read_direction(keys, left, right, up, down):
+    """Map a set of pressed keys to a queued direction, or None if none are held."""
+    if keys[left]:
+        return (-1, 0)
+    elif keys[right]:
+        return (1, 0)
+    elif keys[up]:
+        return (0, -1)
+    elif keys[down]:
+        return (0, 1)
+    return None
+
+def init_display(layout: MazeLayout = DEFAULT_LAYOUT):
+    """Initialize Pygame and create a game window sized for `layout`, frame clock and sprite atlas."""
+    pygame.init()
+    # Fonts do not survive a pygame.quit(), so start with empty text caches
+    _fonts.clear()
+    _texts.clear()
+    get_sprite_atlas()
+    screen = pygame.display.set_mode((layout.cols * CELL_SIZE, layout.rows * CELL_SIZE + HUD_HEIGHT))
+    pygame.display.set_caption('Pacman')
+    clock = pygame.time.Clock()
+    return screen, clock
+
+def steer(state, inputs, autopilots):
+    """Let each autopilot queue its player's direction for the next tick, sharing one search budget."""
+    if autopilots:
+        deadline = time.perf_counter() + max(autopilot.budget for autopilot in autopilots)
+        for autopilot in autopilots:
+            inputs[autopilot.player] = autopilot.choose(state, deadline)
+        if state.profiler is not None:
+            state.profiler.lap('autopilot')
+
+def run_turbo(state, inputs, until, autopilots=()):
+    """Step the game until it ends or the clock passes `until`, steering the autopilots before every tick."""
+    while True:
+        steer(state, inputs, autopilots)
+        if not state.step(inputs) or time.perf_counter() >= until:
+            return
+
+def main(turbo=False, profile=False, trace_path=None, layout: MazeLayout = DEFAULT_LAYOUT, record_path=None,
+         autopilot_players=()):
+    """Main game loop.
+
+    The simulation runs at a fixed SIM_RATE ticks per second however long
+    frames take to draw, and frames interpolate sprites between ticks. In
+    turbo mode (toggled with T) each frame instead runs as many ticks as
+    fit in a frame's worth of time. With `profile` set, frame phases are
+    timed, shown in an overlay and written to `trace_path` on exit. With
+    `record_path` set, each finished game is saved there as a replay.
+    Players listed in `autopilot_players` (0 for Pacman, 1 for Ms. Pacman)
+    are steered by an Autopilot instead of the keyboard.
+    """
+    screen, clock = init_display(layout)
+    renderer = Renderer(screen)
+    timestep = FixedTimestep()
+    state = GameState(layout=layout)
+    profiler = None
+    if profile or trace_path:
+        from profiling import FrameProfiler
+        profiler = state.profiler = renderer.profiler = FrameProfiler(trace_path)
+    if record_path:
+        from replay import ReplayRecorder
+    autopilots = []
+    if autopilot_players:
+        from autopilot import Autopilot
+        autopilots = [Autopilot(player) for player in autopilot_players]
+
+    def start_game(mode=None):
+        state.reset(mode)
+        timestep.reset()
+        if record_path:
+            state.recorder = ReplayRecorder(state)
     
     # Game state
     game_state = MENU
     running = True
+    elapsed = 0.0
     
     while running:
+        if profiler is not None:
+            profiler.begin_frame()
+        
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -535,118 +1843,92 @@ def main():
                 if game_state == MENU:
                     if event.key == pygame.K_1:
                         game_state = SINGLE_PLAYER
-                        reset_game(pacman, None, ghosts, maze)
+                        start_game(SINGLE_PLAYER)
                     elif event.key == pygame.K_2:
                         game_state = MULTI_PLAYER
-                        ms_pacman = Pacman(9, 11, PINK, True)
-                        reset_game(pacman, ms_pacman, ghosts, maze)
+                        start_game(MULTI_PLAYER)
                 
                 elif game_state == GAME_OVER:
                     if event.key == pygame.K_r:
-                        if ms_pacman:
-                            game_state = MULTI_PLAYER
-                        else:
-                            game_state = SINGLE_PLAYER
-                        reset_game(pacman, ms_pacman, ghosts, maze)
+                        game_state = state.mode
+                        start_game()
                     elif event.key == pygame.K_m:
                         game_state = MENU
-                        ms_pacman = None
+                
+                elif event.key == pygame.K_t:
+                    turbo = not turbo
+                    timestep.reset()
         
         if game_state == MENU:
             draw_menu(screen)
+            pygame.display.flip()
+            renderer.invalidate()
         
         elif game_state in [SINGLE_PLAYER, MULTI_PLAYER]:
-            # Handle Pacman input
+            # Mr. Pacman uses the arrow keys, Ms. Pacman uses WASD
             keys = pygame.key.get_pressed()
+            inputs = [read_direction(keys, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN),
+                      read_direction(keys, pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s)]
+            if profiler is not None:
+                profiler.lap('input')
             
-            # Mr. Pacman controls (arrow keys)
-            if keys[pygame.K_LEFT]:
-                pacman.next_direction = (-1, 0)
-            elif keys[pygame.K_RIGHT]:
-                pacman.next_direction = (1, 0)
-            elif keys[pygame.K_UP]:
-                pacman.next_direction = (0, -1)
-            elif keys[pygame.K_DOWN]:
-                pacman.next_direction = (0, 1)
-            
-            # Ms. Pacman controls (WASD)
-            if game_state == MULTI_PLAYER and ms_pacman:
-                if keys[pygame.K_a]:
-                    ms_pacman.next_direction = (-1, 0)
-                elif keys[pygame.K_d]:
-                    ms_pacman.next_direction = (1, 0)
-                elif keys[pygame.K_w]:
-                    ms_pacman.next_direction = (0, -1)
-                elif keys[pygame.K_s]:
-                    ms_pacman.next_direction = (0, 1)
-            
-            # Update game objects
-            if pacman.alive:
-                pacman.move(maze, ghosts)
-            if game_state == MULTI_PLAYER and ms_pacman and ms_pacman.alive:
-                ms_pacman.move(maze, ghosts)
-            
-            for ghost in ghosts:
-                ghost.move(maze, pacman, ghosts)
-                
-                # Check collisions with Mr. Pacman
-                if pacman.alive and abs(ghost.x - pacman.x) < 0.5 and abs(ghost.y - pacman.y) < 0.5:
-                    if ghost.vulnerable:
-                        ghost.eaten = True
-                        pacman.score += GHOST_POINTS
-                    else:
-                        pacman.alive = False
-                
-                # Check collisions with Ms. Pacman
-                if game_state == MULTI_PLAYER and ms_pacman and ms_pacman.alive:
-                    if abs(ghost.x - ms_pacman.x) < 0.5 and abs(ghost.y - ms_pacman.y) < 0.5:
-                        if ghost.vulnerable:
-                            ghost.eaten = True
-                            ms_pacman.score += GHOST_POINTS
-                        else:
-                            ms_pacman.alive = False
-            
-            # Draw everything
-            screen.fill(BLACK)
-            draw_maze(screen, maze)
-            if pacman.alive:
-                pacman.draw(screen)
-            if game_state == MULTI_PLAYER and ms_pacman and ms_pacman.alive:
-                ms_pacman.draw(screen)
-            for ghost in ghosts:
-                ghost.draw(screen)
-            
-            # Draw scores
-            font = pygame.font.Font(None, 36)
-            score_text = font.render(f'P1: {pacman.score}', True, YELLOW)
-            screen.blit(score_text, (10, WINDOW_HEIGHT - 40))
-            if game_state == MULTI_PLAYER and ms_pacman:
-                ms_score_text = font.render(f'P2: {ms_pacman.score}', True, PINK)
-                screen.blit(ms_score_text, (WINDOW_WIDTH - 120, WINDOW_HEIGHT - 40))
+            # Autopilots choose again before every tick, however many a frame runs
+            if turbo:
+                run_turbo(state, inputs, time.perf_counter() + 1.0 / FPS, autopilots)
+                alpha = 1.0
+            else:
+                for _ in range(timestep.advance(elapsed)):
+                    steer(state, inputs, autopilots)
+                    if not state.step(inputs):
+                        break
+                alpha = timestep.alpha
             
-            # Check win/lose conditions
-            if game_state == SINGLE_PLAYER:
-                if not pacman.alive:
-                    game_state = GAME_OVER
-                elif check_win(maze):
-                    game_state = GAME_OVER
-            else:  # Multi-player
-                if not pacman.alive and not ms_pacman.alive:
-                    game_state = GAME_OVER
-                elif check_win(maze):
-                    game_state = GAME_OVER
+            if state.game_over:
+                game_state = GAME_OVER
+                alpha = 1.0
+                if state.recorder is not None:
+                    state.recorder.finish(state).save(record_path)
+            renderer.draw(state, alpha)
         
         elif game_state == GAME_OVER:
-            total_score = pacman.score
-            if ms_pacman:
-                total_score += ms_pacman.score
-            won = check_win(maze)
-            draw_game_over(screen, won, total_score, game_state)
+            draw_game_over(screen, state.won, state.total_score, state.mode)
+            pygame.display.flip()
+            renderer.invalidate()
         
-        pygame.display.flip()
-        clock.tick(FPS)
+        if profiler is not None:
+            profiler.end_frame()
+        elapsed = clock.tick(0 if turbo else FPS) / 1000.0
     
+    if profiler is not None:
+        profiler.close()
     pygame.quit()
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Play Pacman.')
+    parser.add_argument('--turbo', action='store_true',
+                        help='run as many simulation ticks as the CPU allows (toggle in game with T)')
+    parser.add_argument('--profile', action='store_true',
+                        help='time each frame phase and show p50/p95/p99 in an overlay')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='with --profile, write per-frame timings to FILE (.json for Chrome trace, .csv)')
+    parser.add_argument('--maze', metavar='FILE', help='play on a maze loaded from FILE (see mazes.py)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='save each finished game to FILE as a replay (check it with replay.py)')
+    parser.add_argument('--autopilot', choices=['pacman', 'ms_pacman', 'both'],
+                        help='let the computer steer Pacman, Ms. Pacman or both')
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help='play on a game server started with server.py')
+    parser.add_argument('--room', default='', help='with --connect, join this room (default: any open one)')
+    args = parser.parse_args()
+    layout = DEFAULT_LAYOUT
+    if args.maze:
+        from mazes import load_maze
+        layout = load_maze(args.maze)
+    if args.connect:
+        from client import run_client
+        from server import DEFAULT_PORT
+        host, _, port = args.connect.partition(':')
+        run_client(host, int(port or DEFAULT_PORT), args.room, layout)
+    else:
+        autopilot_players = {None: (), 'pacman': (0,), 'ms_pacman': (1,), 'both': (0, 1)}[args.autopilot]
+        main(turbo=args.turbo, profile=args.profile, trace_path=args.trace, layout=layout, record_path=args.record,
+             autopilot_players=autopilot_players)
@@ -0,0 +1,154 @@
+import csv
+import json
+import tempfile
+import time
+from collections import deque
+
+from pacman import get_font, pygame
+
+PROFILE_WINDOW = 300
+OVERLAY_REFRESH_FRAMES = 15
+FRAME_BUDGET_MS = 22.0
+OVERLAY_FONT_SIZE = 20
+OVERLAY_COLOR = (0, 255, 0)
+OVERLAY_ALERT_COLOR = (255, 64, 64)
+OVERLAY_BACKGROUND = (0, 0, 0, 180)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+class FrameProfiler:
+    """Times the phases of every frame: input, simulation, drawing and display.
+
+    Code being profiled calls `lap(phase)` at the end of each phase, which
+    charges the time since the previous lap to that phase; a phase hit more
+    than once in a frame (several sim ticks, one lap per ghost) adds up.
+    The last PROFILE_WINDOW frames, held in a bounded deque, feed rolling
+    p50/p95/p99 figures for the on-screen overlay. With a trace path, each
+    frame and its laps are written to a temporary spool file as the frame
+    ends, so memory stays flat however long the session runs, and `close()`
+    turns the spool into the trace: Chrome trace JSON for a `.json` path,
+    one row per frame for `.csv`. GameState and Renderer only look at their
+    `profiler` attribute, so with profiling off the cost is one `is not
+    None` check per phase.
+    """
+
+    def __init__(self, trace_path=None, window=PROFILE_WINDOW):
+        self.trace_path = trace_path
+        self.history = deque(maxlen=window)
+        self.phases = []
+        self.events = []  # The current frame's laps, until it is spooled
+        self.spool = tempfile.TemporaryFile('w+') if trace_path else None
+        self.frame = None
+        self.frame_start = 0.0
+        self.last = 0.0
+        self.origin = time.perf_counter()
+        self.stats = {}
+        self.overlay = None
+        self.overlay_age = OVERLAY_REFRESH_FRAMES
+
+    def begin_frame(self):
+        self.frame = {}
+        self.events = []
+        self.frame_start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the last lap to `phase`."""
+        now = time.perf_counter()
+        if self.frame is None:
+            self.last = now
+            return
+        if phase not in self.frame:
+            self.frame[phase] = 0.0
+            if phase not in self.phases:
+                self.phases.append(phase)
+        self.frame[phase] += now - self.last
+        if self.spool is not None:
+            self.events.append((phase, self.last - self.origin, now - self.last))
+        self.last = now
+
+    def end_frame(self):
+        """Close the current frame, add it to the rolling window and spool it for the trace."""
+        if self.frame is None:
+            return
+        self.frame['frame'] = time.perf_counter() - self.frame_start
+        self.history.append(self.frame)
+        if self.spool is not None:
+            self.spool.write(json.dumps([self.frame_start - self.origin, self.frame, self.events]) + '\n')
+        self.frame = None
+        self.overlay_age += 1
+
+    def percentiles(self, phase):
+        """Rolling (p50, p95, p99) for a phase in milliseconds."""
+        values = sorted(frame.get(phase, 0.0) * 1000.0 for frame in self.history)
+        return percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99)
+
+    def summary(self):
+        """Rolling percentiles for every phase seen so far, plus the whole frame."""
+        return {phase: self.percentiles(phase) for phase in self.phases + ['frame']}
+
+    def draw_overlay(self, screen):
+        """Draw the rolling stats in the top-left corner and return the area covered."""
+        if self.overlay is None or self.overlay_age >= OVERLAY_REFRESH_FRAMES:
+            self.overlay = self._render_overlay()
+            self.overlay_age = 0
+        return screen.blit(self.overlay, (4, 4))
+
+    def _render_overlay(self):
+        font = get_font(OVERLAY_FONT_SIZE)
+        lines = [('phase (ms)       p50    p95    p99', OVERLAY_COLOR)]
+        for phase, (p50, p95, p99) in self.summary().items():
+            color = OVERLAY_ALERT_COLOR if phase == 'frame' and p95 > FRAME_BUDGET_MS else OVERLAY_COLOR
+            lines.append((f'{phase:<16} {p50:6.2f} {p95:6.2f} {p99:6.2f}', color))
+        rendered = [font.render(text, True, color) for text, color in lines]
+        width = max(line.get_width() for line in rendered) + 8
+        height = sum(line.get_height() for line in rendered) + 8
+        overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+        overlay.fill(OVERLAY_BACKGROUND)
+        y = 4
+        for line in rendered:
+            overlay.blit(line, (4, y))
+            y += line.get_height()
+        return overlay
+
+    def close(self):
+        """Write the trace file from the spool, if one was asked for."""
+        if self.spool is None:
+            return
+        self.spool.seek(0)
+        frames = (json.loads(line) for line in self.spool)
+        if self.trace_path.endswith('.csv'):
+            self._write_csv(frames)
+        else:
+            self._write_chrome_trace(frames)
+        self.spool.close()
+        self.spool = None
+
+    def _write_csv(self, frames):
+        columns = self.phases + ['frame']
+        with open(self.trace_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame_index', 'start_ms'] + [f'{phase}_ms' for phase in columns])
+            for index, (start, frame, _) in enumerate(frames):
+                writer.writerow([index, f'{start * 1000.0:.3f}'] +
+                                [f'{frame.get(phase, 0.0) * 1000.0:.4f}' for phase in columns])
+
+    def _write_chrome_trace(self, frames):
+        # Complete ("X") events in microseconds, viewable in chrome://tracing or Perfetto,
+        # written a frame at a time so the whole trace is never in memory
+        with open(self.trace_path, 'w') as f:
+            f.write('{"displayTimeUnit": "ms", "traceEvents": [')
+            separator = ''
+            for start, frame, laps in frames:
+                events = [{'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': start * 1e6,
+                           'dur': frame['frame'] * 1e6}]
+                events.extend({'name': phase, 'ph': 'X', 'pid': 0, 'tid': 1, 'ts': lap_start * 1e6,
+                               'dur': duration * 1e6} for phase, lap_start, duration in laps)
+                for event in events:
+                    f.write(separator + json.dumps(event))
+                    separator = ', '
+            f.write(']}')
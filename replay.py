@@ -0,0 +1,233 @@
+"""Recording games and replaying them headless.
+
+A replay holds everything needed to re-run a game exactly: the RNG seed,
+the mode, which maze it was played on, and each player's queued direction
+on every tick, run-length encoded since players hold a direction for many
+ticks. State hashes taken every `interval` ticks, the final hash and the
+final scores let the replayer prove the re-run is the game that was
+recorded, and say on which tick it went differently if not.
+
+File layout, little-endian:
+
+    magic 'PMRP', version u8, mode u8, player count u8, seed u32,
+    ticks u32, checkpoint interval u16, maze id (8 bytes),
+    final hash (8 bytes), final score i64 per player,
+    checkpoint count u32, checkpoint hashes (8 bytes each),
+    then per player: run count u32 and runs of (direction code u8, length varint)
+"""
+import argparse
+import hashlib
+import struct
+import sys
+import time
+
+from fastforward import fast_forward
+from pacman import GameState, DEFAULT_LAYOUT, DIRECTIONS, MazeLayout
+
+MAGIC = b'PMRP'
+VERSION = 1
+CHECKPOINT_INTERVAL = 256
+HEADER = struct.Struct('<4sBBBIIH8s8s')
+
+class ReplayError(ValueError):
+    """A replay that cannot be read or was recorded on a different maze."""
+
+class ReplayDivergence(ReplayError):
+    """Re-running a replay gave a different game from the one recorded."""
+
+    def __init__(self, message, tick):
+        super().__init__(message)
+        self.tick = tick
+
+def layout_id(layout: MazeLayout) -> bytes:
+    """An 8-byte digest of a layout's grid and spawn cells; the name does not count."""
+    key = (layout.grid, layout.pacman_spawn, layout.ms_pacman_spawn, layout.ghost_spawns, layout.ghost_house)
+    return hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data: bytes, offset: int):
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ReplayError('replay is truncated')
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class Replay:
+    """A recorded game: how it started, every player's inputs and the hashes to check against."""
+
+    def __init__(self, seed, mode, maze_id, players, interval=CHECKPOINT_INTERVAL):
+        self.seed = seed
+        self.mode = mode
+        self.maze_id = maze_id
+        self.interval = interval
+        self.ticks = 0
+        self.runs = [[] for _ in range(players)]  # Per player, [direction code, ticks] pairs
+        self.checkpoints = []  # State hash after every `interval` ticks
+        self.final_hash = bytes(8)
+        self.scores = [0] * players
+
+    def inputs(self):
+        """Yield each tick's inputs, one direction per player, as GameState.step takes them."""
+        codes = [b''.join(bytes([code]) * length for code, length in runs) for runs in self.runs]
+        for tick_codes in zip(*codes):
+            yield [DIRECTIONS[code] for code in tick_codes]
+
+    def spans(self):
+        """Yield (inputs, ticks) for each stretch of ticks over which no player's input changes."""
+        runs = [iter(player_runs) for player_runs in self.runs]
+        current = [list(next(player_runs, (0, 0))) for player_runs in runs]
+        while all(length for _, length in current):
+            ticks = min(length for _, length in current)
+            yield [DIRECTIONS[code] for code, _ in current], ticks
+            for player, run in enumerate(current):
+                run[1] -= ticks
+                if not run[1]:
+                    current[player] = list(next(runs[player], (0, 0)))
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.mode, len(self.runs), self.seed, self.ticks,
+                                    self.interval, self.maze_id, self.final_hash))
+        out += struct.pack(f'<{len(self.scores)}q', *self.scores)
+        out += struct.pack('<I', len(self.checkpoints))
+        for checkpoint in self.checkpoints:
+            out += checkpoint
+        for runs in self.runs:
+            out += struct.pack('<I', len(runs))
+            for code, length in runs:
+                out.append(code)
+                _write_varint(out, length)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Replay':
+        if len(data) < HEADER.size or data[:4] != MAGIC:
+            raise ReplayError('not a replay file')
+        magic, version, mode, players, seed, ticks, interval, maze_id, final_hash = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ReplayError(f'replay format version {version} is not supported (expected {VERSION})')
+        replay = cls(seed, mode, maze_id, players, interval)
+        replay.ticks, replay.final_hash = ticks, final_hash
+        try:
+            offset = HEADER.size
+            replay.scores = list(struct.unpack_from(f'<{players}q', data, offset))
+            offset += 8 * players
+            count, = struct.unpack_from('<I', data, offset)
+            offset += 4
+            replay.checkpoints = [data[offset + 8 * i:offset + 8 * i + 8] for i in range(count)]
+            offset += 8 * count
+            for runs in replay.runs:
+                count, = struct.unpack_from('<I', data, offset)
+                offset += 4
+                for _ in range(count):
+                    code = data[offset]
+                    length, offset = _read_varint(data, offset + 1)
+                    runs.append([code, length])
+        except (struct.error, IndexError):
+            raise ReplayError('replay is truncated') from None
+        if any(sum(length for _, length in runs) != ticks for runs in replay.runs):
+            raise ReplayError(f'replay inputs do not cover its {ticks} ticks')
+        return replay
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path) -> 'Replay':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+class ReplayRecorder:
+    """Records a game as it is played.
+
+    Set it as a GameState's `recorder` right after `reset`; `step` then
+    calls `record` at the end of every tick. `finish` returns the Replay.
+    """
+
+    def __init__(self, state: GameState, interval=CHECKPOINT_INTERVAL):
+        self.replay = Replay(state.seed, state.mode, layout_id(state.layout), len(state.players), interval)
+
+    def record(self, state: GameState):
+        """Note the inputs the tick that just ran saw, and a checkpoint when one is due."""
+        replay = self.replay
+        for runs, player in zip(replay.runs, state.players):
+            code = player.next_direction_code
+            if runs and runs[-1][0] == code:
+                runs[-1][1] += 1
+            else:
+                runs.append([code, 1])
+        replay.ticks = state.tick
+        if state.tick % replay.interval == 0:
+            replay.checkpoints.append(state.state_hash())
+
+    def finish(self, state: GameState) -> Replay:
+        """The replay so far, sealed with the game's current scores and state hash."""
+        self.replay.scores = [player.score for player in state.players]
+        self.replay.final_hash = state.state_hash()
+        return self.replay
+
+def play_replay(replay: Replay, layout: MazeLayout = DEFAULT_LAYOUT, verify=True) -> GameState:
+    """Re-run a replay headless and return the final state.
+
+    With `verify` set, raises ReplayDivergence at the first checkpoint, or
+    the end of the game, where the re-run differs from the recording.
+    """
+    if layout_id(layout) != replay.maze_id:
+        raise ReplayError(f'replay was recorded on a different maze than {layout.name!r}')
+    state = GameState(replay.mode, layout=layout, seed=replay.seed)
+    checkpoints = iter(replay.checkpoints)
+    interval = replay.interval
+    for inputs, ticks in replay.spans():
+        # Skip through each stretch of held inputs, stopping at every checkpoint
+        while ticks and not state.game_over:
+            chunk = min(ticks, interval - state.tick % interval)
+            fast_forward(state, chunk, inputs)
+            ticks -= chunk
+            if verify and state.tick % interval == 0 and next(checkpoints, None) != state.state_hash():
+                raise ReplayDivergence(f'game state differs from the recording at tick {state.tick}', state.tick)
+    if verify:
+        if state.tick != replay.ticks:
+            raise ReplayDivergence(f'game ended at tick {state.tick}, recording ran {replay.ticks} ticks',
+                                   state.tick)
+        scores = [player.score for player in state.players]
+        if scores != replay.scores:
+            raise ReplayDivergence(f'final scores {scores} differ from the recorded {replay.scores}', state.tick)
+        if state.state_hash() != replay.final_hash:
+            raise ReplayDivergence('final game state differs from the recording', state.tick)
+    return state
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Re-run a recorded Pacman game and check it matches.')
+    parser.add_argument('replay', help='replay file written by pacman.py --record')
+    parser.add_argument('--maze', metavar='FILE', help='maze file the game was played on (default: built-in)')
+    args = parser.parse_args(argv)
+
+    layout = DEFAULT_LAYOUT
+    if args.maze:
+        from mazes import load_maze
+        layout = load_maze(args.maze)
+    replay = Replay.load(args.replay)
+    start = time.perf_counter()
+    try:
+        state = play_replay(replay, layout)
+    except ReplayDivergence as error:
+        print(f'MISMATCH: {error}')
+        return 1
+    elapsed = time.perf_counter() - start
+    scores = [player.score for player in state.players]
+    print(f'Verified {state.tick} ticks in {elapsed:.2f}s ({state.tick / max(elapsed, 1e-9):.0f} ticks/s); '
+          f'scores {scores}, {"won" if state.won else "lost"}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,407 @@
+"""Networked play: an asyncio server that runs every game and streams it to thin clients.
+
+The server is authoritative. Clients only send the direction their player
+is holding; the server steps each room's GameState at a fixed tick rate
+and broadcasts what changed. One process holds many rooms, all advanced
+by a single tick loop, so the cost per room is one `step` plus one encode
+per tick whatever the number of clients.
+
+Messages are length-prefixed frames over TCP: a u32 body length, a u8
+message type, then the body, little-endian throughout.
+
+    client -> server
+      JOIN     mode u8, room name (utf-8; empty joins any room with a free slot)
+      INPUT    direction code u8, 0 when no key is held
+      RESTART  start the room's next game once this one is over
+    server -> client
+      WELCOME  player slot u8, mode u8, tick rate u16, maze id (8 bytes)
+      STATE    tick u32, flags u8, changed entity mask u8, a record per
+               changed entity (players, then ghosts), then the pellets:
+               the whole pellet bitset in a keyframe, otherwise a u16
+               count and the u32 cell index of each pellet eaten since
+      ERROR    reason (utf-8), sent before the server drops the client
+
+STATE messages are deltas against the room's previous one, so a client
+must apply every one of them in order; it gets a keyframe when it joins
+and everyone does when a new game starts.
+"""
+import argparse
+import asyncio
+import random
+import struct
+import sys
+import time
+from typing import Dict, List, Optional
+
+from pacman import DEFAULT_LAYOUT, DIRECTIONS, MULTI_PLAYER, SIM_RATE, SINGLE_PLAYER, GameState, MazeLayout
+from replay import layout_id
+
+DEFAULT_PORT = 7777
+MAX_ROOMS = 1000
+MAX_CLIENT_MESSAGE = 256  # Clients only send tiny messages; anything longer is a broken client
+MAX_SEND_BUFFER = 1 << 18  # Bytes queued for a client that is not reading before it is dropped
+MAX_CATCH_UP_TICKS = 5  # Ticks run back to back after a stall before the rest are skipped
+
+JOIN, INPUT, RESTART = 0x01, 0x02, 0x03
+WELCOME, STATE, ERROR = 0x81, 0x82, 0x83
+FRAME = struct.Struct('<IB')
+WELCOME_BODY = struct.Struct('<BBH8s')
+STATE_HEADER = struct.Struct('<IBB')
+PLAYER_RECORD = struct.Struct('<ffBiHB')  # x, y, direction code, score, power pellet timer, alive
+GHOST_RECORD = struct.Struct('<ffBBHB')  # x, y, direction code, vulnerable, vulnerable timer, eaten
+KEYFRAME, OVER, WON = 1, 2, 4
+
+class ProtocolError(ValueError):
+    """A malformed message, or one that makes no sense in the connection's state."""
+
+def frame(message_type: int, body: bytes = b'') -> bytes:
+    return FRAME.pack(len(body), message_type) + body
+
+def split_frames(buffer: bytearray, max_size=None) -> List[tuple]:
+    """Remove and return the complete (type, body) frames at the start of `buffer`."""
+    messages = []
+    offset = 0
+    while len(buffer) - offset >= FRAME.size:
+        length, message_type = FRAME.unpack_from(buffer, offset)
+        if max_size is not None and length > max_size:
+            raise ProtocolError(f'{length}-byte message is too long')
+        end = offset + FRAME.size + length
+        if end > len(buffer):
+            break
+        messages.append((message_type, bytes(buffer[offset + FRAME.size:end])))
+        offset = end
+    del buffer[:offset]
+    return messages
+
+async def read_frame(reader: asyncio.StreamReader, max_size=None):
+    """The next (type, body) frame from a stream; raises IncompleteReadError at the end."""
+    length, message_type = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if max_size is not None and length > max_size:
+        raise ProtocolError(f'{length}-byte message is too long')
+    return message_type, await reader.readexactly(length)
+
+class StateEncoder:
+    """Turns a room's GameState into STATE messages holding only what changed since the last one."""
+
+    def __init__(self):
+        self.records = None
+        self.eaten_cells = None
+        self.eaten_sent = 0
+
+    @staticmethod
+    def _records(state):
+        return ([PLAYER_RECORD.pack(player.x, player.y, player.direction_code, player.score,
+                                    player.power_pellet_timer, player.alive) for player in state.players] +
+                [GHOST_RECORD.pack(ghost.x, ghost.y, ghost.direction_code, ghost.vulnerable, ghost.vulnerable_timer,
+                                   ghost.eaten) for ghost in state.ghosts])
+
+    @staticmethod
+    def _flags(state):
+        return (OVER if state.game_over else 0) | (WON if state.won else 0)
+
+    def keyframe(self, state: GameState) -> bytes:
+        """The whole game; does not move the baseline the next delta is taken against."""
+        records = self._records(state)
+        index = state.index
+        bits = state.pellet_bits.to_bytes((index.cols * index.rows + 7) // 8, 'little')
+        header = STATE_HEADER.pack(state.tick, self._flags(state) | KEYFRAME, (1 << len(records)) - 1)
+        return frame(STATE, header + b''.join(records) + bits)
+
+    def delta(self, state: GameState) -> bytes:
+        """What changed since the last delta, or a keyframe if the game was reset or restored since."""
+        records = self._records(state)
+        if state.eaten_cells is not self.eaten_cells or self.records is None or len(records) != len(self.records):
+            self.records, self.eaten_cells, self.eaten_sent = records, state.eaten_cells, len(state.eaten_cells)
+            return self.keyframe(state)
+        mask = 0
+        changed = []
+        for number, (record, last) in enumerate(zip(records, self.records)):
+            if record != last:
+                mask |= 1 << number
+                changed.append(record)
+        cols = state.index.cols
+        eaten = state.eaten_cells[self.eaten_sent:]
+        self.records, self.eaten_sent = records, len(state.eaten_cells)
+        return frame(STATE, STATE_HEADER.pack(state.tick, self._flags(state), mask) + b''.join(changed) +
+                     struct.pack(f'<H{len(eaten)}I', len(eaten), *(y * cols + x for x, y in eaten)))
+
+class StateDecoder:
+    """Applies STATE messages to a client's copy of the game, which it can then draw."""
+
+    def __init__(self, state: GameState):
+        self.state = state
+        self.synced = False  # Deltas mean nothing until the first keyframe
+
+    def apply(self, body: bytes):
+        state = self.state
+        tick, flags, mask = STATE_HEADER.unpack_from(body)
+        if not flags & KEYFRAME and not self.synced:
+            raise ProtocolError('delta before the first keyframe')
+        offset = STATE_HEADER.size
+        entities = state.players + state.ghosts
+        players = len(state.players)
+        for number, entity in enumerate(entities):
+            entity.prev_x, entity.prev_y = entity.x, entity.y
+            if not mask & (1 << number):
+                continue
+            if number < players:
+                (entity.x, entity.y, entity.direction_code, entity.score, entity.power_pellet_timer,
+                 alive) = PLAYER_RECORD.unpack_from(body, offset)
+                entity.alive = bool(alive)
+                offset += PLAYER_RECORD.size
+            else:
+                (entity.x, entity.y, entity.direction_code, vulnerable, entity.vulnerable_timer,
+                 eaten) = GHOST_RECORD.unpack_from(body, offset)
+                entity.vulnerable, entity.eaten = bool(vulnerable), bool(eaten)
+                offset += GHOST_RECORD.size
+            if flags & KEYFRAME or abs(entity.x - entity.prev_x) > 1:
+                entity.prev_x, entity.prev_y = entity.x, entity.y  # Do not slide across the maze or a tunnel
+
+        maze, grid, cols = state.maze, state.layout.grid, state.index.cols
+        if flags & KEYFRAME:
+            bits = int.from_bytes(body[offset:], 'little')
+            for y, row in enumerate(grid):
+                for x, cell in enumerate(row):
+                    if cell in (2, 3):
+                        maze[y][x] = cell if bits >> (y * cols + x) & 1 else 0
+            state.pellet_bits = bits
+            state.pellets_left = bin(bits).count('1')
+            state.eaten_cells = []  # A new list tells the renderer to redraw the pellets
+            self.synced = True
+        else:
+            count, = struct.unpack_from('<H', body, offset)
+            for cell in struct.unpack_from(f'<{count}I', body, offset + 2):
+                y, x = divmod(cell, cols)
+                maze[y][x] = 0
+                state.pellet_eaten(x, y)
+        state.tick = tick
+        state.game_over, state.won = bool(flags & OVER), bool(flags & WON)
+
+class Client:
+    """One connection to the server, and the player slot it holds in a room."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.room: Optional['Room'] = None
+        self.slot = -1
+        self.needs_keyframe = True
+
+    def send(self, data: bytes) -> bool:
+        """Queue `data`; False, and the connection dropped, if the client has stopped reading."""
+        if self.writer.is_closing():
+            return False
+        if self.writer.transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+            self.writer.close()
+            return False
+        self.writer.write(data)
+        return True
+
+class Room:
+    """A game and the clients playing it; a game starts once every player slot is taken."""
+
+    def __init__(self, name: str, mode: int, layout: MazeLayout = DEFAULT_LAYOUT, seed=None):
+        self.name = name
+        self.state = GameState(mode, layout=layout, seed=seed)
+        self.slots: List[Optional[Client]] = [None] * len(self.state.players)
+        self.inputs = [None] * len(self.slots)
+        self.encoder = StateEncoder()
+        self.changed = True  # Whether there is anything to send since the last broadcast
+
+    @property
+    def full(self) -> bool:
+        return all(self.slots)
+
+    @property
+    def empty(self) -> bool:
+        return not any(self.slots)
+
+    def add(self, client: Client) -> int:
+        slot = self.slots.index(None)
+        self.slots[slot] = client
+        client.room, client.slot, client.needs_keyframe = self, slot, True
+        return slot
+
+    def remove(self, client: Client):
+        self.slots[client.slot] = None
+        self.inputs[client.slot] = None
+        client.room = None
+
+    def restart(self):
+        """Start the next game with a fresh seed, if this one is over."""
+        if self.state.game_over:
+            self.state.reset()
+            self.inputs = [None] * len(self.slots)
+            self.changed = True
+
+    def tick(self):
+        """Advance the game one tick and send every client what changed."""
+        state = self.state
+        if self.full and not state.game_over:
+            state.step(self.inputs)
+            self.changed = True
+        elif not self.changed and not any(client.needs_keyframe for client in self.slots if client is not None):
+            return  # Waiting for players or a restart; nothing to send
+        self.changed = False
+        delta = self.encoder.delta(state)
+        keyframe = None
+        for client in self.slots:
+            if client is None:
+                continue
+            if client.needs_keyframe:
+                if keyframe is None:
+                    keyframe = self.encoder.keyframe(state)
+                client.needs_keyframe = not client.send(keyframe)
+            else:
+                client.send(delta)
+
+class GameServer:
+    """Accepts clients, matches them into rooms and ticks every room from one loop."""
+
+    def __init__(self, layout: MazeLayout = DEFAULT_LAYOUT, tick_rate=SIM_RATE, max_rooms=MAX_ROOMS):
+        self.layout = layout
+        self.maze_id = layout_id(layout)
+        self.tick_rate = tick_rate
+        self.max_rooms = max_rooms
+        self.rooms: Dict[str, Room] = {}
+        self.room_counter = 0
+        self.clients = 0
+        self.ticks = 0
+        self.skipped_ticks = 0  # Ticks dropped because the loop fell too far behind
+        self.tick_seconds = 0.0  # Time spent ticking rooms, to compare with the time available
+        self.server = None
+        self.ticker = None
+        self.handlers = {}  # Connection handler task per open connection's writer
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT) -> int:
+        """Start listening and ticking; returns the port, useful when `port` is 0."""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.ticker = asyncio.ensure_future(self.run())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.ticker.cancel()
+        self.server.close()
+        # Closing a connection ends its handler, which then tidies up its room
+        for writer in list(self.handlers):
+            writer.close()
+        await asyncio.gather(*self.handlers.values(), return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def run(self):
+        """Tick every room at `tick_rate`, catching up a few ticks after a stall and skipping the rest."""
+        loop = asyncio.get_running_loop()
+        tick_time = 1.0 / self.tick_rate
+        next_tick = loop.time()
+        while True:
+            ticks = 0
+            while loop.time() >= next_tick and ticks < MAX_CATCH_UP_TICKS:
+                start = time.perf_counter()
+                for room in list(self.rooms.values()):
+                    room.tick()
+                self.tick_seconds += time.perf_counter() - start
+                self.ticks += 1
+                ticks += 1
+                next_tick += tick_time
+            if loop.time() >= next_tick:
+                behind = int((loop.time() - next_tick) / tick_time) + 1
+                self.skipped_ticks += behind
+                next_tick += behind * tick_time
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    def join(self, client: Client, mode: int, name: str) -> Room:
+        """Put a client in the named room, or any room of that mode with a free slot."""
+        if not name:
+            room = next((room for room in self.rooms.values()
+                         if room.state.mode == mode and not room.full and room.name.startswith('#')), None)
+            if room is None:
+                self.room_counter += 1
+                name = f'#{self.room_counter}'
+        elif name.startswith('#'):
+            # Names starting with '#' belong to the rooms made here, so one can never be taken twice
+            raise ProtocolError('room names starting with # are reserved')
+        else:
+            room = self.rooms.get(name)
+            if room is not None and room.full:
+                raise ProtocolError(f'room {name!r} is full')
+            if room is not None and room.state.mode != mode:
+                raise ProtocolError(f'room {name!r} is playing another mode')
+        if room is None:
+            if len(self.rooms) >= self.max_rooms:
+                raise ProtocolError('server is full')
+            room = self.rooms[name] = Room(name, mode, self.layout, random.getrandbits(32))
+        room.add(client)
+        return room
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer)
+        self.clients += 1
+        self.handlers[writer] = asyncio.current_task()
+        try:
+            message_type, body = await read_frame(reader, MAX_CLIENT_MESSAGE)
+            if message_type != JOIN or not body or body[0] not in (SINGLE_PLAYER, MULTI_PLAYER):
+                raise ProtocolError('expected a JOIN with a game mode')
+            room = self.join(client, body[0], body[1:].decode('utf-8', 'replace'))
+            client.send(frame(WELCOME, WELCOME_BODY.pack(client.slot, room.state.mode, self.tick_rate,
+                                                         self.maze_id)))
+            while True:
+                message_type, body = await read_frame(reader, MAX_CLIENT_MESSAGE)
+                if message_type == INPUT and len(body) == 1 and body[0] < len(DIRECTIONS):
+                    room.inputs[client.slot] = DIRECTIONS[body[0]] if body[0] else None
+                elif message_type == RESTART:
+                    room.restart()
+                else:
+                    raise ProtocolError(f'unexpected message type {message_type:#x}')
+        except ProtocolError as error:
+            writer.write(frame(ERROR, str(error).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            del self.handlers[writer]
+            room = client.room
+            if room is not None:
+                room.remove(client)
+                if room.empty:
+                    del self.rooms[room.name]
+            writer.close()
+
+    def stats(self) -> str:
+        load = self.tick_seconds * self.tick_rate / max(self.ticks, 1)
+        return (f'{len(self.rooms)} rooms, {self.clients} clients, {self.ticks} ticks, '
+                f'{self.skipped_ticks} skipped, {100 * load:.0f}% of each tick busy')
+
+async def serve(host, port, layout, tick_rate, max_rooms, stats_every=0.0):
+    server = GameServer(layout, tick_rate, max_rooms)
+    port = await server.start(host, port)
+    print(f'Serving {layout.name} on {host}:{port} at {tick_rate} ticks/s', flush=True)
+    try:
+        while True:
+            await asyncio.sleep(stats_every or 3600)
+            if stats_every:
+                print(server.stats(), flush=True)
+    finally:
+        await server.stop()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Run a Pacman game server; connect with pacman.py --connect.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--tick-rate', type=int, default=SIM_RATE,
+                        help=f'simulation ticks, and state broadcasts, per second (default: {SIM_RATE})')
+    parser.add_argument('--max-rooms', type=int, default=MAX_ROOMS, help=f'(default: {MAX_ROOMS})')
+    parser.add_argument('--maze', metavar='FILE', help='host games on a maze loaded from FILE (see mazes.py)')
+    parser.add_argument('--stats', type=float, default=0.0, metavar='SECONDS',
+                        help='print room, client and tick load figures this often')
+    args = parser.parse_args(argv)
+    layout = DEFAULT_LAYOUT
+    if args.maze:
+        from mazes import load_maze
+        layout = load_maze(args.maze)
+    try:
+        asyncio.run(serve(args.host, args.port, layout, args.tick_rate, args.max_rooms, args.stats))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import random
+import time
+from autopilot import Autopilot
+from pacman import GameState, DIRECTIONS, MULTI_PLAYER, SINGLE_PLAYER, run_turbo
+
+def play(seed, pilots, ticks=3000, mode=SINGLE_PLAYER):
+    """Play a game with autopilots steering their players and random inputs for the rest."""
+    state = GameState(mode, seed=seed)
+    rng = random.Random(seed)
+    for _ in range(ticks):
+        inputs = [rng.choice(DIRECTIONS[1:]) if rng.random() < 0.05 else None for _ in state.players]
+        for pilot in pilots:
+            inputs[pilot.player] = pilot.choose(state)
+        if not state.step(inputs):
+            break
+    return state
+
+class FakeClock:
+    """A timer that moves on by `step` seconds every time it is read."""
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+class TestAutopilot:
+    def test_outscores_random_play(self):
+        """Test the autopilot clears far more of the maze than random inputs do"""
+        for seed in range(2):
+            random_score = play(seed, []).pacman.score
+            state = play(seed, [Autopilot()])
+            assert state.pacman.score > max(3 * random_score, 1000)
+
+    def test_avoids_a_ghost_ahead(self):
+        """Test Pacman turns off a corridor a ghost is coming down instead of running into it"""
+        state = GameState(seed=0)
+        state.ghosts[1:] = []
+        pacman, ghost = state.pacman, state.ghosts[0]
+        pacman.x, pacman.y, pacman.direction = 4, 3, (1, 0)
+        ghost.x, ghost.y, ghost.direction = 6, 3, (-1, 0)
+        direction = Autopilot().choose(state)
+        assert direction not in [(1, 0), None]
+
+    def test_decisions_stay_within_budget(self):
+        """Test searches finish a first pass, then stop at the first clock reading past the budget"""
+        clock = FakeClock(step=0.0001)
+        budget = 0.001
+        state = GameState(seed=1)
+        pilot = Autopilot(budget=budget, timer=clock)
+        depths = set()
+        for _ in range(1500):
+            start = clock.now
+            direction = pilot.choose(state)
+            assert pilot.depth >= 1
+            # One reading may overrun while working out the tie-breakers and one more stops the search
+            assert clock.now - start <= budget + 2 * clock.step + 1e-9
+            if clock.now > start:
+                depths.add(pilot.depth)
+            if not state.step([direction]):
+                break
+        assert min(depths) < pilot.max_depth
+        assert max(depths) > 1
+
+    def test_deadline_cuts_search_short(self):
+        """Test a deadline already passed still returns a legal move from the first search pass"""
+        state = GameState(seed=2)
+        pilot = Autopilot()
+        direction = pilot.choose(state, deadline=time.perf_counter())
+        assert direction in DIRECTIONS[1:]
+        assert 1 <= pilot.depth < pilot.max_depth
+
+    def test_drives_ms_pacman(self):
+        """Test an autopilot for player 1 steers Ms. Pacman through the same input path"""
+        state = play(3, [Autopilot(player=1)], ticks=1500, mode=MULTI_PLAYER)
+        assert state.ms_pacman.score > 500
+        assert Autopilot(player=1).choose(GameState(SINGLE_PLAYER)) is None
+
+    def test_idle_when_game_is_over(self):
+        """Test the autopilot leaves the input alone once its player is dead"""
+        state = GameState(seed=4)
+        state.pacman.alive = False
+        assert Autopilot().choose(state) is None
+
+    def test_turbo_decides_every_tick(self):
+        """Test turbo frames ask every autopilot for a move before each tick they run"""
+        class Counting(Autopilot):
+            def choose(self, state, deadline=None):
+                ticks.append((self.player, state.tick))
+                return super().choose(state, deadline)
+
+        ticks = []
+        state = GameState(MULTI_PLAYER, seed=5)
+        run_turbo(state, [None, None], time.perf_counter() + 0.2, [Counting(0), Counting(1, budget=0.0005)])
+        assert state.tick > 10
+        assert ticks == [(player, tick) for tick in range(state.tick) for player in (0, 1)]
@@ -0,0 +1,102 @@
+import random
+import numpy as np
+from batch import BatchGame, KEEP_DIRECTION
+from pacman import GameState, DIRECTIONS, DEFAULT_LAYOUT, MULTI_PLAYER, SINGLE_PLAYER
+
+def random_codes(rng, ticks, players):
+    """Direction codes for each tick, mostly leaving the queued direction alone."""
+    return [[rng.randrange(1, 5) if rng.random() < 0.15 else KEEP_DIRECTION for _ in range(players)]
+            for _ in range(ticks)]
+
+def scalar_state(state):
+    """The fields BatchGame tracks, read off a scalar GameState."""
+    players, ghosts = state.players, state.ghosts
+    return {
+        'player_x': [p.x for p in players], 'player_y': [p.y for p in players],
+        'player_direction': [p.direction_code for p in players],
+        'score': [p.score for p in players], 'power_pellet_timer': [p.power_pellet_timer for p in players],
+        'alive': [p.alive for p in players],
+        'ghost_x': [g.x for g in ghosts], 'ghost_y': [g.y for g in ghosts],
+        'ghost_direction': [g.direction_code for g in ghosts],
+        'vulnerable': [g.vulnerable for g in ghosts], 'vulnerable_timer': [g.vulnerable_timer for g in ghosts],
+        'eaten': [g.eaten for g in ghosts],
+        'pellets_left': state.pellets_left, 'tick': state.tick, 'game_over': state.game_over, 'won': state.won,
+        'maze': [row[:] for row in state.maze],
+    }
+
+class TestBatchGame:
+    def run_parity(self, mode, count, ticks, prepare=None):
+        players = 2 if mode == MULTI_PLAYER else 1
+        seeds = list(range(count))
+        inputs = [random_codes(random.Random(1000 + seed), ticks, players) for seed in seeds]
+
+        expected = []
+        for seed in seeds:
+            state = GameState(mode, seed=seed)
+            if prepare:
+                prepare(state)
+            history = []
+            for codes in inputs[seed]:
+                state.step([None if code == KEEP_DIRECTION else DIRECTIONS[code] for code in codes])
+                history.append(scalar_state(state))
+            expected.append(history)
+
+        batch = BatchGame(count, mode, seeds)
+        if prepare:
+            start = GameState(mode)
+            prepare(start)
+            for name, value in scalar_state(start).items():
+                getattr(batch, name)[:] = value
+            batch.next_direction[:] = [p.next_direction_code for p in start.players]
+        for tick in range(ticks):
+            batch.step(np.array([inputs[game][tick] for game in range(count)]))
+            for game in range(count):
+                for name, value in expected[game][tick].items():
+                    actual = getattr(batch, name)[game]
+                    assert np.array_equal(actual, np.array(value)), \
+                        f'game {game} tick {tick}: {name} is {actual}, expected {value}'
+        return batch
+
+    def test_matches_scalar_engine(self):
+        """Test every game matches a scalar GameState with the same seed and inputs, tick for tick"""
+        batch = self.run_parity(SINGLE_PLAYER, 16, 600)
+        assert batch.game_over.any()
+
+    def test_matches_scalar_engine_multi_player(self):
+        """Test parity with two players sharing each maze"""
+        self.run_parity(MULTI_PLAYER, 8, 400)
+
+    def test_matches_scalar_engine_through_tunnel_with_scared_ghosts(self):
+        """Test parity while Pacman wraps through the tunnel and vulnerable ghosts turn at random"""
+        def prepare(state):
+            state.pacman.x, state.pacman.y = 2, 8
+            state.pacman.direction = state.pacman.next_direction = (-1, 0)
+            for ghost in state.ghosts:
+                ghost.make_vulnerable()
+        batch = self.run_parity(SINGLE_PLAYER, 16, 300, prepare)
+        assert (batch.score >= 200).any()
+
+    def test_step_stops_finished_games(self):
+        """Test finished games stop advancing while the others keep going"""
+        batch = BatchGame(4)
+        batch.game_over[1] = True
+        running = batch.step()
+        assert list(running) == [True, False, True, True]
+        assert list(batch.tick) == [1, 0, 1, 1]
+
+    def test_reset(self):
+        """Test reset restores the starting state in every game"""
+        batch = BatchGame(3)
+        for _ in range(50):
+            batch.step(np.full((3, 1), 4))
+        batch.reset()
+        fresh = BatchGame(3)
+        assert np.array_equal(batch.maze, fresh.maze)
+        assert np.array_equal(batch.player_x, fresh.player_x)
+        assert not batch.tick.any()
+
+    def test_layout_comes_from_the_maze(self):
+        """Test spawn points and tunnel rows are read from the layout rather than written in"""
+        batch = BatchGame(2, MULTI_PLAYER)
+        assert list(np.nonzero(batch.tunnel_rows)[0]) == DEFAULT_LAYOUT.tunnel_rows
+        assert set(zip(batch.player_x.flat, batch.player_y.flat)) == {DEFAULT_LAYOUT.pacman_spawn}
@@ -0,0 +1,31 @@
+import json
+import pytest
+from benchmark import BENCHMARKS, compare, main, run_benchmarks
+
+class TestBenchmark:
+    def test_every_benchmark_runs(self):
+        """Test each registered benchmark reports a positive timing"""
+        results = run_benchmarks(min_time=0.001)
+        assert set(results) == set(BENCHMARKS)
+        for result in results.values():
+            assert result['per_call_us'] > 0
+            assert result['calls_per_sec'] > 0
+
+    def test_compare_flags_regressions(self):
+        """Test only slowdowns beyond the threshold count as regressions"""
+        baseline = {'fast': {'per_call_us': 10.0}, 'slow': {'per_call_us': 10.0}}
+        results = {'fast': {'per_call_us': 10.5}, 'slow': {'per_call_us': 12.0}, 'new': {'per_call_us': 1.0}}
+        rows, regressions = compare(baseline, results, threshold=0.1)
+        assert regressions == ['slow']
+        assert [row[0] for row in rows] == ['fast', 'slow']
+
+    def test_save_and_compare_baseline(self, tmp_path):
+        """Test a saved baseline round-trips and a much faster baseline fails the comparison"""
+        path = tmp_path / 'baseline.json'
+        assert main(['check_win', '--min-time', '0.001', '--save', str(path)]) == 0
+        saved = json.loads(path.read_text())
+        assert 'check_win' in saved['results']
+
+        saved['results']['check_win']['per_call_us'] /= 100
+        path.write_text(json.dumps(saved))
+        assert main(['check_win', '--min-time', '0.001', '--compare', str(path)]) == 1
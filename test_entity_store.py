@@ -0,0 +1,61 @@
+import sys
+from entity_store import EntityStore
+from pacman import Ghost, Pacman, GameState, GHOST_POSITIONS, GHOST_COLORS, GHOST_NAMES, PINK
+
+class TestEntityStore:
+    def setup_method(self):
+        """Set up a few hundred ghosts in assorted states"""
+        self.ghosts = []
+        for i in range(400):
+            (x, y), color, name = GHOST_POSITIONS[i % 4], GHOST_COLORS[i % 4], GHOST_NAMES[i % 4]
+            ghost = Ghost(x + i * 0.01, y, color, name)
+            ghost.direction = [(0, 1), (0, -1), (1, 0), (-1, 0)][i % 4]
+            if i % 3 == 0:
+                ghost.make_vulnerable()
+            ghost.eaten = i % 7 == 0
+            self.ghosts.append(ghost)
+
+    def test_ghosts_round_trip(self):
+        """Test ghosts read back from the store match the originals"""
+        store = EntityStore(Ghost)
+        store.extend(self.ghosts)
+        assert len(store) == len(self.ghosts)
+        for index, ghost in enumerate(self.ghosts):
+            copy = store.get(index)
+            assert isinstance(copy, Ghost)
+            for name in Ghost.__slots__:
+                assert getattr(copy, name) == getattr(ghost, name)
+            assert copy.direction == ghost.direction
+            assert copy.vulnerable is ghost.vulnerable
+
+    def test_pacman_round_trip(self):
+        """Test Pacman state, including queued directions and colors, survives the store"""
+        state = GameState()
+        for _ in range(30):
+            state.step([(-1, 0)])
+        ms_pacman = Pacman(9, 11, PINK, True)
+        ms_pacman.next_direction = (0, -1)
+        store = EntityStore(Pacman)
+        store.extend([state.pacman, ms_pacman])
+        for index, player in enumerate([state.pacman, ms_pacman]):
+            copy = store.get(index)
+            for name in Pacman.__slots__:
+                assert getattr(copy, name) == getattr(player, name)
+
+    def test_write_and_read_in_place(self):
+        """Test slots can be overwritten and loaded into existing entities"""
+        store = EntityStore(Ghost)
+        store.extend(self.ghosts[:2])
+        store.write(0, self.ghosts[5])
+        target = self.ghosts[1]
+        assert store.read(0, target) is target
+        assert target.x == self.ghosts[5].x
+        assert target.name == self.ghosts[5].name
+
+    def test_store_is_compact(self):
+        """Test the columns take well under half the memory of the entity objects"""
+        store = EntityStore(Ghost)
+        store.extend(self.ghosts)
+        objects = sum(sys.getsizeof(ghost) + sys.getsizeof(ghost.x) + sys.getsizeof(ghost.prev_x)
+                      for ghost in self.ghosts)
+        assert store.nbytes < objects / 2
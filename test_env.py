@@ -0,0 +1,110 @@
+import random
+import numpy as np
+from env import PLANES, DOTS, GHOSTS, MS_PACMAN, PACMAN, POWER, VULNERABLE, WALLS, PacmanEnv, VectorPacmanEnv
+from pacman import VULNERABLE_DURATION, MULTI_PLAYER, SINGLE_PLAYER
+
+def rebuild(state):
+    """The observation for a GameState, built from scratch."""
+    observation = np.zeros((PLANES, len(state.maze), len(state.maze[0])), dtype=np.float32)
+    maze = np.array(state.maze)
+    observation[WALLS] = maze == 1
+    observation[DOTS] = maze == 2
+    observation[POWER] = maze == 3
+    cols, rows = maze.shape[1], maze.shape[0]
+    def cell(entity):
+        return min(max(int(round(entity.y)), 0), rows - 1), int(round(entity.x)) % cols
+    for plane, player in zip((PACMAN, MS_PACMAN), state.players):
+        if player.alive:
+            observation[(plane,) + cell(player)] = 1
+    for ghost in state.ghosts:
+        observation[(GHOSTS,) + cell(ghost)] += 1
+        if ghost.vulnerable:
+            at = (VULNERABLE,) + cell(ghost)
+            observation[at] = max(observation[at], ghost.vulnerable_timer / VULNERABLE_DURATION)
+    return observation
+
+def random_actions(rng, ticks, players):
+    return [[rng.randrange(1, 5) if rng.random() < 0.15 else 0 for _ in range(players)] for _ in range(ticks)]
+
+class TestPacmanEnv:
+    def test_planes_match_a_rebuild(self):
+        """Test the incrementally updated planes equal ones built from the game state every tick"""
+        env = PacmanEnv(MULTI_PLAYER, seed=0)
+        observation, info = env.reset()
+        assert np.array_equal(observation, rebuild(env.state))
+        saw_vulnerable = False
+        for actions in random_actions(random.Random(0), 3000, 2):
+            observation, reward, terminated, truncated, info = env.step(actions)
+            assert np.array_equal(observation, rebuild(env.state))
+            saw_vulnerable |= observation[VULNERABLE].any()
+            if terminated:
+                observation, info = env.reset()
+                assert np.array_equal(observation, rebuild(env.state))
+        assert saw_vulnerable
+
+    def test_observation_is_not_copied(self):
+        """Test reset and step hand back the same preallocated array"""
+        env = PacmanEnv(seed=1)
+        observation, _ = env.reset()
+        assert env.step(1)[0] is observation
+        assert env.reset()[0] is observation
+
+    def test_rewards_add_up_to_the_score(self):
+        """Test rewards are score deltas and episodes past max_ticks are truncated"""
+        env = PacmanEnv(seed=2, max_ticks=500)
+        env.reset()
+        total, truncated, terminated = 0, False, False
+        rng = random.Random(2)
+        while not (terminated or truncated):
+            _, reward, terminated, truncated, info = env.step(rng.randrange(5))
+            total += reward
+        assert total == info['score'] == env.state.total_score
+        assert truncated == (not terminated) and info['tick'] <= 500
+
+    def test_seeded_resets_repeat(self):
+        """Test reset(seed) replays the same game for the same actions"""
+        env = PacmanEnv(seed=3)
+        actions = [action for action, in random_actions(random.Random(3), 800, 1)]
+        runs = []
+        for _ in range(2):
+            env.reset(seed=42)
+            runs.append([env.step(action)[0].copy() for action in actions][-1])
+        assert np.array_equal(runs[0], runs[1])
+
+class TestVectorPacmanEnv:
+    def test_matches_scalar_envs(self):
+        """Test each game of the vector env observes and scores exactly as a scalar env with its seed"""
+        for mode, players in [(SINGLE_PLAYER, 1), (MULTI_PLAYER, 2)]:
+            count, ticks = 4, 1500
+            seeds = list(range(count))
+            vector = VectorPacmanEnv(count, mode)
+            observations, _ = vector.reset(seeds)
+            scalars = [PacmanEnv(mode) for _ in seeds]
+            for env, seed in zip(scalars, seeds):
+                env.reset(seed=seed)
+            inputs = [random_actions(random.Random(100 + seed), ticks, players) for seed in seeds]
+            for tick in range(ticks):
+                _, rewards, terminated, _, _ = vector.step([inputs[game][tick] for game in range(count)])
+                for game, env in enumerate(scalars):
+                    if env.state.game_over:
+                        continue
+                    observation, reward, done, _, _ = env.step(inputs[game][tick])
+                    assert reward == rewards[game] and done == terminated[game]
+                    if not done:
+                        assert np.array_equal(observations[game], observation), f'game {game} tick {tick}'
+
+    def test_finished_games_restart(self):
+        """Test games that end start over in place while the others play on"""
+        vector = VectorPacmanEnv(3, seed=5, max_ticks=50)
+        observations, _ = vector.reset()
+        vector.batch.alive[1] = False
+        vector.batch.game_over[1] = False
+        _, _, terminated, truncated, info = vector.step([0, 0, 0])
+        assert list(terminated) == [False, True, False] and not truncated.any()
+        assert info['final_score'][1] == 0 and vector.batch.alive[1].all() and vector.batch.tick[1] == 0
+        for _ in range(49):
+            _, _, terminated, truncated, info = vector.step([1, 2, 3])
+        assert truncated[[0, 2]].all() and not truncated[1]
+        assert (vector.batch.tick[[0, 2]] == 0).all()
+        assert np.array_equal(observations[:, DOTS].sum(axis=(1, 2))[[0, 2]],
+                              (vector.batch.maze[[0, 2]] == 2).sum(axis=(1, 2)))
@@ -0,0 +1,92 @@
+import random
+import pytest
+from fastforward import can_fast_forward, fast_forward
+from mazes import corridor_maze
+from pacman import DIRECTIONS, MULTI_PLAYER, SINGLE_PLAYER, GameState, Ghost
+from replay import ReplayRecorder, play_replay
+
+def held_inputs(rng, players, ticks):
+    """(ticks, inputs) stretches of held directions, some long and some a tick or two."""
+    while ticks > 0:
+        length = min(ticks, rng.choice([1, 2, 7, 30, 120, 600]))
+        yield length, [rng.choice(DIRECTIONS[1:] + [None]) for _ in range(players)]
+        ticks -= length
+
+def snapshot(state):
+    return (state.state_hash(), state.rng.getstate(),
+            [(entity.prev_x, entity.prev_y) for entity in state.players + state.ghosts])
+
+def compare(mode, seed, layout=None, ticks=3000):
+    """Play the same stretches by stepping and by fast_forward, checking they agree after each."""
+    stepped = GameState(mode, seed=seed) if layout is None else GameState(mode, layout=layout, seed=seed)
+    skipped = stepped.clone()
+    for length, inputs in held_inputs(random.Random(seed), len(stepped.players), ticks):
+        for _ in range(length):
+            if not stepped.step(inputs):
+                break
+        assert fast_forward(skipped, length, inputs) == (not stepped.game_over)
+        assert snapshot(skipped) == snapshot(stepped), f'tick {stepped.tick}'
+        if stepped.game_over:
+            break
+    return stepped
+
+class TestFastForward:
+    @pytest.mark.parametrize('mode', [SINGLE_PLAYER, MULTI_PLAYER])
+    def test_matches_stepping(self, mode):
+        """Test fast-forwarding leaves the same game as stepping, tick for tick and bit for bit"""
+        games = [compare(mode, seed) for seed in range(12)]
+        assert any(not player.alive for state in games for player in state.players)
+
+    def test_matches_stepping_on_corridors(self):
+        """Test long straight runs and tunnels skip to the same game as stepping"""
+        layout = corridor_maze(41, 21, tunnel_rows=(5, 11))
+        for seed in range(4):
+            compare(MULTI_PLAYER, seed, layout)
+
+    def test_scared_ghosts(self):
+        """Test scared ghosts turn, get eaten and respawn exactly as stepping has them do"""
+        eaten = 0
+        for seed in range(12):
+            stepped = GameState(MULTI_PLAYER, seed=seed)
+            for ghost in stepped.ghosts:
+                ghost.make_vulnerable()
+            skipped = stepped.clone()
+            for inputs in [[(-1, 0), (1, 0)], [(0, -1), (0, -1)], [(0, 1), (-1, 0)]]:
+                for _ in range(100):
+                    stepped.step(inputs)
+                fast_forward(skipped, 100, inputs)
+                assert snapshot(skipped) == snapshot(stepped)
+            eaten += sum(ghost.respawn_timer < 0 for ghost in stepped.ghosts)
+        assert eaten
+
+    def test_falls_back_to_stepping(self):
+        """Test recorded games and ghosts with their own move still play every tick"""
+        class Shy(Ghost):
+            __slots__ = ()
+
+            def move(self, *args):
+                super().move(*args)
+
+        state = GameState(seed=4)
+        state.recorder = ReplayRecorder(state, interval=16)
+        assert not can_fast_forward(state)
+        fast_forward(state, 50, [(1, 0)])
+        assert state.recorder.replay.ticks == state.tick == 50
+        assert play_replay(state.recorder.finish(state)).state_hash() == state.state_hash()
+
+        state = GameState(seed=4)
+        state.ghosts[1].__class__ = Shy
+        assert not can_fast_forward(state)
+        other = GameState(seed=4)
+        fast_forward(state, 300, [(1, 0)])
+        for _ in range(300):
+            other.step([(1, 0)])
+        assert state.state_hash() == other.state_hash()
+
+    def test_stops_when_the_game_ends(self):
+        """Test fast_forward stops on the tick the game is lost, as step does"""
+        state = GameState(seed=1)
+        assert not fast_forward(state, 100000, [(0, 1)])
+        assert state.game_over and not state.won and state.tick < 100000
+        tick = state.tick
+        assert not fast_forward(state, 10) and state.tick == tick
@@ -0,0 +1,92 @@
+import os
+import random
+import pytest
+from mazes import MazeFormatError, corridor_maze, format_maze, load_maze, parse_maze
+from pacman import GameState, MAZE, DEFAULT_LAYOUT, GHOST_POSITIONS, get_maze_index
+
+LAYOUTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+
+def maze_text(grid, header='size: 5 5\npacman: 1 1\nghosts: 3 1, 3 2, 3 3, 2 3\nhouse: 3 1\n'):
+    return header + 'grid:\n' + '\n'.join(grid) + '\n'
+
+SMALL_GRID = ['%%%%%',
+              '%...%',
+              '%.%.%',
+              '%...%',
+              '%%%%%']
+
+class TestMazeFiles:
+    def test_classic_file_matches_builtin_maze(self):
+        """Test the shipped classic layout is the built-in maze with the usual spawns"""
+        layout = load_maze(os.path.join(LAYOUTS, 'classic.maze'))
+        assert layout.grid == MAZE
+        assert layout.pacman_spawn == (9, 11)
+        assert layout.ghost_spawns == GHOST_POSITIONS
+        assert layout.ghost_house == (9, 8)
+        assert layout.tunnel_rows == [8]
+
+    def test_format_round_trips(self):
+        """Test writing a layout and parsing it back gives the same layout"""
+        layout = parse_maze(format_maze(DEFAULT_LAYOUT))
+        assert layout.grid == DEFAULT_LAYOUT.grid
+        assert layout.ghost_spawns == DEFAULT_LAYOUT.ghost_spawns
+        assert layout.name == 'Classic'
+
+    def test_short_rows_are_padded(self):
+        """Test rows missing trailing empty cells are padded to the declared width"""
+        layout = parse_maze(maze_text(['%%%%%', '%...%', '%.% ', '%...%', '%%%%%']))
+        assert layout.grid[2] == [1, 2, 1, 0, 0]
+
+    @pytest.mark.parametrize('text, message', [
+        (maze_text(SMALL_GRID[:4]), 'grid has 4 rows'),
+        (maze_text(SMALL_GRID[:2] + ['%.%.%.'] + SMALL_GRID[3:]), 'cells wide'),
+        (maze_text(SMALL_GRID[:2] + ['%.x.%'] + SMALL_GRID[3:]), "unknown cell 'x'"),
+        (maze_text(SMALL_GRID, 'size: 5 5\npacman: 2 2\nghosts: 3 1, 3 2, 3 3, 2 3\nhouse: 3 1\n'), 'on a wall'),
+        (maze_text(SMALL_GRID, 'size: 5 5\npacman: 1 1\nghosts: 3 1, 3 2, 3 3\nhouse: 3 1\n'), 'expected 4 ghost'),
+        (maze_text(SMALL_GRID, 'size: 5 5\npacman: 1 1\nhouse: 3 1\n'), 'missing "ghosts:"'),
+        (maze_text(SMALL_GRID, 'size: 5 5\nspeed: 3\n'), "unknown key 'speed'"),
+        (maze_text(['%%%%%', '=...%', '%.%.%', '%...%', '%%%%%']), 'pairs'),
+        (maze_text(['%%%%%', '%.%.%', '%%%.%', '%...%', '%%%%%']), 'cannot be reached'),
+        (maze_text(['%%%%%', '%   %', '% % %', '%   %', '%%%%%']), 'no dots'),
+    ])
+    def test_invalid_mazes_are_rejected(self, text, message):
+        """Test malformed or unplayable mazes raise a MazeFormatError saying what is wrong"""
+        with pytest.raises(MazeFormatError, match=message):
+            parse_maze(text)
+
+class TestCustomLayouts:
+    def test_game_uses_layout_spawns(self):
+        """Test a game starts everyone on the layout's spawn cells"""
+        layout = corridor_maze(31, 21)
+        state = GameState(layout=layout)
+        assert (state.pacman.x, state.pacman.y) == layout.pacman_spawn
+        assert [(ghost.x, ghost.y) for ghost in state.ghosts] == layout.ghost_spawns
+        assert state.pellets_left == layout.pellets
+
+    def test_every_tunnel_wraps(self):
+        """Test Pacman wraps around through each of several tunnel rows"""
+        layout = load_maze(os.path.join(LAYOUTS, 'twin_tunnels.maze'))
+        assert layout.tunnel_rows == [8, 15]
+        for y in layout.tunnel_rows:
+            state = GameState(layout=layout)
+            state.ghosts.clear()
+            state.pacman.x, state.pacman.y = 1, y
+            for _ in range(10):
+                state.step([(-1, 0)])
+            assert state.pacman.x > 15
+
+    def test_large_maze_plays(self):
+        """Test a layout hundreds of cells on a side runs with paths and pellets intact"""
+        layout = corridor_maze(301, 301, tunnel_rows=(101, 201))
+        index = get_maze_index(layout.grid)
+        assert index.distances is None  # Too big for all-pairs tables
+        assert index.distance((1, 1), (1, 299)) == 298
+        assert index.distance((1, 1), (299, 299)) == 301  # Through the tunnel on row 101
+        assert index.distance((0, 101), (300, 101)) == 1
+
+        state = GameState(layout=layout, debug=True)
+        rng = random.Random(0)
+        for _ in range(500):
+            if not state.step([rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])]):
+                state.reset()
+        assert state.pacman.score > 0
@@ -1,9 +1,21 @@
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
 import pytest
-import pygame
-from pacman import Pacman, Ghost, MAZE, COLS as MAZE_WIDTH, check_win
+import pacman as pacman_module
+from collections import deque
+from pacman import (Pacman, Ghost, GameState, Renderer, SpatialHash, FixedTimestep, interpolate_position, MAZE, DIRECTIONS, EXIT_MOVES, COLS as MAZE_WIDTH, MULTI_PLAYER, SINGLE_PLAYER, BLACK,
+                    MAZE_INDEX_CACHE_SIZE, JunctionGraph, check_win, find_path, get_maze_index, init_display, draw_maze, draw_scores, pygame)
 
-# Initialize pygame for tests
-pygame.init()
+# Import must stay cheap enough to spawn hundreds of headless workers
+IMPORT_TIME_BUDGET = 0.1
+
+# Most memory one tick may have allocated at once, in bytes. Boxed ints and
+# loop iterators still cost a little; the lists, closures and bound methods
+# a tick used to build came to 800 or more
+TICK_ALLOCATION_BUDGET = 512
 
 class TestPacman:
     def setup_method(self):
@@ -36,6 +48,16 @@ class TestPacman:
         assert ghost.vulnerable_timer == 0
         assert ghost.respawn_timer == 0
 
+    def test_entities_use_slots_and_direction_codes(self):
+        """Test entities have no instance dict and store directions as codes into DIRECTIONS"""
+        for entity in [self.pacman] + self.ghosts:
+            assert not hasattr(entity, '__dict__')
+        self.pacman.direction = (-1, 0)
+        self.pacman.next_direction = (0, 1)
+        assert DIRECTIONS[self.pacman.direction_code] == (-1, 0)
+        assert DIRECTIONS[self.pacman.next_direction_code] == (0, 1)
+        assert self.pacman.direction is DIRECTIONS[self.pacman.direction_code]
+
     def test_ghost_vulnerability(self):
         """Test ghost vulnerability mechanics"""
         ghost = self.ghosts[0]
@@ -66,6 +88,15 @@ class TestPacman:
         pinky.move(self.maze, pacman, self.ghosts)
         assert pinky.direction[0] > 0  # Should move towards Pacman's future position
 
+    def test_inky_needs_blinky(self):
+        """Test Inky aims off Blinky, and refuses to guess when there is no Blinky"""
+        inky = self.ghosts[2]
+        self.ghosts[0].x, self.ghosts[0].y = 1, 1
+        self.pacman.x, self.pacman.y, self.pacman.direction = 5, 5, (1, 0)
+        assert inky.get_target(self.pacman, self.ghosts) == (13, 9)
+        with pytest.raises(ValueError):
+            inky.get_target(self.pacman, self.ghosts[1:])
+
     def test_ghost_collision_prevention(self):
         """Test that ghosts don't overlap"""
         ghost1 = self.ghosts[0]
@@ -141,3 +172,536 @@ class TestPacman:
         # Add one dot back
         self.maze[1][1] = 2
         assert check_win(self.maze) == False
+
+
+class TestGameState:
+    def setup_method(self):
+        """Set up a fresh headless game for each test method"""
+        self.state = GameState(debug=True)
+
+    def test_step_runs_headless(self):
+        """Test the engine advances without a display or frame limiter"""
+        for _ in range(100):
+            if not self.state.step([(1, 0)]):
+                break
+        assert self.state.tick > 0
+        assert self.state.pacman.score > 0
+
+    def test_multi_player_inputs(self):
+        """Test each player gets its own queued direction"""
+        self.state.reset(MULTI_PLAYER)
+        self.state.step([(-1, 0), (1, 0)])
+        assert self.state.pacman.x < 9
+        assert self.state.ms_pacman.x > 9
+
+    def test_pellet_counter(self):
+        """Test the pellet counter tracks eating and is restored on reset"""
+        total = self.state.pellets_left
+        assert total == sum(row.count(2) + row.count(3) for row in MAZE)
+        for _ in range(40):
+            self.state.step([(-1, 0)])
+        assert self.state.pellets_left < total
+        self.state.reset()
+        assert self.state.pellets_left == total
+
+    def test_pellet_counter_drift_is_caught(self):
+        """Test the debug check notices the counter disagreeing with the maze"""
+        self.state.maze[1][1] = 0
+        with pytest.raises(RuntimeError):
+            self.state.step()
+
+    def test_previous_positions(self):
+        """Test each step records where entities were for interpolation"""
+        self.state.step([(-1, 0)])
+        pacman = self.state.pacman
+        assert (pacman.prev_x, pacman.prev_y) == (9, 11)
+        x, y = interpolate_position(pacman, 0.5)
+        assert pacman.x < x < 9 and y == 11
+
+    def test_interpolation_skips_jumps(self):
+        """Test tunnel wraps are drawn where the entity landed"""
+        ghost = self.state.ghosts[0]
+        ghost.prev_x, ghost.x = 0.1, 18.92
+        assert interpolate_position(ghost, 0.5)[0] == 18.92
+
+    def test_fixed_timestep(self):
+        """Test wall-clock time turns into whole ticks with the remainder carried"""
+        timestep = FixedTimestep(rate=10, max_ticks=5)
+        assert timestep.advance(0.25) == 2
+        assert timestep.alpha == pytest.approx(0.5)
+        assert timestep.advance(0.06) == 1
+        assert timestep.advance(10.0) == 5  # A stalled frame drops its backlog
+        assert timestep.alpha <= 1.0
+
+    def test_ghost_collision_ends_game(self):
+        """Test a non-vulnerable ghost on Pacman ends the game"""
+        ghost = self.state.ghosts[0]
+        ghost.x, ghost.y = self.state.pacman.x, self.state.pacman.y
+        assert self.state.step() == False
+        assert self.state.game_over
+        assert not self.state.won
+
+    def test_win_ends_game(self):
+        """Test eating the last dot wins the game"""
+        for row in self.state.maze:
+            for x, cell in enumerate(row):
+                if cell in [2, 3]:
+                    row[x] = 0
+        self.state.maze[11][10] = 2
+        self.state.pellets_left = 1
+        self.state.step([(1, 0)])
+        for _ in range(10):
+            self.state.step()
+        assert self.state.game_over
+        assert self.state.won
+
+
+class TestSnapshot:
+    def setup_method(self):
+        """Set up a two player game a few dozen ticks in"""
+        self.state = GameState(MULTI_PLAYER, debug=True, seed=5)
+        self.rng = random.Random(0)
+        self.play(40)
+
+    def play(self, ticks, state=None):
+        state = state or self.state
+        for _ in range(ticks):
+            if not state.step([self.rng.choice(DIRECTIONS[1:]) if self.rng.random() < 0.1 else None
+                               for _ in state.players]):
+                break
+
+    def test_restore_rewinds_everything(self):
+        """Test restoring undoes movement, eaten pellets, scores and the tick count"""
+        snapshot = self.state.snapshot()
+        before, maze = self.state.state_hash(), [row[:] for row in self.state.maze]
+        for ghost in self.state.ghosts:
+            ghost.make_vulnerable()
+        self.play(300)
+        assert self.state.state_hash() != before
+        self.state.restore(snapshot)
+        assert self.state.state_hash() == before
+        assert self.state.maze == maze
+        self.play(5)  # The debug pellet check passes after a restore
+
+    def test_restored_game_plays_the_same(self):
+        """Test the RNG is restored too, so the same inputs give the same game again"""
+        for ghost in self.state.ghosts:
+            ghost.make_vulnerable()
+        snapshot = self.state.snapshot()
+        hashes = []
+        for _ in range(2):
+            self.state.restore(snapshot)
+            self.rng.seed(1)
+            self.play(200)
+            hashes.append(self.state.state_hash())
+        assert hashes[0] == hashes[1]
+
+    def test_snapshots_key_a_transposition_table(self):
+        """Test equal positions hash alike whatever the tick, and different ones do not"""
+        snapshot = self.state.snapshot()
+        self.state.tick += 7
+        assert self.state.snapshot() == snapshot
+        table = {snapshot: 'seen'}
+        assert table[self.state.clone().snapshot()] == 'seen'
+        self.state.step([(1, 0), (0, 1)])
+        assert self.state.snapshot() not in table
+
+    def test_clone_is_independent(self):
+        """Test a clone plays on without touching the original, and their snapshots interchange"""
+        before = self.state.state_hash()
+        clone = self.state.clone()
+        self.play(100, clone)
+        assert self.state.state_hash() == before
+        assert clone.state_hash() != before
+        self.state.restore(clone.snapshot())
+        assert self.state.state_hash() == clone.state_hash()
+        assert self.state.maze == clone.maze
+
+    def test_pellet_bits_follow_the_maze(self):
+        """Test the pellet bitset restore relies on matches the maze on a large layout"""
+        from mazes import corridor_maze
+        state = GameState(layout=corridor_maze(101, 101), seed=0)
+        snapshot = state.snapshot()
+        self.play(400, state)
+        cols = state.layout.cols
+        cells = {y * cols + x for y, row in enumerate(state.maze) for x, cell in enumerate(row) if cell in (2, 3)}
+        assert cells == {cell for cell in range(cols * state.layout.rows) if state.pellet_bits >> cell & 1}
+        state.restore(snapshot)
+        assert state.maze == state.layout.grid
+
+    def test_restore_checks_the_layout(self):
+        """Test a snapshot cannot be restored onto a game on another maze"""
+        from mazes import corridor_maze
+        with pytest.raises(ValueError):
+            GameState(layout=corridor_maze(21, 21)).restore(self.state.snapshot())
+
+
+def reference_path(maze, start, target):
+    """Plain BFS that carries whole paths, used to check the precomputed tables"""
+    queue = deque([(start, [start])])
+    visited = {start}
+    while queue:
+        (x, y), path = queue.popleft()
+        if (x, y) == target:
+            return path
+        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+            next_x, next_y = x + dx, y + dy
+            if y == 8 and maze[y][x] == 4:
+                next_x %= MAZE_WIDTH
+            if (0 <= next_x < MAZE_WIDTH and 0 <= next_y < len(maze) and
+                    maze[next_y][next_x] != 1 and (next_x, next_y) not in visited):
+                queue.append(((next_x, next_y), path + [(next_x, next_y)]))
+                visited.add((next_x, next_y))
+    return []
+
+class TestMazeIndex:
+    def setup_method(self):
+        """Set up the shared index for the built-in maze"""
+        self.maze = [row[:] for row in MAZE]
+        self.index = get_maze_index(self.maze)
+        self.pacman = Pacman()
+
+    def test_index_is_shared_per_layout(self):
+        """Test mazes with the same walls reuse one index"""
+        self.maze[1][1] = 0  # Eating a dot does not change the layout
+        assert get_maze_index(self.maze) is self.index
+
+    def test_index_cache_is_bounded(self):
+        """Test the layout cache keeps only the most recently used indexes"""
+        from mazes import corridor_maze
+        for cols in range(5, 5 + 2 * MAZE_INDEX_CACHE_SIZE, 2):
+            get_maze_index(corridor_maze(cols, 5).grid)
+        assert len(pacman_module._maze_indexes) == MAZE_INDEX_CACHE_SIZE
+        assert get_maze_index(self.maze) is not self.index
+        assert find_path(self.maze, (1, 1), (3, 1), self.index) == [(1, 1), (2, 1), (3, 1)]
+
+    def test_paths_match_bfs(self):
+        """Test table paths are exactly the paths BFS would find"""
+        starts = [(9, 11), (1, 1), (0, 8), (9, 8), (17, 17)]
+        for start in starts:
+            for y in range(len(MAZE)):
+                for x in range(MAZE_WIDTH):
+                    assert find_path(self.maze, start, (x, y)) == reference_path(self.maze, start, (x, y))
+
+    def test_distance_and_next_step(self):
+        """Test distance and first-step queries agree with the full path"""
+        path = find_path(self.maze, (1, 1), (17, 17))
+        assert self.index.distance((1, 1), (17, 17)) == len(path) - 1
+        assert self.index.next_step((1, 1), (17, 17)) == path[1]
+        assert self.index.distance((1, 1), (0, 0)) == -1
+        assert self.index.next_step((1, 1), (1, 1)) is None
+
+    def test_tunnel_path(self):
+        """Test paths across the tunnel use the wrap"""
+        assert find_path(self.maze, (0, 8), (18, 8)) == [(0, 8), (18, 8)]
+        assert self.index.distance((1, 8), (17, 8)) == 3
+
+    def test_flow_field(self):
+        """Test flow fields give the distance to the nearest of several targets"""
+        field = self.index.flow_field([(1, 1), (17, 17)])
+        for cell in [(9, 11), (1, 17), (17, 1)]:
+            expected = min(self.index.distance(cell, (1, 1)), self.index.distance(cell, (17, 17)))
+            assert field[self.index.cell(*cell)] == expected
+        assert self.index.flow_field([(17, 17), (1, 1)]) is field  # Shared, not rebuilt
+
+    def test_flow_field_snaps_targets(self):
+        """Test targets in walls or off the grid aim for a nearby open cell"""
+        assert self.index.target_cell((0, 18)) == self.index.cell(1, 17)
+        assert self.index.target_cell((-5, 30)) == self.index.cell(1, 17)
+        assert self.index.target_cell((9, 11)) == self.index.cell(9, 11)
+
+    def test_exit_tables_match_probing(self):
+        """Test the exit tables give the same answers as probing the maze"""
+        ghost = Ghost(0, 0, (255, 0, 0), "blinky")
+        for cell, (x, y) in enumerate(self.index.coords):
+            moves = [DIRECTIONS[code] for code in EXIT_MOVES[self.index.exits[cell]]]
+            assert moves == ghost.get_valid_moves(self.maze, (x, y))
+            for code, direction in enumerate(DIRECTIONS):
+                assert self.index.can_move(self.maze, x, y, code) == \
+                    self.pacman.can_move_in_direction(self.maze, x, y, direction)
+        assert self.index.exit_cells[self.index.cell(0, 8) * 5 + 4] == self.index.cell(18, 8)
+
+    def test_can_move_off_center(self):
+        """Test positions between cell centers fall back to probing"""
+        rng = random.Random(0)
+        for _ in range(2000):
+            x, y = rng.uniform(-1, MAZE_WIDTH), rng.choice([rng.uniform(0, 18), rng.randrange(19)])
+            for code, direction in enumerate(DIRECTIONS):
+                assert self.index.can_move(self.maze, x, y, code) == \
+                    self.pacman.can_move_in_direction(self.maze, x, y, direction)
+
+    def test_ghost_follows_shortest_path(self):
+        """Test a chasing ghost steps along a shortest path through the walls"""
+        pacman = Pacman(17, 17)
+        ghost = Ghost(1, 1, (255, 0, 0), "blinky")
+        ghost.move(self.maze, pacman, [ghost], self.index)
+        next_cell = (1 + ghost.direction[0], 1 + ghost.direction[1])
+        assert self.index.distance(next_cell, (17, 17)) == self.index.distance((1, 1), (17, 17)) - 1
+
+    def test_decisions_match_flow_field(self):
+        """Test the decision table turns every way scoring exits on the flow field would"""
+        index, rows = self.index, 0
+        for cell in range(index.size):
+            for moves in range(16):
+                if index.decision_offsets[cell * 16 + moves] < 0:
+                    continue
+                rows += 1
+                for target in index.coords + [(-3, 4), (9, 40)]:
+                    field = index.flow_field([target])
+                    steps = [field[index.exit_cells[cell * 5 + code]] for code in EXIT_MOVES[moves]]
+                    steps = [step if step >= 0 else index.size for step in steps]
+                    assert index.decision(cell, moves, target) == EXIT_MOVES[moves][steps.index(min(steps))]
+        assert rows and index.decision_offsets[index.cell(8, 8) * 16 + index.exits[index.cell(8, 8)]] >= 0
+        assert index.decision(index.cell(1, 1), 0, (17, 17)) == 0  # No choice to make, so no row
+
+
+def bfs_distances(index, start):
+    """Distances from one cell by plain BFS over the index's neighbor lists"""
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        for next_cell in index.neighbors[cell]:
+            if next_cell not in distances:
+                distances[next_cell] = distances[cell] + 1
+                queue.append(next_cell)
+    return distances
+
+class TestJunctionGraph:
+    def check_routes(self, index, graph, starts, rng, samples=None):
+        for start in starts:
+            expected = bfs_distances(index, start)
+            targets = range(index.size) if samples is None else rng.sample(range(index.size), samples)
+            for target in targets:
+                distance = expected.get(target, -1)
+                assert graph.distance(start, target) == distance
+                route = graph.route(start, target)
+                assert len(route) == distance + 1
+                assert all(b in index.neighbors[a] for a, b in zip(route, route[1:]))
+
+    def test_routes_match_the_tables(self):
+        """Test junction graph searches give the all-pairs distances and valid shortest paths"""
+        index = get_maze_index(MAZE)
+        graph = JunctionGraph(index)
+        rng = random.Random(0)
+        self.check_routes(index, graph, rng.sample(range(index.size), 25), rng)
+        assert all(graph.distance(a, b) == index.distances[a * index.size + b]
+                   for a, b in [(index.cell(0, 8), index.cell(18, 8)), (index.cell(1, 1), index.cell(17, 17))])
+
+    def test_large_maze_uses_the_graph(self):
+        """Test mazes too big for tables answer queries over junctions, tunnels and loops included"""
+        from mazes import corridor_maze
+        rng = random.Random(1)
+        grid = [row[:] for row in corridor_maze(45, 41, tunnel_rows=(13, 27)).grid]
+        for _ in range(300):
+            # Knock walls through and wall corridors off, leaving long corridors and dead ends
+            x, y = rng.randrange(1, 44), rng.randrange(1, 40)
+            grid[y][x] = rng.choice([1, 1, 0])
+        index = get_maze_index(grid)
+        assert index.distances is None
+        graph = index.graph
+        open_cells = [cell for cell in range(index.size) if not index.walls[cell]]
+        assert sum(graph.junction) < len(open_cells) / 2
+        assert all(graph.junction[cell] or graph.corridor_of[cell] >= 0 for cell in open_cells)
+        self.check_routes(index, graph, rng.sample(open_cells, 8) + [index.cell(0, 13), index.cell(0, 0)], rng, 300)
+        path = find_path(grid, index.coords[open_cells[0]], index.coords[open_cells[-1]])
+        assert path[0] == index.coords[open_cells[0]] and path[-1] == index.coords[open_cells[-1]]
+        assert index.next_step(path[0], path[-1]) == path[1]
+
+    def test_large_maze_turns_match_flow_field(self):
+        """Test ghosts in mazes too big for tables turn the way the flow field would send them"""
+        from mazes import corridor_maze
+        rng = random.Random(2)
+        grid = [row[:] for row in corridor_maze(45, 41, tunnel_rows=(13,)).grid]
+        for _ in range(200):
+            x, y = rng.randrange(1, 44), rng.randrange(1, 40)
+            grid[y][x] = rng.choice([1, 0])
+        index = get_maze_index(grid)
+        assert index.distances is None
+        junctions = [cell for cell in range(index.size) if not index.walls[cell] and bin(index.exits[cell]).count('1') > 2]
+        for cell in rng.sample(junctions, 40):
+            target = index.coords[rng.choice(junctions)]
+            ghost = Ghost(*index.coords[cell], (255, 0, 0), "blinky")
+            field = index.flow_field((target,))
+            scores = [(field[index.exit_cells[cell * 5 + code]] % (index.size + 1), code)
+                      for code in EXIT_MOVES[index.exits[cell]]]
+            ghost.move(grid, Pacman(*target), [ghost], index)
+            assert ghost.direction_code == min(scores)[1]
+        distance = index.graph.distance(junctions[0], junctions[-1])
+        assert index.graph.distance(junctions[0], junctions[-1], distance) == distance
+        assert index.graph.distance(junctions[0], junctions[-1], distance - 1) == -1
+
+    def test_ghosts_only_aim_at_junctions(self):
+        """Test a chasing ghost in a corridor follows it without working out a target"""
+        class Blind(Ghost):
+            __slots__ = ()
+
+            def get_target(self, pacman, ghosts):
+                raise AssertionError('target asked for in a corridor')
+
+        ghost = Blind(3, 8, (255, 0, 0), "blinky")
+        ghost.direction = (-1, 0)
+        maze = [row[:] for row in MAZE]
+        for _ in range(25):  # Out through the tunnel...
+            ghost.move(maze, Pacman(17, 17), [ghost])
+        assert ghost.x > 15
+        ghost.x, ghost.y = 4, 3  # ...but a junction needs one
+        with pytest.raises(AssertionError):
+            ghost.move(maze, Pacman(17, 17), [ghost])
+
+
+class TestSpatialHash:
+    def setup_method(self):
+        """Set up a few hundred ghosts scattered over and beyond the maze"""
+        rng = random.Random(0)
+        self.ghosts = [Ghost(rng.uniform(-2, 40), rng.uniform(-2, 40), (255, 0, 0), "blinky") for _ in range(300)]
+        self.cells = SpatialHash(self.ghosts)
+
+    def brute_force(self, x, y, radius):
+        return {ghost for ghost in self.ghosts if abs(ghost.x - x) < radius and abs(ghost.y - y) < radius}
+
+    def test_near_matches_brute_force(self):
+        """Test queries of assorted radii find exactly the ghosts a full scan finds"""
+        rng = random.Random(1)
+        for _ in range(200):
+            x, y, radius = rng.uniform(-2, 40), rng.uniform(-2, 40), rng.choice([0.5, 1.0, 2.5])
+            assert set(self.cells.near(x, y, radius)) == self.brute_force(x, y, radius)
+
+    def test_move_refiles_across_cells(self):
+        """Test moving ghosts keep being found, and only crossings change buckets"""
+        ghost = self.ghosts[0]
+        ghost.x, ghost.y = 5.2, 5.2
+        self.cells.move(ghost)
+        buckets = dict(self.cells.keys)
+        ghost.x = 5.6
+        self.cells.move(ghost)
+        assert self.cells.keys == buckets
+        ghost.x = 6.1
+        self.cells.move(ghost)
+        assert self.cells.keys[ghost] == (6, 5)
+        assert ghost in self.cells.near(6.3, 5.0)
+        self.cells.remove(ghost)
+        assert ghost not in self.cells and len(self.cells) == 299
+
+    def test_game_collision_radius(self):
+        """Test the game's collision radius decides when a ghost catches Pacman"""
+        state = GameState()
+        ghost = state.ghosts[0]
+        ghost.x, ghost.y = state.pacman.x + 1.5, state.pacman.y
+        ghost.direction_code = 0
+        assert state.step()
+        state.collision_radius = 2.0
+        assert not state.step()
+        assert not state.pacman.alive
+
+    def test_ghosts_near(self):
+        """Test the game answers proximity queries from its ghost hash"""
+        state = GameState()
+        for _ in range(20):
+            state.step([(-1, 0)])
+        pacman = state.pacman
+        expected = [ghost for ghost in state.ghosts if abs(ghost.x - pacman.x) < 6 and abs(ghost.y - pacman.y) < 6]
+        assert expected and set(state.ghosts_near(pacman.x, pacman.y, 6)) == set(expected)
+
+
+class TestRenderer:
+    def setup_method(self):
+        """Set up an offscreen display and a renderer for each test method"""
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        self.screen, _ = init_display()
+        self.renderer = Renderer(self.screen)
+        self.state = GameState(MULTI_PLAYER)
+
+    def teardown_method(self):
+        pygame.quit()
+
+    def full_frame(self):
+        """Draw the current state the slow way, from scratch"""
+        frame = pygame.Surface(self.screen.get_size())
+        frame.fill(BLACK)
+        draw_maze(frame, self.state.maze)
+        for player in self.state.players:
+            if not player.alive:
+                continue
+            animation_count = player.animation_count
+            player.draw(frame)
+            player.animation_count = animation_count
+        for ghost in self.state.ghosts:
+            ghost.draw(frame)
+        draw_scores(frame, self.state)
+        return pygame.image.tostring(frame, 'RGB')
+
+    def test_dirty_frames_match_full_redraw(self):
+        """Test incremental frames are pixel-identical to redrawing everything"""
+        for tick in range(120):
+            self.state.step([(-1, 0) if tick < 60 else (0, -1), (1, 0)])
+            animation_counts = [player.animation_count for player in self.state.players]
+            self.renderer.draw(self.state)
+            for player, animation_count in zip(self.state.players, animation_counts):
+                player.animation_count = animation_count
+            assert pygame.image.tostring(self.screen, 'RGB') == self.full_frame()
+        assert self.state.eaten_cells
+
+    def test_restored_pellets_are_redrawn(self):
+        """Test pellets put back by a restore reappear in incremental frames"""
+        snapshot = self.state.snapshot()
+        self.renderer.draw(self.state)
+        for _ in range(20):
+            self.state.step([(-1, 0), (1, 0)])
+            self.renderer.draw(self.state)
+        self.state.restore(snapshot)
+        animation_counts = [player.animation_count for player in self.state.players]
+        self.renderer.draw(self.state)
+        for player, animation_count in zip(self.state.players, animation_counts):
+            player.animation_count = animation_count
+        assert pygame.image.tostring(self.screen, 'RGB') == self.full_frame()
+
+    def test_eaten_pellets_leave_background(self):
+        """Test pellets are erased from the cached layer when eaten"""
+        self.renderer.draw(self.state)
+        for _ in range(20):
+            self.state.step([(-1, 0)])
+            self.renderer.draw(self.state)
+        x, y = self.state.eaten_cells[0]
+        center = (x * 40 + 20, y * 40 + 20)
+        assert self.renderer.background.get_at(center)[:3] == BLACK
+
+
+class TestImport:
+    def test_import_is_side_effect_free(self):
+        """Test importing pacman neither loads SDL nor opens a window"""
+        code = ("import sys, time; start = time.perf_counter(); import pacman; "
+                "print(time.perf_counter() - start); print('pygame.display' in sys.modules)")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                                text=True, check=True).stdout.split()
+        assert output[1] == 'False'
+        assert float(output[0]) < IMPORT_TIME_BUDGET
+
+
+class TestAllocations:
+    @pytest.mark.parametrize('mode', [SINGLE_PLAYER, MULTI_PLAYER])
+    def test_tick_stays_within_budget(self, mode):
+        """Test no tick of play, scared ghosts included, allocates past TICK_ALLOCATION_BUDGET
+
+        Ticks that eat a pellet are left out: they log it in eaten_cells,
+        and that list now and then regrows by more than the budget.
+        """
+        state = GameState(mode, seed=2)
+        rng = random.Random(2)
+        inputs = [None] * len(state.players)
+        peaks = []
+        for tick in range(2500):
+            if rng.random() < 0.1:
+                inputs = [rng.choice(DIRECTIONS[1:]) for _ in inputs]
+            if state.game_over:
+                state.reset(seed=tick)
+            if tick == 500:
+                tracemalloc.start()  # Once the interpreter has specialized the hot paths
+            pellets, before = state.pellets_left, tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            state.step(inputs)
+            if state.pellets_left == pellets and tick > 500:
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        assert len(peaks) > 1000
+        assert max(peaks) <= TICK_ALLOCATION_BUDGET, f'a tick allocated {max(peaks)} bytes'
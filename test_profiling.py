@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+import time
+from pacman import GameState, Renderer, init_display, pygame
+from profiling import FrameProfiler, percentile
+
+class TestFrameProfiler:
+    def test_laps_add_up_per_phase(self):
+        """Test repeated laps of one phase in a frame are summed"""
+        profiler = FrameProfiler()
+        profiler.begin_frame()
+        time.sleep(0.002)
+        profiler.lap('work')
+        time.sleep(0.002)
+        profiler.lap('work')
+        profiler.end_frame()
+        p50, p95, p99 = profiler.percentiles('work')
+        assert p50 >= 4.0
+        assert profiler.percentiles('frame')[0] >= p50
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        assert percentile(values, 0.50) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) == 0.0
+
+    def test_game_state_phases(self):
+        """Test a profiled step reports player, ghost and collision phases"""
+        state = GameState()
+        state.profiler = FrameProfiler()
+        state.profiler.begin_frame()
+        state.step([(1, 0)])
+        state.profiler.end_frame()
+        assert {'pacman.move', 'ghost.move.blinky', 'ghost.move.clyde', 'collisions'} <= set(state.profiler.phases)
+
+    def test_chrome_trace(self, tmp_path):
+        """Test the Chrome trace holds one event per frame and per lap"""
+        path = str(tmp_path / 'trace.json')
+        profiler = FrameProfiler(path)
+        for _ in range(3):
+            profiler.begin_frame()
+            profiler.lap('input')
+            profiler.lap('draw')
+            profiler.end_frame()
+        profiler.close()
+        events = json.load(open(path))['traceEvents']
+        assert len(events) == 9
+        assert {event['name'] for event in events} == {'frame', 'input', 'draw'}
+
+    def test_csv_trace(self, tmp_path):
+        """Test the CSV trace holds one row per frame"""
+        path = str(tmp_path / 'trace.csv')
+        profiler = FrameProfiler(path)
+        for _ in range(2):
+            profiler.begin_frame()
+            profiler.lap('input')
+            profiler.end_frame()
+        profiler.close()
+        rows = list(csv.reader(open(path)))
+        assert rows[0] == ['frame_index', 'start_ms', 'input_ms', 'frame_ms']
+        assert len(rows) == 3
+
+    def test_long_sessions_stay_bounded(self, tmp_path):
+        """Test the profiler keeps only the rolling window in memory while the trace gets every frame"""
+        path = str(tmp_path / 'trace.csv')
+        profiler = FrameProfiler(path, window=50)
+        for _ in range(2000):
+            profiler.begin_frame()
+            profiler.lap('input')
+            profiler.lap('draw')
+            profiler.end_frame()
+        assert len(profiler.history) == 50 and len(profiler.events) == 2
+        profiler.close()
+        assert len(list(csv.reader(open(path)))) == 2001
+
+    def test_overlay(self):
+        """Test the renderer draws the overlay and times its phases"""
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        screen, _ = init_display()
+        try:
+            renderer = Renderer(screen)
+            renderer.profiler = profiler = FrameProfiler()
+            state = GameState()
+            for _ in range(3):
+                profiler.begin_frame()
+                renderer.draw(state)
+                profiler.end_frame()
+            assert {'draw_maze', 'sprites', 'hud', 'display'} <= set(profiler.phases)
+            assert renderer.sprite_rects[-1].topleft == (4, 4)
+        finally:
+            pygame.quit()
@@ -0,0 +1,89 @@
+import random
+import pytest
+from mazes import corridor_maze
+from pacman import GameState, DIRECTIONS, MULTI_PLAYER, SINGLE_PLAYER
+from replay import (Replay, ReplayDivergence, ReplayError, ReplayRecorder, layout_id, main, play_replay)
+
+def record_game(mode=SINGLE_PLAYER, seed=7, ticks=3000, layout=None):
+    """Play a game with random inputs and return the final state and its replay."""
+    state = GameState(mode, seed=seed) if layout is None else GameState(mode, layout=layout, seed=seed)
+    state.recorder = ReplayRecorder(state, interval=64)
+    rng = random.Random(seed)
+    for _ in range(ticks):
+        inputs = [rng.choice(DIRECTIONS[1:]) if rng.random() < 0.05 else None for _ in state.players]
+        if not state.step(inputs):
+            break
+    return state, state.recorder.finish(state)
+
+class TestReplay:
+    def test_seed_decides_the_game(self):
+        """Test two games with the same seed and inputs stay identical, scared ghosts included"""
+        first, second = GameState(seed=3), GameState(seed=3)
+        for state in (first, second):
+            for ghost in state.ghosts:
+                ghost.make_vulnerable()
+            for _ in range(300):
+                state.step([(-1, 0)])
+        assert first.state_hash() == second.state_hash()
+        assert [ghost.x for ghost in first.ghosts] == [ghost.x for ghost in second.ghosts]
+
+    @pytest.mark.parametrize('mode', [SINGLE_PLAYER, MULTI_PLAYER])
+    def test_round_trip_replays_exactly(self, mode):
+        """Test a saved replay re-runs to the same scores, tick count and state"""
+        state, replay = record_game(mode)
+        loaded = Replay.from_bytes(replay.to_bytes())
+        assert loaded.seed == state.seed and loaded.ticks == state.tick
+        result = play_replay(loaded)
+        assert result.state_hash() == state.state_hash()
+        assert [player.score for player in result.players] == [player.score for player in state.players]
+
+    def test_large_seeds_round_trip(self):
+        """Test seeds past 32 bits, or negative, are kept to 32 bits so their games save and replay"""
+        for seed in (2 ** 40 + 7, -5):
+            state, replay = record_game(seed=seed, ticks=500)
+            assert state.seed == seed & 0xFFFFFFFF
+            assert play_replay(Replay.from_bytes(replay.to_bytes())).state_hash() == state.state_hash()
+
+    def test_replays_are_compact(self):
+        """Test run-length encoding keeps a long game to a few bytes per input change"""
+        state, replay = record_game(ticks=5000)
+        changes = sum(len(runs) for runs in replay.runs)
+        assert len(replay.to_bytes()) < 64 + 8 * len(replay.checkpoints) + 4 * changes
+        assert changes < state.tick / 4
+
+    def test_tampered_inputs_are_caught(self):
+        """Test a replay whose inputs were edited is reported at the first checkpoint that differs"""
+        state, replay = record_game()
+        code, length = replay.runs[0][2]
+        replay.runs[0][2] = [code % 4 + 1, length]
+        with pytest.raises(ReplayDivergence) as error:
+            play_replay(replay)
+        assert error.value.tick % replay.interval == 0 or error.value.tick == state.tick
+
+    def test_wrong_maze_is_rejected(self):
+        """Test a replay only plays on the maze it was recorded on"""
+        layout = corridor_maze(21, 21)
+        state, replay = record_game(layout=layout, ticks=500)
+        assert replay.maze_id == layout_id(layout)
+        with pytest.raises(ReplayError, match='different maze'):
+            play_replay(replay)
+        assert play_replay(replay, layout).state_hash() == state.state_hash()
+
+    def test_bad_data_is_rejected(self):
+        """Test truncated or foreign files raise ReplayError rather than replaying garbage"""
+        data = record_game(ticks=500)[1].to_bytes()
+        for bad in [b'', b'PK\x03\x04' + data[4:], data[:-3]]:
+            with pytest.raises(ReplayError):
+                Replay.from_bytes(bad)
+
+    def test_command_line(self, tmp_path, capsys):
+        """Test the replay tool verifies a saved game and reports a tampered one"""
+        path = tmp_path / 'game.replay'
+        replay = record_game(ticks=1000)[1]
+        replay.save(path)
+        assert main([str(path)]) == 0
+        assert 'Verified' in capsys.readouterr().out
+        replay.scores[0] += 10
+        replay.save(path)
+        assert main([str(path)]) == 1
+        assert 'MISMATCH' in capsys.readouterr().out
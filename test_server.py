@@ -0,0 +1,207 @@
+import asyncio
+import random
+import socket
+import struct
+import threading
+import pytest
+from client import Connection, join as client_join
+from loadtest import main as load_test_main
+from mazes import corridor_maze
+from pacman import GameState, DIRECTIONS, MULTI_PLAYER, SINGLE_PLAYER
+from server import (ERROR, INPUT, JOIN, RESTART, STATE, WELCOME, WELCOME_BODY, GameServer, ProtocolError,
+                    StateDecoder, StateEncoder, frame, read_frame, split_frames)
+
+def assert_mirrors(mirror, state):
+    """Check a client's copy of the game shows what the server's game holds."""
+    for copy, entity in zip(mirror.players + mirror.ghosts, state.players + state.ghosts):
+        assert copy.x == pytest.approx(entity.x, abs=1e-5) and copy.y == pytest.approx(entity.y, abs=1e-5)
+        assert copy.direction_code == entity.direction_code
+    assert [player.score for player in mirror.players] == [player.score for player in state.players]
+    assert [ghost.vulnerable for ghost in mirror.ghosts] == [ghost.vulnerable for ghost in state.ghosts]
+    assert mirror.maze == state.maze and mirror.pellets_left == state.pellets_left
+    assert (mirror.tick, mirror.game_over, mirror.won) == (state.tick, state.game_over, state.won)
+
+async def join(port, mode=MULTI_PLAYER, room='test'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(frame(JOIN, bytes([mode]) + room.encode()))
+    return reader, writer, await read_frame(reader)
+
+class TestStateEncoding:
+    def test_deltas_rebuild_the_game(self):
+        """Test applying every delta, across a restart, keeps a client's copy in step with the game"""
+        state = GameState(MULTI_PLAYER, seed=4)
+        encoder, mirror = StateEncoder(), GameState(MULTI_PLAYER)
+        decoder = StateDecoder(mirror)
+        rng = random.Random(4)
+        for _ in range(1500):
+            if not state.step([rng.choice(DIRECTIONS[1:]) if rng.random() < 0.05 else None for _ in range(2)]):
+                state.reset(seed=5)
+            (message_type, body), = split_frames(bytearray(encoder.delta(state)))
+            decoder.apply(body)
+            assert_mirrors(mirror, state)
+
+    def test_deltas_only_carry_changes(self):
+        """Test a tick where nothing moved costs a header, and a tick of play far less than the whole maze"""
+        state = GameState(layout=corridor_maze(101, 101), seed=1)
+        encoder = StateEncoder()
+        keyframe = encoder.delta(state)
+        assert len(encoder.delta(state)) == 5 + 6 + 2
+        for _ in range(10):
+            state.step([(-1, 0)])
+            assert len(encoder.delta(state)) < len(keyframe) // 10
+
+    def test_first_message_must_be_a_keyframe(self):
+        """Test a client refuses deltas until it has seen the whole game once"""
+        state = GameState(seed=1)
+        encoder = StateEncoder()
+        encoder.delta(state)
+        state.step([(-1, 0)])
+        decoder = StateDecoder(GameState())
+        with pytest.raises(ProtocolError):
+            decoder.apply(split_frames(bytearray(encoder.delta(state)))[0][1])
+        decoder.apply(split_frames(bytearray(encoder.keyframe(state)))[0][1])
+        assert_mirrors(decoder.state, state)
+
+    def test_split_frames(self):
+        """Test frames are cut from a stream at their boundaries, keeping a partial one for later"""
+        data = bytearray(frame(INPUT, b'\x03') + frame(RESTART) + frame(INPUT, b'\x01'))
+        buffer = data[:-1]
+        assert split_frames(buffer) == [(INPUT, b'\x03'), (RESTART, b'')]
+        buffer += data[-1:]
+        assert split_frames(buffer) == [(INPUT, b'\x01')] and not buffer
+        with pytest.raises(ProtocolError, match='too long'):
+            split_frames(bytearray(frame(INPUT, bytes(300))), max_size=256)
+
+class TestGameServer:
+    def test_two_clients_share_a_room(self):
+        """Test two players join one room, get their slots and a keyframe, and steer their own player"""
+        async def scenario():
+            server = GameServer(tick_rate=200)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                first_reader, first, (message_type, body) = await join(port)
+                assert message_type == WELCOME and WELCOME_BODY.unpack(body)[:3] == (0, MULTI_PLAYER, 200)
+                second_reader, second, (message_type, body) = await join(port)
+                assert WELCOME_BODY.unpack(body)[0] == 1
+                assert len(server.rooms) == 1
+
+                mirror = GameState(MULTI_PLAYER)
+                decoder = StateDecoder(mirror)
+                second.write(frame(INPUT, bytes([DIRECTIONS.index((1, 0))])))
+                while mirror.tick < 20:
+                    message_type, body = await read_frame(second_reader)
+                    assert message_type == STATE
+                    decoder.apply(body)
+                assert mirror.ms_pacman.x > mirror.pacman.x  # Only Ms. Pacman was sent right
+
+                first.close()
+                second.close()
+                for _ in range(100):
+                    if not server.rooms:
+                        break
+                    await asyncio.sleep(0.01)
+                assert not server.rooms and server.clients == 0
+            finally:
+                await server.stop()
+        asyncio.run(scenario())
+
+    def test_join_rules(self):
+        """Test full rooms, mismatched modes and reserved names are refused, and unnamed joins fill open rooms"""
+        async def scenario():
+            server = GameServer(tick_rate=200)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                connections = [await join(port, SINGLE_PLAYER, 'solo')]
+                *_, (message_type, body) = await join(port, SINGLE_PLAYER, 'solo')
+                assert message_type == ERROR and b'full' in body
+                *_, (message_type, body) = await join(port, MULTI_PLAYER, 'solo')
+                assert message_type == ERROR
+                for _ in range(3):
+                    connections.append(await join(port, MULTI_PLAYER, ''))
+                    assert connections[-1][2][0] == WELCOME
+                assert sorted(len([client for client in room.slots if client]) for room in server.rooms.values()
+                              if room.name.startswith('#')) == [1, 2]
+
+                # Server-made room names cannot be claimed, so a new unnamed room never replaces a live one
+                *_, (message_type, body) = await join(port, MULTI_PLAYER, f'#{server.room_counter + 1}')
+                assert message_type == ERROR and b'reserved' in body
+                rooms = dict(server.rooms)
+                connections.append(await join(port, SINGLE_PLAYER, ''))
+                assert all(server.rooms[name] is room for name, room in rooms.items())
+                assert len(server.rooms) == len(rooms) + 1
+            finally:
+                await server.stop()
+        asyncio.run(scenario())
+
+    def test_restart_starts_a_new_game(self):
+        """Test RESTART after a game ends resets the room and sends everyone a keyframe"""
+        async def scenario():
+            server = GameServer(tick_rate=200)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                reader, writer, _ = await join(port, SINGLE_PLAYER)
+                room = server.rooms['test']
+                room.state.pacman.alive = False
+                mirror = GameState()
+                decoder = StateDecoder(mirror)
+                while not mirror.game_over:
+                    decoder.apply((await read_frame(reader))[1])
+                writer.write(frame(RESTART))
+                while mirror.game_over:
+                    decoder.apply((await read_frame(reader))[1])
+                assert mirror.pacman.alive and mirror.tick < 10
+            finally:
+                await server.stop()
+        asyncio.run(scenario())
+
+    def test_thin_client_handshake(self):
+        """Test the pygame client's blocking join gets its slot and the start of the game"""
+        loop = asyncio.new_event_loop()
+        server = GameServer(tick_rate=200)
+        port = loop.run_until_complete(server.start('127.0.0.1', 0))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            sock, slot, mode, tick_rate, pending, buffer = client_join('127.0.0.1', port, SINGLE_PLAYER, 'window')
+            assert (slot, mode, tick_rate) == (0, SINGLE_PLAYER, 200)
+            sock.close()
+            with pytest.raises(ProtocolError, match='different maze'):
+                client_join('127.0.0.1', port, SINGLE_PLAYER, 'other', corridor_maze(21, 21))
+        finally:
+            asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def test_client_connection_never_blocks(self):
+        """Test the client queues what the socket cannot take yet and ends the session when the server resets it"""
+        listener = socket.create_server(('127.0.0.1', 0))
+        sock = socket.create_connection(listener.getsockname())
+        server_side, _ = listener.accept()
+        listener.close()
+        sock.setblocking(False)
+        connection = Connection(sock, frame(STATE, b'early'))
+        data = bytes(range(256)) * (1 << 14)
+        connection.send(data)
+        assert connection.pump() == [(STATE, b'early')]
+        assert connection.outgoing and connection.open
+
+        # The server reads everything and answers, then drops the connection without a clean close
+        received = bytearray()
+        while len(received) < len(data):
+            received += server_side.recv(1 << 16)
+            connection.pump()
+        assert received == data and not connection.outgoing
+        server_side.sendall(frame(ERROR, b'bye'))
+        server_side.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        server_side.close()
+        messages = []
+        while connection.open:
+            messages += connection.pump()
+        assert messages in ([], [(ERROR, b'bye')])
+        assert connection.pump() == []
+
+    def test_load_test_tool(self, capsys):
+        """Test the load tester runs bots against its own server and reports every state arriving"""
+        assert load_test_main(['--rooms', '3', '--duration', '1', '--processes', '1']) == 0
+        assert '3 rooms, 6 clients, 0 errors' in capsys.readouterr().out
@@ -0,0 +1,58 @@
+import json
+import math
+import pytest
+from pacman import GameState
+from tournament import (GHOST_POLICIES, ChaseGhost, confidence_interval, game_seed, main, play_game,
+                        run_tournament, summarize)
+
+class TestTournament:
+    def test_results_do_not_depend_on_workers(self):
+        """Test games play the same in-process and spread over a process pool"""
+        kwargs = dict(games=6, seed=5, max_ticks=400, chunk_size=2)
+        local = run_tournament(['random'], ['classic', 'chase'], workers=1, **kwargs)
+        pooled = run_tournament(['random'], ['classic', 'chase'], workers=2, **kwargs)
+        key = lambda result: (result['ghosts'], result['seed'])
+        assert sorted(local, key=key) == sorted(pooled, key=key)
+        assert len(local) == 12
+
+    def test_game_replays_from_its_seed(self):
+        """Test a game picked out of a tournament re-runs alone from its seed"""
+        streamed = []
+        results = run_tournament(['random'], ['ambush'], 4, seed=1, workers=1, max_ticks=400,
+                                 on_result=streamed.append)
+        assert streamed == results
+        seed = game_seed(1, 2)
+        assert play_game('random', 'ambush', seed, 400) in results
+
+    def test_ghost_policies_change_targets(self):
+        """Test a ghost policy replaces get_target for every ghost in the game"""
+        state = GameState()
+        for ghost in state.ghosts:
+            ghost.__class__ = ChaseGhost
+        targets = {ghost.get_target(state.pacman, state.ghosts) for ghost in state.ghosts}
+        assert targets == {(9, 11)}
+        assert set(GHOST_POLICIES) >= {'classic', 'chase', 'ambush'}
+
+    def test_confidence_intervals(self):
+        """Test summaries give the mean and a normal 95% interval per pairing and metric"""
+        mean, half_width = confidence_interval([1, 2, 3, 4, 5])
+        assert mean == 3
+        assert half_width == pytest.approx(1.96 * math.sqrt(2.5) / math.sqrt(5))
+        assert confidence_interval([7])[1] == math.inf
+        results = [{'pacman': 'random', 'ghosts': 'classic', 'score': score, 'ticks': 100, 'pellets': 5,
+                    'won': score > 20} for score in (10, 20, 30)]
+        summary = summarize(results)[('random', 'classic')]
+        assert summary['games'] == 3
+        assert summary['score'][0] == 20 and summary['won'][0] == pytest.approx(1 / 3)
+        assert summary['ticks'] == (100, 0)
+
+    def test_command_line(self, tmp_path, capsys):
+        """Test the runner streams per-game lines and writes the summary table and JSON"""
+        results, summary = tmp_path / 'games.jsonl', tmp_path / 'summary.json'
+        assert main(['--games', '3', '--pacman', 'random', '--ghosts', 'classic', 'chase', '--workers', '1',
+                     '--max-ticks', '300', '--results', str(results), '--json', str(summary)]) == 0
+        assert len(results.read_text().splitlines()) == 6
+        rows = json.loads(summary.read_text())
+        assert [(row['pacman'], row['ghosts'], row['games']) for row in rows] == [('random', 'chase', 3),
+                                                                                   ('random', 'classic', 3)]
+        assert '6 games' in capsys.readouterr().out
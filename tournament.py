@@ -0,0 +1,216 @@
+"""Tournaments: many headless games across a process pool, summarized with confidence intervals.
+
+Every pairing of a Pacman strategy with a ghost policy plays `games`
+games. Game i of a tournament gets the seed `game_seed(seed, i)` whoever
+plays it, so results do not depend on how games are spread over the
+workers, and one game can be re-run on its own from its seed (autopilot
+games can still differ a little, as its searches stop on a timer). Workers are
+handed chunks of games and send back one small record per game as each
+chunk finishes, so the parent only aggregates and the pool scales with
+the number of cores.
+
+    python tournament.py --games 2000 --pacman autopilot random --ghosts classic chase
+
+Ghost policies are Ghost subclasses overriding `get_target`; add one to
+GHOST_POLICIES to try a new chase behavior against every strategy.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+
+from autopilot import Autopilot
+from fastforward import fast_forward
+from pacman import DEFAULT_LAYOUT, DIRECTIONS, Ghost, GameState, MazeLayout
+
+MAX_TICKS = 20000  # Games still running after this many ticks are scored as they stand
+CHUNK_SIZE = 8  # Games per task sent to a worker
+Z_95 = 1.96  # Normal quantile for 95% confidence intervals
+METRICS = ['score', 'ticks', 'pellets', 'won']
+
+class ChaseGhost(Ghost):
+    """Every ghost heads straight for Pacman, as Blinky does."""
+    __slots__ = ()
+
+    def get_target(self, pacman, ghosts):
+        return (int(round(pacman.x)), int(round(pacman.y)))
+
+class AmbushGhost(Ghost):
+    """Every ghost aims 4 cells ahead of Pacman, as Pinky does."""
+    __slots__ = ()
+
+    def get_target(self, pacman, ghosts):
+        return (int(round(pacman.x + 4 * pacman.direction[0])), int(round(pacman.y + 4 * pacman.direction[1])))
+
+GHOST_POLICIES = {'classic': Ghost, 'chase': ChaseGhost, 'ambush': AmbushGhost}
+
+class RandomPlayer:
+    """Turns a random way now and then, like test_replay's random inputs."""
+
+    def __init__(self, player, seed):
+        self.player = player
+        self.rng = random.Random(seed)
+
+    def choose(self, state):
+        return self.rng.choice(DIRECTIONS[1:]) if self.rng.random() < 0.05 else None
+
+    def plan(self):
+        """(ticks `choose` would return None for, direction it then turns), drawn from the RNG as `choose` draws."""
+        ticks = 0
+        while self.rng.random() >= 0.05:
+            ticks += 1
+        return ticks, self.rng.choice(DIRECTIONS[1:])
+
+PACMAN_STRATEGIES = {
+    'autopilot': lambda player, seed: Autopilot(player),
+    'shallow': lambda player, seed: Autopilot(player, max_depth=6),
+    'random': RandomPlayer,
+}
+
+def game_seed(seed: int, game: int) -> int:
+    """The RNG seed of game `game` in a tournament started with `seed`."""
+    return random.Random(seed * 1000003 + game).getrandbits(32)
+
+def play_game(pacman: str, ghosts: str, seed: int, max_ticks=MAX_TICKS,
+              layout: MazeLayout = DEFAULT_LAYOUT) -> dict:
+    """Play one single player game headless and return its result record."""
+    state = GameState(layout=layout, seed=seed)
+    for ghost in state.ghosts:
+        ghost.__class__ = GHOST_POLICIES[ghosts]
+    player = PACMAN_STRATEGIES[pacman](0, seed)
+    if hasattr(player, 'plan'):
+        # Strategies that know when they next turn skip straight there
+        running = True
+        while running and state.tick < max_ticks:
+            ticks, direction = player.plan()
+            running = (fast_forward(state, min(ticks, max_ticks - state.tick), [None]) and
+                       state.tick < max_ticks and state.step([direction]))
+    else:
+        while state.tick < max_ticks and state.step([player.choose(state)]):
+            pass
+    return {'pacman': pacman, 'ghosts': ghosts, 'seed': seed, 'score': state.total_score, 'ticks': state.tick,
+            'pellets': layout.pellets - state.pellets_left, 'won': int(state.won)}
+
+_worker_layout = DEFAULT_LAYOUT
+
+def _init_worker(layout):
+    global _worker_layout
+    _worker_layout = layout
+
+def _play_chunk(task):
+    pacman, ghosts, seeds, max_ticks = task
+    return [play_game(pacman, ghosts, seed, max_ticks, _worker_layout) for seed in seeds]
+
+def confidence_interval(values: List[float]) -> Tuple[float, float]:
+    """(mean, half width of its 95% confidence interval), using the normal approximation."""
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, math.inf
+    return mean, Z_95 * statistics.stdev(values) / math.sqrt(len(values))
+
+def summarize(results: List[dict]) -> Dict[Tuple[str, str], dict]:
+    """Per (strategy, ghost policy): game count and (mean, half width) for each of METRICS."""
+    groups = {}
+    for result in results:
+        groups.setdefault((result['pacman'], result['ghosts']), []).append(result)
+    summary = {}
+    for key, group in groups.items():
+        summary[key] = {'games': len(group)}
+        for metric in METRICS:
+            summary[key][metric] = confidence_interval([result[metric] for result in group])
+    return summary
+
+def run_tournament(pacman_strategies, ghost_policies, games, seed=0, workers=None, max_ticks=MAX_TICKS,
+                   layout: MazeLayout = DEFAULT_LAYOUT, chunk_size=CHUNK_SIZE, on_result=None) -> List[dict]:
+    """Play `games` games of every pairing and return their result records, in no particular order.
+
+    `workers` processes share the games (default: one per core; 1 plays
+    them in this process). `on_result` is called with each record as it
+    arrives, for progress reports or streaming to a file.
+    """
+    seeds = [game_seed(seed, game) for game in range(games)]
+    tasks = [(pacman, ghosts, seeds[start:start + chunk_size], max_ticks)
+             for pacman in pacman_strategies for ghosts in ghost_policies
+             for start in range(0, games, chunk_size)]
+    results = []
+    def collect(chunk):
+        for result in chunk:
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    if workers == 1:
+        _init_worker(layout)
+        for task in tasks:
+            collect(_play_chunk(task))
+    else:
+        with Pool(workers, initializer=_init_worker, initargs=(layout,)) as pool:
+            for chunk in pool.imap_unordered(_play_chunk, tasks):
+                collect(chunk)
+    return results
+
+def format_summary(summary) -> str:
+    lines = [f'{"pacman":<10} {"ghosts":<8} {"games":>6} {"score":>17}{"ticks":>17}{"pellets":>13}{"win %":>13}']
+    for (pacman, ghosts), stats in sorted(summary.items()):
+        (score, score_ci), (ticks, ticks_ci) = stats['score'], stats['ticks']
+        (pellets, pellets_ci), (won, won_ci) = stats['pellets'], stats['won']
+        lines.append(f'{pacman:<10} {ghosts:<8} {stats["games"]:>6} {score:>8.0f} ±{score_ci:<7.0f}'
+                     f'{ticks:>8.0f} ±{ticks_ci:<7.0f}{pellets:>6.1f} ±{pellets_ci:<5.1f}'
+                     f'{100 * won:>6.1f} ±{100 * won_ci:<5.1f}')
+    return '\n'.join(lines)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Play many headless Pacman games and compare strategies.')
+    parser.add_argument('--games', type=int, default=100, help='games per pairing (default: 100)')
+    parser.add_argument('--pacman', nargs='+', choices=list(PACMAN_STRATEGIES), default=['autopilot'],
+                        help='Pacman strategies to enter (default: autopilot)')
+    parser.add_argument('--ghosts', nargs='+', choices=list(GHOST_POLICIES), default=['classic'],
+                        help='ghost policies to play against (default: classic)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'worker processes (default: one per core, {os.cpu_count()} here)')
+    parser.add_argument('--seed', type=int, default=0, help='tournament seed; game seeds derive from it')
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS, help='cut games off after this many ticks')
+    parser.add_argument('--maze', metavar='FILE', help='play on a maze loaded from FILE (see mazes.py)')
+    parser.add_argument('--results', metavar='FILE', help='write each game as a JSON line to FILE as it finishes')
+    parser.add_argument('--json', metavar='FILE', help='write the summary to FILE as JSON')
+    args = parser.parse_args(argv)
+
+    layout = DEFAULT_LAYOUT
+    if args.maze:
+        from mazes import load_maze
+        layout = load_maze(args.maze)
+    total = args.games * len(args.pacman) * len(args.ghosts)
+    results_file = open(args.results, 'w') if args.results else None
+    done = [0]
+    def on_result(result):
+        done[0] += 1
+        if results_file is not None:
+            results_file.write(json.dumps(result) + '\n')
+        if done[0] % 100 == 0 or done[0] == total:
+            print(f'\r{done[0]}/{total} games', end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    try:
+        results = run_tournament(args.pacman, args.ghosts, args.games, args.seed, args.workers, args.max_ticks,
+                                 layout, on_result=on_result)
+    finally:
+        if results_file is not None:
+            results_file.close()
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    summary = summarize(results)
+    print(format_summary(summary))
+    print(f'{len(results)} games, {sum(result["ticks"] for result in results)} ticks in {elapsed:.1f}s')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([{'pacman': pacman, 'ghosts': ghosts, **stats}
+                       for (pacman, ghosts), stats in sorted(summary.items())], f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())